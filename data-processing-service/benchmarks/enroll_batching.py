@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Проверка объединения зачислений на заменителе Moodle
+
+Заменитель Moodle (fake_services.py) запускается в этом же процессе и отвечает на
+enrol_manual_enrol_users так же, как настоящий Moodle (--enrol-response). Одни и те же
+--enrolments зачислений, приходящие с разбросом --spread мс, отправляются сначала по одному,
+затем через EnrollmentBatcher (--batch-size, --batch-window). Скрипт выводит число вызовов
+enrol_manual_enrol_users и повторов по одному и завершается с кодом 1, если объединение
+не сократило число вызовов или результат какого-то зачисления отличается от одиночного вызова.
+
+Примеры:
+    python benchmarks/enroll_batching.py
+    python benchmarks/enroll_batching.py --enrolments 200 --batch-size 20 --enrol-response null
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+from aiohttp import ClientSession, web
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import add_fake_arguments, create_moodle_app  # noqa: E402
+
+
+async def enrol_calls(url: str) -> int:
+    async with ClientSession() as session:
+        async with session.get(f"{url}/stats") as r:
+            return (await r.json()).get("enrol_manual_enrol_users", 0)
+
+
+async def run_mode(url: str, enroll, enrolments: int, spread: float) -> Dict[str, Any]:
+    """Зачисления с разбросом прихода; возвращает число вызовов Moodle и успех каждого зачисления"""
+    from moodle_api import enrollment_succeeded
+
+    async def one(user_id: int) -> bool:
+        await asyncio.sleep(random.uniform(0, spread / 1000))
+        return enrollment_succeeded(await enroll(user_id, 2))
+
+    before = await enrol_calls(url)
+    succeeded: List[bool] = await asyncio.gather(*(one(user_id) for user_id in range(1, enrolments + 1)))
+    return {"calls": await enrol_calls(url) - before, "succeeded": succeeded}
+
+
+async def run(args: argparse.Namespace) -> bool:
+    url = f"http://127.0.0.1:{args.moodle_port}"
+    os.environ.update({
+        "MOODLE_URL": url,
+        "MOODLE_TOKEN": "bench",
+        "AI_API_URL": f"http://127.0.0.1:{args.gigachat_port}/api/v1/chat/completions",
+        "GIGACHAT_OAUTH_URL": f"http://127.0.0.1:{args.gigachat_port}/api/v2/oauth",
+        "GIGACHAT_AUTHORIZATION_TOKEN": "bench",
+    })
+    from enroll_batcher import EnrollmentBatcher
+    from http_client import close_http_client
+    from moodle_api import _enrol_users
+
+    runner = web.AppRunner(create_moodle_app(args))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.moodle_port).start()
+    try:
+        single = await run_mode(url, lambda user_id, course_id: _enrol_users([(user_id, course_id)]),
+                                args.enrolments, args.spread)
+        batcher = EnrollmentBatcher(_enrol_users, args.batch_size, args.batch_window / 1000)
+        batched = await run_mode(url, batcher.enroll, args.enrolments, args.spread)
+        await batcher.close()
+    finally:
+        await close_http_client()
+        await runner.cleanup()
+
+    stats = batcher.stats()
+    print(f"ответ Moodle: {args.enrol_response}, зачислений: {args.enrolments}")
+    print(f"  по одному:  вызовов {single['calls']}, успешных {sum(single['succeeded'])}")
+    print(f"  пакетами:   вызовов {batched['calls']}, успешных {sum(batched['succeeded'])}, "
+          f"средний пакет {stats['avg_batch_size']}, повторов по одному {stats['fallback_items']}")
+
+    ok = True
+    if batched["calls"] >= single["calls"]:
+        print("ошибка: объединение не сократило число вызовов")
+        ok = False
+    if batched["succeeded"] != single["succeeded"]:
+        print("ошибка: результат зачислений пакетами отличается от одиночных вызовов")
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--enrolments", type=int, default=44, help="число зачислений")
+    parser.add_argument("--spread", type=float, default=200.0, help="разброс прихода зачислений (мс)")
+    parser.add_argument("--batch-size", type=int, default=10, help="ENROLL_BATCH_SIZE")
+    parser.add_argument("--batch-window", type=float, default=200.0, help="ENROLL_BATCH_WINDOW (мс)")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
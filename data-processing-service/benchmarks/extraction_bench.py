@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки этапов разбора review (review_parser) по типам вопросов и размеру попытки
+
+Корпус: попытки из одного типа вопросов (multichoice, truefalse, shortanswer) на
+--sizes вопросов, сгенерированные review_fixtures.make_review с фиксированным seed
+(разметка Moodle 4.x, одинаковая между запусками), и сохранённые ответы Moodle из
+benchmarks/fixtures/ (группа recorded). Moodle не нужен.
+
+Для каждого этапа — разбор HTML, текст вопроса, варианты, extract_choice_label,
+правильный ответ, ответ студента, регулярное выражение «Сохранено:», to_float_score,
+parse_question целиком (без кэша структуры и с прогретым кэшем) — выводится время
+на вопрос в микросекундах (лучший из --rounds раундов не короче --min-time).
+
+Отслеживание регрессий между релизами: результат сохраняется флагом --save-baseline,
+следующий запуск с --baseline сравнивает этапы и завершается с кодом 1, если какой-то
+этап стал медленнее более чем на --threshold (и больше чем на --min-delta мкс).
+
+Примеры:
+    python benchmarks/extraction_bench.py
+    python benchmarks/extraction_bench.py --sizes 10 200 --backends lxml --rounds 9
+    python benchmarks/extraction_bench.py --save-baseline extraction-1.4.json
+    python benchmarks/extraction_bench.py --baseline extraction-1.4.json --threshold 0.2
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from review_fixtures import QUESTION_TYPES, all_questions, load_fixtures, make_review  # noqa: E402
+from review_parser import (  # noqa: E402
+    QuizStructureCache,
+    extract_choice_label,
+    extract_choices,
+    extract_correct_answer,
+    extract_score,
+    extract_student_answer,
+    get_engine,
+    parse_question,
+    split_question_html,
+    to_float_score,
+)
+
+SAVED_RE = re.compile(r'Сохранено:\s*([^<\n\r]+)')
+
+# Этапы, не зависящие от движка, относятся к группе движков "-"
+COMMON_STEPS = ("split_question_html", "saved_regex", "to_float_score", "extract_score")
+ENGINE_STEPS = ("parse", "question_text", "extract_choices", "extract_choice_label", "extract_correct_answer",
+                "extract_student_answer", "parse_question", "parse_question_cached")
+
+
+def build_corpus(sizes: List[int]) -> Dict[str, List[Dict[str, Any]]]:
+    """Группы вопросов: "<тип>/<размер>" и "recorded/<число вопросов>" """
+    corpus = {}
+    for kind in QUESTION_TYPES:
+        for size in sizes:
+            corpus[f"{kind}/{size}"] = make_review(1, size, kinds=(kind,), seed=size)["questions"]
+    recorded = all_questions(load_fixtures())
+    corpus[f"recorded/{len(recorded)}"] = recorded
+    return corpus
+
+
+def time_step(func: Callable[[], Any], questions: int, rounds: int, min_time: float) -> float:
+    """
+    Время прохода по группе, мкс на вопрос: проход повторяется, пока раунд не займёт min_time
+    секунд, берётся лучший из rounds раундов (сборщик мусора отключён, как в timeit)
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time:
+            break
+        loops *= 2
+    best = float("inf")
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            best = min(best, (time.perf_counter() - start) / loops)
+    finally:
+        gc.enable()
+    return best * 1e6 / questions
+
+
+def engine_steps(engine, questions: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    """Замыкания этапов; входные данные каждого этапа подготовлены заранее"""
+    htmls = [q.get("html", "") for q in questions]
+    docs = [engine.parse(html) for html in htmls]
+    corrects = [extract_correct_answer(engine, doc) for doc in docs]
+    if engine.name == "lxml":
+        choice_label = engine.choice_label
+        labels = [el for doc in docs for el in doc.iterdescendants()
+                  if isinstance(el.tag, str) and el.get("data-region") == "answer-label"]
+    else:
+        choice_label = extract_choice_label
+        labels = [el for doc in docs for el in doc.select('.answer [data-region="answer-label"]')]
+    warm_cache = QuizStructureCache(100000, 3600)
+    for q in questions:
+        parse_question(q, 2, warm_cache, engine)
+    items = list(zip(questions, docs, htmls, corrects))
+
+    return {
+        "parse": lambda: [engine.parse(html) for html in htmls],
+        "question_text": lambda: [engine.question_text(doc) for doc in docs],
+        "extract_choices": lambda: [extract_choices(engine, doc) for doc in docs],
+        "extract_choice_label": lambda: [choice_label(el) for el in labels],
+        "extract_correct_answer": lambda: [extract_correct_answer(engine, doc) for doc in docs],
+        "extract_student_answer": lambda: [
+            extract_student_answer(engine, doc, q, html, correct) for q, doc, html, correct in items
+        ],
+        "parse_question": lambda: [parse_question(q, 2, None, engine) for q in questions],
+        "parse_question_cached": lambda: [parse_question(q, 2, warm_cache, engine) for q in questions],
+    }
+
+
+def common_steps(questions: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    htmls = [q.get("html", "") for q in questions]
+    marks = [q.get("mark") or q.get("marks") or q.get("score") or q.get("maxmark") for q in questions]
+    return {
+        "split_question_html": lambda: [split_question_html(html) for html in htmls],
+        "saved_regex": lambda: [SAVED_RE.search(html) for html in htmls],
+        "to_float_score": lambda: [to_float_score(mark) for mark in marks],
+        "extract_score": lambda: [extract_score(q, "") for q in questions],
+    }
+
+
+def run(corpus: Dict[str, List[Dict[str, Any]]], backends: List[str], rounds: int, min_time: float) -> Dict[str, float]:
+    """Результаты вида {"<группа>/<движок>/<этап>": мкс на вопрос}"""
+    results = {}
+    for group, questions in corpus.items():
+        for step, func in common_steps(questions).items():
+            results[f"{group}/-/{step}"] = time_step(func, len(questions), rounds, min_time)
+        for backend in backends:
+            for step, func in engine_steps(get_engine(backend), questions).items():
+                results[f"{group}/{backend}/{step}"] = time_step(func, len(questions), rounds, min_time)
+    return results
+
+
+def print_tables(results: Dict[str, float], corpus: Dict[str, List[Dict[str, Any]]], backends: List[str]):
+    groups = list(corpus)
+    kinds = list(dict.fromkeys(g.split("/")[0] for g in groups))
+    for engine in ["-", *backends]:
+        steps = COMMON_STEPS if engine == "-" else ENGINE_STEPS
+        for kind in kinds:
+            columns = [g for g in groups if g.startswith(kind + "/")]
+            title = "без движка" if engine == "-" else engine
+            print(f"\n{kind} [{title}], мкс/вопрос")
+            print(f"{'вопросов':<24}" + "".join(f"{g.split('/')[1]:>10}" for g in columns))
+            for step in steps:
+                print(f"{step:<24}" + "".join(f"{results[f'{g}/{engine}/{step}']:>10.1f}" for g in columns))
+    for engine in backends:
+        print(f"\nразбор попытки целиком [{engine}], мс: " + ", ".join(
+            f"{g} = {results[f'{g}/{engine}/parse_question'] * len(corpus[g]) / 1000:.1f}" for g in groups
+        ))
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float, min_delta: float) -> List[str]:
+    """Этапы, ставшие медленнее базового замера"""
+    regressions = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        if base is None or base <= 0:
+            continue
+        if value > base * (1 + threshold) and value - base > min_delta:
+            regressions.append(f"{key}: {base:.1f} -> {value:.1f} мкс (+{(value / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def environment() -> Dict[str, str]:
+    import bs4
+    info = {"python": platform.python_version(), "machine": platform.machine(), "bs4": bs4.__version__}
+    try:
+        import lxml.etree
+        info["lxml"] = ".".join(map(str, lxml.etree.LXML_VERSION))
+    except ImportError:
+        pass
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200], help="вопросов в попытке")
+    parser.add_argument("--backends", nargs="+", choices=["bs4", "lxml"], default=["bs4", "lxml"])
+    parser.add_argument("--rounds", type=int, default=5, help="раундов замера этапа (берётся лучший)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="минимальная длительность раунда (секунды)")
+    parser.add_argument("--save-baseline", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого замера для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление этапа (доля)")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="замедления меньше N мкс/вопрос не считаются")
+    args = parser.parse_args()
+
+    backends = [b for b in args.backends if get_engine(b).name == b]
+    if len(backends) != len(args.backends):
+        print("lxml не установлен — замеряется только bs4")
+
+    corpus = build_corpus(args.sizes)
+    results = run(corpus, backends, args.rounds, args.min_time)
+    print(f"окружение: {environment()}")
+    print_tables(results, corpus, backends)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nбазовый замер: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment():
+            print(f"\nвнимание: замер сделан в другом окружении: {baseline.get('environment')}")
+        regressions = compare(results, baseline["results"], args.threshold, args.min_delta)
+        print(f"\nрегрессий относительно {args.baseline}: {len(regressions)}")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Локальные заменители Moodle и GigaChat для нагрузочного тестирования
+
+Moodle (POST /webservice/rest/server.php):
+    mod_quiz_get_attempt_review    — попытка из сгенерированного корпуса (review_fixtures.make_review)
+    enrol_manual_enrol_users       — исключение "Message was not sent." (успех для сервиса) или null (--enrol-response null)
+    core_webservice_get_site_info  — сведения о сайте
+GigaChat:
+    POST /api/v2/oauth             — токен с expires_at
+    POST /api/v1/chat/completions  — уровень 1/2/3, обычный ответ или поток SSE (stream=true)
+
+У каждого сервиса настраиваются задержка (мс, с разбросом ±--jitter) и доля ответов 503;
+GigaChat дополнительно отвечает 429 с Retry-After. Счётчики вызовов — GET /stats.
+
+Пример:
+    python benchmarks/fake_services.py --moodle-latency 30 --gigachat-latency 400 --gigachat-429-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from review_fixtures import make_review  # noqa: E402
+
+# Число заранее сериализованных попыток: ответ на review не тратит CPU на генерацию HTML
+REVIEW_POOL = 200
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser):
+    """Параметры заменителей (общие для fake_services.py и load_test.py)"""
+    group = parser.add_argument_group("заменители Moodle и GigaChat")
+    group.add_argument("--moodle-port", type=int, default=9101)
+    group.add_argument("--gigachat-port", type=int, default=9102)
+    group.add_argument("--moodle-latency", type=float, default=20.0, help="задержка ответа Moodle (мс)")
+    group.add_argument("--gigachat-latency", type=float, default=300.0, help="задержка ответа GigaChat (мс)")
+    group.add_argument("--jitter", type=float, default=0.2, help="разброс задержки (доля от задержки)")
+    group.add_argument("--moodle-error-rate", type=float, default=0.0, help="доля ответов Moodle 503")
+    group.add_argument("--gigachat-error-rate", type=float, default=0.0, help="доля ответов GigaChat 503")
+    group.add_argument("--gigachat-429-rate", type=float, default=0.0, help="доля ответов GigaChat 429")
+    group.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для ответов 429 (секунды)")
+    group.add_argument("--questions", type=int, default=30, help="вопросов в попытке")
+    group.add_argument("--enrol-response", choices=["message", "null"], default="message",
+                       help="ответ enrol_manual_enrol_users: исключение «Message was not sent.» или null")
+
+
+def fake_arguments(args: argparse.Namespace) -> list:
+    """Те же параметры в виде командной строки для запуска в отдельном процессе"""
+    argv = []
+    for name in ("moodle_port", "gigachat_port", "moodle_latency", "gigachat_latency", "jitter", "moodle_error_rate",
+                 "gigachat_error_rate", "gigachat_429_rate", "retry_after", "questions", "enrol_response"):
+        argv += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    return argv
+
+
+async def _delay(latency_ms: float, jitter: float):
+    if latency_ms > 0:
+        await asyncio.sleep(latency_ms / 1000 * random.uniform(1 - jitter, 1 + jitter))
+
+
+def create_moodle_app(args: argparse.Namespace) -> web.Application:
+    stats = Counter()
+    reviews = [
+        json.dumps(make_review(attempt_id, args.questions, seed=attempt_id)).encode("utf-8")
+        for attempt_id in range(REVIEW_POOL)
+    ]
+
+    async def server(request: web.Request) -> web.Response:
+        data = await request.post()
+        function = data.get("wsfunction", "")
+        stats[function] += 1
+        await _delay(args.moodle_latency, args.jitter)
+        if random.random() < args.moodle_error_rate:
+            stats["http_503"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+
+        if function == "mod_quiz_get_attempt_review":
+            # id попытки в теле не совпадает с запрошенным: сервис его не проверяет
+            body = reviews[int(data.get("attemptid", 0)) % REVIEW_POOL]
+            return web.Response(body=body, content_type="application/json")
+        if function == "enrol_manual_enrol_users":
+            stats["enrolments"] += sum(1 for key in data if key.endswith("[userid]"))
+            if args.enrol_response == "message":
+                return web.json_response({"exception": "moodle_exception", "errorcode": "Message was not sent.",
+                                          "message": "Message was not sent."})
+            return web.json_response(None)
+        if function == "core_webservice_get_site_info":
+            return web.json_response({"sitename": "Fake Moodle", "username": "bench", "release": "4.3"})
+        return web.json_response({"exception": "dml_missing_record_exception", "errorcode": "invalidrecord",
+                                  "message": f"Функция {function} не поддерживается заменителем"})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/webservice/rest/server.php", server)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def create_gigachat_app(args: argparse.Namespace) -> web.Application:
+    stats = Counter()
+
+    async def oauth(request: web.Request) -> web.Response:
+        stats["oauth"] += 1
+        await _delay(args.gigachat_latency / 4, args.jitter)
+        return web.json_response({"access_token": "bench-token", "expires_at": int((time.time() + 1800) * 1000)})
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        stats["chat"] += 1
+        payload = await request.json()
+        roll = random.random()
+        if roll < args.gigachat_429_rate:
+            stats["http_429"] += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": str(args.retry_after)})
+        if roll < args.gigachat_429_rate + args.gigachat_error_rate:
+            await _delay(args.gigachat_latency / 4, args.jitter)
+            stats["http_503"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+
+        level = str(random.randint(1, 3))
+        if not payload.get("stream"):
+            await _delay(args.gigachat_latency, args.jitter)
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": level}}]})
+
+        # Поток: первый токен после половины задержки, затем «многословное» продолжение
+        stats["stream"] += 1
+        await _delay(args.gigachat_latency / 2, args.jitter)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for piece in [level, ". Обоснование:", " ответы", " по", " областям"]:
+                chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await _delay(args.gigachat_latency / 10, args.jitter)
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # Сервис закрыл поток, получив уровень
+            stats["stream_closed_early"] += 1
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/api/v2/oauth", oauth)
+    app.router.add_post("/api/v1/chat/completions", completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+async def serve(args: argparse.Namespace):
+    runners = []
+    for app, port in ((create_moodle_app(args), args.moodle_port), (create_gigachat_app(args), args.gigachat_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+    print(f"Moodle: http://127.0.0.1:{args.moodle_port}, GigaChat: http://127.0.0.1:{args.gigachat_port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_fake_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Время импорта модулей сервиса и холодного старта сервера
+
+Для каждого модуля (--modules) запускается `python -X importtime -c "import <модуль>"`
+в отдельном процессе (--repeat раз, берётся самый быстрый запуск) и выводится:
+общее время импорта, самые дорогие сторонние пакеты (по собственному времени всех их
+модулей) и модули сервиса (по накопленному времени). Модули из --deferred (aiohttp, bs4,
+lxml) импортируются только при создании сессии и движка разбора: если какой-то из них
+попал в импорт, отчёт завершается с кодом 1.
+
+С --startup дополнительно запускаются заменители Moodle и GigaChat (fake_services.py)
+и run_server.py; измеряется время от запуска процесса сервера до ответа /health
+(процесс принимает запросы) и /ready (пул разбора, токен и соединения прогреты).
+
+Примеры:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --modules fastapi_server --top 20 --repeat 5
+    python benchmarks/import_time.py --startup --server-workers 2 --output startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+sys.path.insert(0, BENCH_DIR)
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def own_modules() -> set:
+    return {name[:-3] for name in os.listdir(SRC_DIR) if name.endswith(".py")}
+
+
+def measure_import(module: str) -> List[Dict[str, Any]]:
+    """Строки -X importtime для импорта модуля в чистом процессе: модуль, уровень, мкс"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": SRC_DIR},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module}: {result.stderr.strip().splitlines()[-1]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({"module": name, "level": (len(indent) - 1) // 2,
+                            "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return entries
+
+
+def summarize(module: str, entries: List[Dict[str, Any]], own: set, deferred: List[str], top: int) -> Dict[str, Any]:
+    target = next(e for e in reversed(entries) if e["module"] == module)
+    # Модули, импортированные до модуля (интерпретатор, site), в отчёт не входят
+    start = max(i for i, e in enumerate(entries) if e["module"] == module and e["level"] == 0)
+    first = max((i for i, e in enumerate(entries[:start]) if e["level"] == 0), default=-1) + 1
+    imported = entries[first:start + 1]
+
+    packages: Dict[str, int] = defaultdict(int)
+    for entry in imported:
+        package = entry["module"].split(".")[0]
+        if package not in own:
+            packages[package] += entry["self_us"]
+    loaded = {entry["module"].split(".")[0] for entry in imported}
+    return {
+        "total_ms": round(target["cumulative_us"] / 1000, 1),
+        "modules": len(imported),
+        "packages": {name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda p: -p[1])[:top]},
+        "own": {e["module"]: round(e["cumulative_us"] / 1000, 1)
+                for e in sorted(imported, key=lambda e: -e["cumulative_us"]) if e["module"] in own},
+        "deferred_imported": [name for name in deferred if name in loaded],
+    }
+
+
+def run_imports(args: argparse.Namespace) -> Dict[str, Any]:
+    own = own_modules()
+    report = {}
+    for module in args.modules:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda entries: entries[-1]["cumulative_us"])
+        report[module] = summarize(module, best, own, args.deferred, args.top)
+    return report
+
+
+def print_imports(report: Dict[str, Any]):
+    for module, summary in report.items():
+        print(f"\nimport {module}: {summary['total_ms']} мс, модулей {summary['modules']}")
+        print("  сторонние пакеты, мс: " + ", ".join(f"{name} {ms}" for name, ms in summary["packages"].items()))
+        print("  модули сервиса (накопленно), мс: " + ", ".join(f"{name} {ms}" for name, ms in summary["own"].items()))
+        if summary["deferred_imported"]:
+            print(f"  импортированы при загрузке модуля: {', '.join(summary['deferred_imported'])}")
+
+
+async def run_startup(args: argparse.Namespace) -> Dict[str, Any]:
+    """Время от запуска run_server.py до /health и /ready"""
+    from load_test import start_fake_services, start_server, wait_ready
+
+    workdir = tempfile.mkdtemp(prefix="entrance-startup-")
+    fakes = start_fake_services(args)
+    server = None
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.moodle_port}/stats", 30, fakes)
+        url = f"http://127.0.0.1:{args.server_port}"
+        started = time.perf_counter()
+        server = start_server(args, workdir)
+        await wait_ready(f"{url}/health", 60, server)
+        health = time.perf_counter() - started
+        await wait_ready(f"{url}/ready", 60, server)
+        ready = time.perf_counter() - started
+        return {"server_workers": args.server_workers, "health_ms": round(health * 1000), "ready_ms": round(ready * 1000)}
+    finally:
+        for process in (server, fakes):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=args.shutdown_timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def main():
+    from fake_services import add_fake_arguments
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["fastapi_server", "main", "run_server"], help="модули для замера импорта")
+    parser.add_argument("--repeat", type=int, default=3, help="запусков на модуль (берётся самый быстрый)")
+    parser.add_argument("--top", type=int, default=10, help="сколько сторонних пакетов выводить")
+    parser.add_argument("--deferred", nargs="*", default=["aiohttp", "bs4", "lxml"],
+                        help="пакеты, которые не должны импортироваться вместе с модулями сервиса")
+    parser.add_argument("--startup", action="store_true", help="замерить время до /health и /ready запущенного сервера")
+    parser.add_argument("--server-port", type=int, default=8100)
+    parser.add_argument("--server-workers", type=int, default=1, help="SERVER_WORKERS запускаемого сервиса")
+    parser.add_argument("--ai-rps", type=float, default=1000, help="AI_MAX_RPS/AI_BURST/AI_MAX_CONCURRENCY сервиса, если не заданы в окружении")
+    parser.add_argument("--shutdown-timeout", type=float, default=40.0)
+    parser.add_argument("--server-log", action="store_true", help="выводить лог сервиса")
+    parser.add_argument("--output", help="сохранить отчёт в JSON")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {"python": sys.version.split()[0], "imports": run_imports(args)}
+    print_imports(report["imports"])
+    if args.startup:
+        report["startup"] = asyncio.run(run_startup(args))
+        startup = report["startup"]
+        print(f"\nзапуск сервера ({startup['server_workers']} процесс.): /health через {startup['health_ms']} мс, "
+              f"/ready через {startup['ready_ms']} мс")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"отчёт: {args.output}")
+    if any(summary["deferred_imported"] for summary in report["imports"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест /analyze-and-enroll на локальных заменителях Moodle и GigaChat
+
+Запускает fake_services.py и сервис (run_server.py) в отдельных процессах, затем для
+каждого уровня параллельности отправляет --requests запросов с уникальными попытками
+и выводит задержку (p50/p95/p99, мс) и пропускную способность (запросов/с).
+Кэши результатов и ответов ИИ отключены, лимит GigaChat поднят (--ai-rps), чтобы
+измерялся сам конвейер; любые другие настройки сервиса можно задать переменными окружения.
+
+Примеры:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1 8 32 128 --requests 500 --server-workers 4
+    python benchmarks/load_test.py --gigachat-429-rate 0.1 --moodle-error-rate 0.02 --output load.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8000   # уже запущенный сервис, заменители не запускаются
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import add_fake_arguments, fake_arguments  # noqa: E402
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+async def wait_ready(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Процесс завершился с кодом {process.returncode}: {' '.join(process.args)}")
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=1)) as r:
+                    if r.status == 200:
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не ответил за {timeout} с")
+
+
+async def run_level(url: str, concurrency: int, requests: int, ids: "itertools.count") -> Dict[str, Any]:
+    """Отправляет requests запросов не более чем по concurrency одновременно"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker(session: aiohttp.ClientSession):
+        for _ in remaining:
+            attempt_id = next(ids)
+            body = {"user_id": attempt_id, "quiz_id": 2, "attempt_id": attempt_id}
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/analyze-and-enroll", json=body) as r:
+                    result = await r.json(content_type=None)
+                    ok = r.status == 200 and result.get("success")
+                    error = None if ok else f"HTTP {r.status}: {result.get('error') or result.get('detail')}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = f"{type(e).__name__}: {e}"
+            latencies.append(time.perf_counter() - start)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+    }
+
+
+def start_fake_services(args: argparse.Namespace) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_services.py"), *fake_arguments(args)],
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def start_server(args: argparse.Namespace, workdir: str) -> subprocess.Popen:
+    """run_server.py, настроенный на заменители Moodle и GigaChat"""
+    env = {
+        **os.environ,
+        "MOODLE_URL": f"http://127.0.0.1:{args.moodle_port}",
+        "MOODLE_TOKEN": "bench",
+        "AI_API_URL": f"http://127.0.0.1:{args.gigachat_port}/api/v1/chat/completions",
+        "GIGACHAT_OAUTH_URL": f"http://127.0.0.1:{args.gigachat_port}/api/v2/oauth",
+        "GIGACHAT_AUTHORIZATION_TOKEN": "bench",
+        "ENTRY_TEST_ID": "2",
+        "SERVER_HOST": "127.0.0.1",
+        "SERVER_PORT": str(args.server_port),
+        "SERVER_WORKERS": str(args.server_workers),
+        "SERVER_RELOAD": "false",
+        "RESULT_CACHE_ENABLED": "false",
+        "LLM_CACHE_ENABLED": "false",
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "TRACING_FILE": os.path.join(workdir, "traces.jsonl"),
+    }
+    for name, value in (("AI_MAX_RPS", args.ai_rps), ("AI_BURST", args.ai_rps), ("AI_MAX_CONCURRENCY", args.ai_rps)):
+        env.setdefault(name, str(value))
+    return subprocess.Popen(
+        [sys.executable, "run_server.py"], cwd=SRC_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+
+
+def start_processes(args: argparse.Namespace, workdir: str) -> List[subprocess.Popen]:
+    return [start_fake_services(args), start_server(args, workdir)]
+
+
+async def fetch_stats(args: argparse.Namespace) -> Dict[str, Any]:
+    stats = {}
+    async with aiohttp.ClientSession() as session:
+        for name, port in (("moodle", args.moodle_port), ("gigachat", args.gigachat_port)):
+            async with session.get(f"http://127.0.0.1:{port}/stats") as r:
+                stats[name] = await r.json()
+    return stats
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    url = args.url or f"http://127.0.0.1:{args.server_port}"
+    processes: List[subprocess.Popen] = []
+    workdir = tempfile.mkdtemp(prefix="entrance-load-")
+    try:
+        if not args.url:
+            processes = start_processes(args, workdir)
+            await wait_ready(f"http://127.0.0.1:{args.moodle_port}/stats", 30, processes[0])
+            await wait_ready(f"{url}/ready", 60, processes[1])
+
+        ids = itertools.count(args.first_attempt_id)
+        if args.warmup:
+            await run_level(url, min(args.warmup, max(args.concurrency)), args.warmup, ids)
+
+        levels = []
+        print(f"{'параллельно':>11} {'запросов':>9} {'ошибок':>7} {'запр./с':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+        for concurrency in args.concurrency:
+            level = await run_level(url, concurrency, args.requests, ids)
+            levels.append(level)
+            print(f"{level['concurrency']:>11} {level['requests']:>9} {level['errors']:>7} {level['rps']:>8} "
+                  f"{level['p50_ms']:>9} {level['p95_ms']:>9} {level['p99_ms']:>9}", flush=True)
+            for error, count in level["error_kinds"].items():
+                print(f"{'':>11} {count} × {error}")
+
+        report = {"url": url, "server_workers": None if args.url else args.server_workers, "levels": levels}
+        if not args.url:
+            report["fake_stats"] = await fetch_stats(args)
+            print("вызовы заменителей:", json.dumps(report["fake_stats"], ensure_ascii=False))
+        return report
+    finally:
+        # Сервис останавливается первым: плавная остановка дожидается его запросов к заменителям
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=args.shutdown_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="уровни параллельности")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на уровень")
+    parser.add_argument("--warmup", type=int, default=10, help="прогревочных запросов (не входят в результат)")
+    parser.add_argument("--url", help="адрес уже запущенного сервиса (заменители и сервис не запускаются)")
+    parser.add_argument("--server-port", type=int, default=8100)
+    parser.add_argument("--server-workers", type=int, default=1, help="SERVER_WORKERS запускаемого сервиса")
+    parser.add_argument("--ai-rps", type=float, default=1000, help="AI_MAX_RPS/AI_BURST/AI_MAX_CONCURRENCY сервиса, если не заданы в окружении")
+    parser.add_argument("--first-attempt-id", type=int, default=1_000_000, help="id первой попытки (каждый запрос — новая попытка)")
+    parser.add_argument("--shutdown-timeout", type=float, default=40.0)
+    parser.add_argument("--server-log", action="store_true", help="выводить лог сервиса")
+    parser.add_argument("--output", help="сохранить отчёт в JSON")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"отчёт: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Проверка паритета движков разбора review (bs4 и lxml) и сравнение их скорости
+
+Для каждой попытки из fixtures/*.json и сгенерированного корпуса результат
+parse_review_questions обоих движков сравнивается побайтно (json.dumps). Кроме того,
+проверяется кэш структуры: после разбора попытки в ней правится правильный ответ
+(текст вопроса тот же), и разбор с заполненным кэшем должен совпасть с разбором без кэша.
+При любом расхождении скрипт завершается с кодом 1.
+
+Примеры:
+    python benchmarks/parser_parity.py
+    python benchmarks/parser_parity.py --attempts 50 --questions 10 40 200
+"""
+
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from review_fixtures import load_fixtures, make_review  # noqa: E402
+from review_parser import QuizStructureCache, get_engine, parse_review_questions  # noqa: E402
+
+BACKENDS = ("bs4", "lxml")
+RIGHTANSWER_RE = re.compile(r'(<div class="rightanswer">)[^<]*')
+
+
+def dump(answers) -> bytes:
+    return json.dumps(answers, ensure_ascii=False, sort_keys=True).encode("utf-8")
+
+
+def check_parity(name: str, review: dict, with_cache: bool) -> list:
+    """Возвращает список расхождений (слот, вывод bs4, вывод lxml)"""
+    outputs = {}
+    for backend in BACKENDS:
+        cache = QuizStructureCache(1000, 3600) if with_cache else None
+        quiz_id = review.get("attempt", {}).get("quiz")
+        # Второй проход с кэшем проверяет ветку «структура уже известна»
+        passes = 2 if with_cache else 1
+        for _ in range(passes):
+            outputs[backend] = parse_review_questions(review["questions"], quiz_id, cache, backend)
+
+    mismatches = []
+    for a, b in zip(outputs["bs4"], outputs["lxml"]):
+        if dump(a) != dump(b):
+            mismatches.append((name, a.get("slot"), a, b))
+    if len(outputs["bs4"]) != len(outputs["lxml"]):
+        mismatches.append((name, None, len(outputs["bs4"]), len(outputs["lxml"])))
+    return mismatches
+
+
+def check_edited_answer(name: str, review: dict) -> list:
+    """Правка правильного ответа при том же тексте вопроса не должна отдавать старый ответ из кэша"""
+    edited = copy.deepcopy(review)
+    for q in edited["questions"]:
+        q["html"] = RIGHTANSWER_RE.sub(r"\1Правильный ответ: EDITED", q.get("html", ""))
+    quiz_id = review.get("attempt", {}).get("quiz")
+
+    mismatches = []
+    for backend in BACKENDS:
+        cache = QuizStructureCache(1000, 3600)
+        parse_review_questions(review["questions"], quiz_id, cache, backend)
+        cached = parse_review_questions(edited["questions"], quiz_id, cache, backend)
+        fresh = parse_review_questions(edited["questions"], quiz_id, None, backend)
+        for a, b in zip(cached, fresh):
+            if dump(a) != dump(b):
+                mismatches.append((f"{name} ({backend}, правка правильного ответа)", a.get("slot"), a, b))
+    return mismatches
+
+
+def measure(reviews: list, backend: str, repeat: int) -> float:
+    """Среднее время разбора одного вопроса (мс) без кэша структуры"""
+    questions = sum(len(r["questions"]) for r in reviews)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for review in reviews:
+            parse_review_questions(review["questions"], backend=backend)
+    return (time.perf_counter() - start) * 1000 / (questions * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attempts", type=int, default=20, help="число сгенерированных попыток на размер теста")
+    parser.add_argument("--questions", type=int, nargs="+", default=[10, 40, 100])
+    parser.add_argument("--repeat", type=int, default=3, help="повторов при замере скорости")
+    args = parser.parse_args()
+
+    if get_engine("lxml").name != "lxml":
+        print("lxml не установлен — сравнивать не с чем")
+        sys.exit(1)
+
+    corpus = dict(load_fixtures())
+    for n in args.questions:
+        for attempt in range(args.attempts):
+            corpus[f"generated_{n}_{attempt}"] = make_review(attempt + 1, n, seed=n)
+
+    mismatches = []
+    for name, review in corpus.items():
+        for with_cache in (False, True):
+            mismatches.extend(check_parity(name, review, with_cache))
+        mismatches.extend(check_edited_answer(name, review))
+
+    total = sum(len(r["questions"]) for r in corpus.values())
+    print(f"попыток: {len(corpus)}, вопросов: {total}, расхождений: {len(mismatches)}")
+    for name, slot, a, b in mismatches[:10]:
+        print(f"\n{name} slot={slot}\n  bs4:  {a}\n  lxml: {b}")
+
+    reviews = list(corpus.values())
+    timings = {backend: measure(reviews, backend, args.repeat) for backend in BACKENDS}
+    for backend, ms in timings.items():
+        print(f"{backend:>5}: {ms:.3f} мс/вопрос")
+    print(f"ускорение lxml: x{timings['bs4'] / timings['lxml']:.1f}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
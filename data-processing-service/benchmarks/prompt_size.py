@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Сравнение размера промпта и задержки ответа ИИ для форматов json и compact
+
+Примеры:
+    python benchmarks/prompt_size.py                      # размер и время сериализации
+    python benchmarks/prompt_size.py --questions 10 40 80 --budget 2000
+    python benchmarks/prompt_size.py --live --repeat 3    # + реальные запросы к GigaChat (нужен .env)
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from prompt_encoding import FORMAT_COMPACT, FORMAT_JSON, encode_results, estimate_tokens  # noqa: E402
+
+TOPICS = [
+    "Какой оператор SQL используется для объединения результатов двух запросов без дубликатов?",
+    "Что выведет следующий код на Python: print([i * 2 for i in range(3)])?",
+    "Какой HTTP-метод является идемпотентным и используется для полного обновления ресурса?",
+    "Какая команда Linux показывает список процессов в реальном времени?",
+    "Какой принцип SOLID нарушается, если класс отвечает за несколько несвязанных задач?",
+    "Какой уровень изоляции транзакций предотвращает неповторяемое чтение?",
+]
+CHOICES = [
+    ["a. UNION", "b. UNION ALL", "c. JOIN", "d. INTERSECT"],
+    ["a. [0, 2, 4]", "b. [0, 1, 2]", "c. [2, 4, 6]", "d. Ошибка"],
+    ["a. POST", "b. PUT", "c. PATCH", "d. CONNECT"],
+    ["a. ls", "b. top", "c. cat", "d. df"],
+    ["a. Принцип единственной ответственности", "b. Принцип открытости/закрытости",
+     "c. Принцип подстановки Лисков", "d. Принцип инверсии зависимостей"],
+    ["a. READ UNCOMMITTED", "b. READ COMMITTED", "c. REPEATABLE READ", "d. SERIALIZABLE"],
+]
+
+
+def make_attempt(questions: int, seed: int = 1) -> dict:
+    """Синтетическая попытка в формате, который возвращает get_attempt_review"""
+    rnd = random.Random(seed)
+    answers = []
+    for slot in range(1, questions + 1):
+        i = slot % len(TOPICS)
+        choices = CHOICES[i]
+        correct = choices[0][3:]
+        picked = rnd.choice(choices + [None])
+        if picked is None:
+            state, answer, score = "gaveup", "не ответил", 0.0
+        elif picked[3:] == correct:
+            state, answer, score = "gradedright", picked, 1.0
+        else:
+            state, answer, score = "gradedwrong", picked, 0.0
+        answers.append({
+            "slot": slot,
+            "question": f"{TOPICS[i]} (вопрос {slot})",
+            "choices": choices,
+            "student_answer": answer,
+            "correct_answer": correct,
+            "score": score,
+            "state": state,
+        })
+    return {"student_id": 3, "quiz_id": 2, "attempt_id": 1000 + questions, "answers": answers}
+
+
+def measure_encoding(results_json: dict, mode: str, budget: int, repeat: int = 200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        text = encode_results(results_json, mode, budget)
+    elapsed = (time.perf_counter() - start) / repeat
+    return text, elapsed
+
+
+async def measure_live(prompt_data: str, repeat: int) -> float:
+    """Средняя задержка completion для заданных данных попытки (секунды)"""
+    from ai_analyzer import build_payload, request_completion
+    from http_client import close_http_client
+
+    payload = build_payload(prompt_data)
+    timings = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await request_completion(payload)
+            timings.append(time.perf_counter() - start)
+    finally:
+        await close_http_client()
+    return sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, nargs="+", default=[10, 40, 100])
+    parser.add_argument("--budget", type=int, default=0, help="бюджет токенов для compact (0 - без ограничения)")
+    parser.add_argument("--live", action="store_true", help="измерить задержку реальных запросов к ИИ")
+    parser.add_argument("--repeat", type=int, default=3, help="число запросов к ИИ на формат в режиме --live")
+    args = parser.parse_args()
+
+    header = f"{'вопросов':>8} {'формат':>8} {'байт':>9} {'~токенов':>9} {'сериализация, мс':>17}"
+    if args.live:
+        header += f" {'ответ ИИ, с':>12}"
+    print(header)
+
+    for n in args.questions:
+        attempt = make_attempt(n)
+        base_bytes = None
+        for mode in (FORMAT_JSON, FORMAT_COMPACT):
+            text, elapsed = measure_encoding(attempt, mode, args.budget if mode == FORMAT_COMPACT else 0)
+            size = len(text.encode("utf-8"))
+            base_bytes = base_bytes or size
+            line = f"{n:>8} {mode:>8} {size:>9} {estimate_tokens(text):>9} {elapsed * 1000:>17.3f}"
+            if args.live:
+                line += f" {asyncio.run(measure_live(text, args.repeat)):>12.2f}"
+            if mode == FORMAT_COMPACT:
+                line += f"   ({size / base_bytes:.0%} от json)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
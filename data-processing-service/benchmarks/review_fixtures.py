@@ -0,0 +1,183 @@
+"""
+Корпус ответов mod_quiz_get_attempt_review для бенчмарков и проверки паритета движков разбора
+
+- fixtures/*.json — сохранённые ответы Moodle 4.x (разметка review, включая пограничные случаи)
+- make_review() — генератор попыток той же разметки на любое число вопросов
+"""
+
+import glob
+import json
+import os
+import random
+from typing import Any, Dict, List, Sequence
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+QUESTION_TYPES = ("multichoice", "truefalse", "shortanswer")
+
+_INFO = (
+    '<div class="info"><h3 class="no">Вопрос <span class="qno">{slot}</span></h3>'
+    '<div class="state">{state_text}</div><div class="grade">Баллов: {mark} из 1,00</div>'
+    '<div class="questionflag editable"><input type="hidden" name="q{usage}:{slot}_:flagged" value="0" />'
+    '<input type="checkbox" id="q{usage}:{slot}_:flaggedcheckbox" name="q{usage}:{slot}_:flagged" value="1" />'
+    '<label for="q{usage}:{slot}_:flaggedcheckbox"><span>Отметить вопрос</span></label></div></div>'
+)
+
+_MULTICHOICE = [
+    ("Какой оператор SQL объединяет результаты двух запросов &lt;без&gt; дубликатов?",
+     ["UNION", "UNION ALL", "JOIN", "INTERSECT"]),
+    ("Что выведет код?<pre><code>print([i * 2 for i in range(3)])</code></pre>",
+     ["[0, 2, 4]", "[0, 1, 2]", "[2, 4, 6]", "Ошибка"]),
+    ("Какой принцип SOLID нарушается, если класс отвечает за несколько несвязанных задач?",
+     ["Единственной ответственности", "Открытости/закрытости", "Подстановки Лисков", "Инверсии зависимостей"]),
+]
+_TRUEFALSE = [
+    ("Метод HTTP PUT является идемпотентным.", True),
+    ("Индекс в PostgreSQL всегда ускоряет вставку строк.", False),
+]
+_SHORTANSWER = [
+    ("Какая команда Linux показывает процессы в реальном времени?", "top"),
+    ("Как называется язык разметки веб-страниц (аббревиатура)?", "HTML"),
+]
+
+
+def _state(correct: bool, answered: bool) -> str:
+    if not answered:
+        return "gaveup"
+    return "gradedright" if correct else "gradedwrong"
+
+
+def multichoice_html(usage: int, slot: int, qtext: str, choices: Sequence[str], picked: Sequence[int], correct_index: int) -> str:
+    """Разметка вопроса multichoice (один ответ) в режиме review"""
+    rows = []
+    for i, choice in enumerate(choices):
+        checked = ' checked="checked"' if i in picked else ""
+        rows.append(
+            f'<div class="r{i % 2}"><input type="radio" name="q{usage}:{slot}_answer" value="{i}" '
+            f'id="q{usage}:{slot}_answer{i}" aria-labelledby="q{usage}:{slot}_answer{i}_label" disabled="disabled"{checked} />'
+            f'<div class="d-flex w-auto" id="q{usage}:{slot}_answer{i}_label" data-region="answer-label">'
+            f'<span class="answernumber">{chr(ord("a") + i)}. </span>'
+            f'<div class="flex-fill ml-1"><p dir="ltr" style="text-align: left;">{choice}</p></div></div> </div>'
+        )
+    correct = list(picked) == [correct_index]
+    return (
+        f'<div id="question-{usage}-{slot}" class="que multichoice deferredfeedback {"correct" if correct else "incorrect"}">'
+        + _INFO.format(slot=slot, usage=usage, state_text="Верно" if correct else "Неверно", mark="1,00" if correct else "0,00")
+        + f'<div class="content"><div class="formulation clearfix"><h4 class="accesshide">Текст вопроса</h4>'
+        f'<input type="hidden" name="q{usage}:{slot}_:sequencecheck" value="2" />'
+        f'<div class="qtext"><p dir="ltr" style="text-align: left;">{qtext}</p></div>'
+        f'<div class="ablock no-overflow visual-scroll-x"><fieldset class="w-100">'
+        f'<legend class="prompt h6 font-weight-normal sr-only">Выберите один ответ:</legend>'
+        f'<div class="answer">{"".join(rows)}</div></fieldset></div></div>'
+        f'<div class="outcome clearfix"><h4 class="accesshide">Отзыв</h4><div class="feedback">'
+        f'<div class="specificfeedback">Ваш ответ {"верный" if correct else "неправильный"}.</div>'
+        f'<div class="rightanswer">Правильный ответ: {choices[correct_index]}</div></div></div></div></div>'
+    )
+
+
+def truefalse_html(usage: int, slot: int, qtext: str, picked, truth: bool) -> str:
+    """Разметка вопроса truefalse в режиме review (picked: True / False / None)"""
+    rows = []
+    for i, (label, value) in enumerate((("Верно", True), ("Неверно", False))):
+        checked = ' checked="checked"' if picked is value else ""
+        rows.append(
+            f'<div class="r{i}"><input type="radio" name="q{usage}:{slot}_answer" value="{int(value)}" '
+            f'id="q{usage}:{slot}_answer{int(value)}" disabled="disabled"{checked} />'
+            f'<label for="q{usage}:{slot}_answer{int(value)}" class="ml-1">{label}</label> </div>'
+        )
+    correct = picked is truth
+    return (
+        f'<div id="question-{usage}-{slot}" class="que truefalse deferredfeedback">'
+        + _INFO.format(slot=slot, usage=usage, state_text="Верно" if correct else "Неверно", mark="1,00" if correct else "0,00")
+        + f'<div class="content"><div class="formulation clearfix">'
+        f'<input type="hidden" name="q{usage}:{slot}_:sequencecheck" value="2" />'
+        f'<div class="qtext"><p>{qtext}</p></div>'
+        f'<div class="ablock"><div class="prompt">Выберите один ответ:</div><div class="answer">{"".join(rows)}</div></div></div>'
+        f'<div class="outcome clearfix"><div class="feedback">'
+        f'<div class="rightanswer">Правильный ответ: «{"Верно" if truth else "Неверно"}»</div></div></div></div></div>'
+    )
+
+
+def shortanswer_html(usage: int, slot: int, qtext: str, answer: str, right: str) -> str:
+    """Разметка вопроса shortanswer в режиме review"""
+    correct = answer.lower() == right.lower()
+    return (
+        f'<div id="question-{usage}-{slot}" class="que shortanswer deferredfeedback">'
+        + _INFO.format(slot=slot, usage=usage, state_text="Верно" if correct else "Неверно", mark="1,00" if correct else "0,00")
+        + f'<div class="content"><div class="formulation clearfix">'
+        f'<input type="hidden" name="q{usage}:{slot}_:sequencecheck" value="2" />'
+        f'<div class="qtext"><p>{qtext}</p></div>'
+        f'<div class="ablock form-inline"><label for="q{usage}:{slot}_answer">Ответ:</label>'
+        f'<span class="answer"><input type="text" name="q{usage}:{slot}_answer" value="{answer}" '
+        f'id="q{usage}:{slot}_answer" size="80" class="form-control d-inline" readonly="readonly" /></span></div></div>'
+        f'<div class="outcome clearfix"><div class="feedback"><div class="rightanswer">Правильный ответ: {right}</div>'
+        f'</div></div></div></div>'
+    )
+
+
+def make_question(kind: str, usage: int, slot: int, rnd: random.Random) -> Dict[str, Any]:
+    """Вопрос review случайного содержания заданного типа"""
+    responses = None
+    if kind == "multichoice":
+        qtext, choices = _MULTICHOICE[slot % len(_MULTICHOICE)]
+        choices = list(choices)
+        right = choices[0]
+        rnd.shuffle(choices)
+        correct_index = choices.index(right)
+        picked = rnd.choice([[], [correct_index], [correct_index], [(correct_index + 1) % len(choices)]])
+        html = multichoice_html(usage, slot, f"{qtext} ({slot})", choices, picked, correct_index)
+        correct, answered = picked == [correct_index], bool(picked)
+    elif kind == "truefalse":
+        qtext, truth = _TRUEFALSE[slot % len(_TRUEFALSE)]
+        picked = rnd.choice([None, True, False])
+        html = truefalse_html(usage, slot, f"{qtext} ({slot})", picked, truth)
+        correct, answered = picked is truth, picked is not None
+    else:
+        qtext, right = _SHORTANSWER[slot % len(_SHORTANSWER)]
+        answer = rnd.choice(["", right, right.lower(), "ps"])
+        html = shortanswer_html(usage, slot, f"{qtext} ({slot})", answer, right)
+        correct, answered = answer.lower() == right.lower(), bool(answer)
+        if answer:
+            responses = [{"name": "answer", "answer": f"<p>{answer}</p>"}]
+
+    question = {
+        "slot": slot,
+        "type": kind,
+        "page": (slot - 1) // 10,
+        "html": html,
+        "sequencecheck": 2,
+        "flagged": False,
+        "state": _state(correct, answered),
+        "status": "Верно" if correct else ("Ответа не было" if not answered else "Неверно"),
+        "mark": "1,00" if correct else "0,00",
+        "maxmark": 1,
+    }
+    if responses:
+        question["responses"] = responses
+    return question
+
+
+def make_review(attempt_id: int, questions: int, kinds: Sequence[str] = QUESTION_TYPES, seed: int = 0, quiz_id: int = 2) -> Dict[str, Any]:
+    """Ответ mod_quiz_get_attempt_review для попытки с заданным числом вопросов"""
+    rnd = random.Random(seed * 100003 + attempt_id)
+    usage = 1000 + attempt_id
+    return {
+        "grade": None,
+        "attempt": {"id": attempt_id, "quiz": quiz_id, "userid": attempt_id, "attempt": 1, "uniqueid": usage, "state": "finished"},
+        "additionaldata": [],
+        "questions": [make_question(kinds[(slot - 1) % len(kinds)], usage, slot, rnd) for slot in range(1, questions + 1)],
+        "warnings": [],
+    }
+
+
+def load_fixtures() -> Dict[str, Dict[str, Any]]:
+    """Сохранённые ответы review из fixtures/*.json"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return fixtures
+
+
+def all_questions(reviews: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [q for review in reviews.values() for q in review.get("questions", [])]
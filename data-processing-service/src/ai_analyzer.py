@@ -1,7 +1,26 @@
-import aiohttp
+import asyncio
+import functools
+import hashlib
 import json
+import logging
+import random
+import re
+import time
 import uuid
+from typing import Optional, Tuple
 from config import settings
+from http_client import get_session
+from token_cache import TokenCache
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from llm_cache import LLMCache, make_key
+import ensemble
+import fast_path
+import metrics
+import tracing
+from prompt_encoding import encode_results
+from placement import QuizPlacement, get_placement
+
+logger = logging.getLogger(__name__)
 
 
 PROMPT_TEMPLATE = """
@@ -69,74 +88,313 @@ PROMPT_TEMPLATE = """
 """
 
 
+# Версия промпта входит в ключ кэша ответов: при изменении шаблона старые ответы не используются
+PROMPT_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+_token_cache: Optional[TokenCache] = None
+_llm_cache: Optional[LLMCache] = None
+_rate_limiter: Optional[AdaptiveRateLimiter] = None
+
+
+def get_token_cache() -> TokenCache:
+    """Возвращает общий кэш токена GigaChat"""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(_timed_token_request, settings.gigachat_token_refresh_margin)
+    return _token_cache
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Возвращает общий лимитер запросов к GigaChat"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = AdaptiveRateLimiter(
+            rps=settings.ai_max_rps,
+            burst=settings.ai_burst,
+            max_concurrency=settings.ai_max_concurrency,
+            min_rps=settings.ai_min_rps,
+            increase_step=settings.ai_rps_increase_step,
+            decrease_factor=settings.ai_rps_decrease_factor,
+            max_queue=settings.ai_queue_max,
+            queue_timeout=settings.ai_queue_timeout,
+        )
+    return _rate_limiter
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Возвращает кэш ответов LLM (None, если кэш отключён)"""
+    global _llm_cache
+    if _llm_cache is None and settings.llm_cache_enabled:
+        _llm_cache = LLMCache(settings.llm_cache_max_entries, settings.llm_cache_path or None)
+    return _llm_cache
+
+
+def start_ai_clients():
+    """Создаёт кэш токена, лимитер и кэш ответов процесса (вызывается из lifespan)"""
+    get_token_cache()
+    get_rate_limiter()
+    get_llm_cache()
+
+
+def close_ai_clients():
+    """Сбрасывает состояние клиента GigaChat процесса: следующий запуск создаёт его в своём цикле событий"""
+    global _token_cache, _rate_limiter
+    _token_cache = None
+    _rate_limiter = None
+    close_llm_cache()
 
 
+def close_llm_cache():
+    """Закрывает дисковое хранилище кэша ответов LLM"""
+    global _llm_cache
+    if _llm_cache is not None:
+        _llm_cache.close()
+        _llm_cache = None
+
+
+@tracing.traced()
 async def get_gigachat_token() -> str:
-    """Получает токен для GigaChat API через OAuth"""
-    async with aiohttp.ClientSession() as session:
-        # Генерируем случайный RqUID
-        rquid = str(uuid.uuid4())
-        
-        headers = {
-            "Authorization": f"Basic {settings.gigachat_authorization_token}",
-            "RqUID": rquid,
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Accept": "*/*",
-            "User-Agent": "MoodleEntranceTesting/1.0",
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Accept-Encoding": "gzip, deflate, br"
-        }
-        
-        # Данные для OAuth запроса
-        data = {
-            "scope": "GIGACHAT_API_PERS"
-        }
-        
-        try:
-            async with session.post(
-                settings.gigachat_oauth_url, 
-                headers=headers, 
-                data=data,
-                ssl=False
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["access_token"]
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Ошибка получения токена: {response.status} - {error_text}")
-        except Exception as e:
-            raise Exception(f"Ошибка при запросе токена GigaChat: {e}")
+    """Возвращает токен для GigaChat API из кэша, обновляя его при необходимости"""
+    return await get_token_cache().get()
 
 
-async def analyze_results(results_json: dict) -> int:
-    print(results_json)
-    """Отправляет результаты теста в нейросеть и получает уровень"""
+async def _timed_token_request() -> Tuple[str, float]:
+    with metrics.stage("oauth"), tracing.span("gigachat_oauth"):
+        return await request_gigachat_token()
+
+
+async def request_gigachat_token() -> Tuple[str, float]:
+    """Получает новый токен для GigaChat API через OAuth, возвращает (токен, expires_at)"""
+    session = get_session()
+
+    # Генерируем случайный RqUID
+    rquid = str(uuid.uuid4())
+    
+    headers = {
+        "Authorization": f"Basic {settings.gigachat_authorization_token}",
+        "RqUID": rquid,
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Accept": "*/*",
+        "User-Agent": "MoodleEntranceTesting/1.0",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Accept-Encoding": "gzip, deflate, br"
+    }
     
-    # Получаем свежий токен для GigaChat
-    ai_token = await get_gigachat_token()
+    # Данные для OAuth запроса
+    data = {
+        "scope": "GIGACHAT_API_PERS"
+    }
     
-    async with aiohttp.ClientSession() as session:
+    try:
+        async with session.post(
+            settings.gigachat_oauth_url, 
+            headers=headers, 
+            data=data,
+            ssl=False
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                # GigaChat возвращает expires_at в миллисекундах
+                expires_at = result.get("expires_at")
+                if expires_at:
+                    expires_at = float(expires_at) / 1000
+                else:
+                    expires_at = time.time() + settings.gigachat_token_default_ttl
+                return result["access_token"], expires_at
+            else:
+                error_text = await response.text()
+                raise Exception(f"Ошибка получения токена: {response.status} - {error_text}")
+    except Exception as e:
+        raise Exception(f"Ошибка при запросе токена GigaChat: {e}")
+
+
+# Уровень — первое слово ответа из одной цифры (допускается точка или запятая после неё):
+# "2", "2. Обоснование"; но не "10", "1-2", "2.5" или "от 2 до 3"
+LEVEL_WORD_RE = re.compile(r"\s*(\d)[.,;:!]?(?:\s|$)")
+# Пока поток идёт, первое слово считается законченным только после пробела за ним
+LEVEL_WORD_DONE_RE = re.compile(r"\s*(\d)[.,;:!]?\s")
+
+
+async def read_level_stream(response) -> str:
+    """
+    Читает потоковый ответ (SSE, "data: {...}" по строке)
+    Если ответ начинается с уровня (LEVEL_WORD_RE), возвращает цифру и не читает остаток потока,
+    иначе дочитывает поток и возвращает весь текст для parse_level
+    """
+    text = ""
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            # Служебная или повреждённая строка потока не прерывает чтение ответа
+            continue
+        for choice in chunk.get("choices", []):
+            text += (choice.get("delta") or {}).get("content") or ""
+        match = LEVEL_WORD_DONE_RE.match(text)
+        if match:
+            response.close()
+            return match.group(1)
+    match = LEVEL_WORD_RE.match(text)
+    return match.group(1) if match else text
+
+
+@tracing.traced("gigachat_completion")
+async def request_completion(payload: dict) -> dict:
+    """
+    Отправляет запрос на completion через лимитер
+    При 401 обновляет токен и повторяет один раз; при 429/5xx снижает скорость лимитера
+    и повторяет после паузы (Retry-After или экспоненциальная задержка)
+    Для потокового запроса (stream=true) ответ собирается в тот же формат choices[0].message.content
+    """
+    session = get_session()
+    limiter = get_rate_limiter()
+    token_refreshed = False
+    retries = 0
+    while True:
+        delay = 0.0
+        ai_token = await get_gigachat_token()
         headers = {"Authorization": f"Bearer {ai_token}", "Content-Type": "application/json"}
-        payload = {
-            "model": settings.ai_model,
-            "messages": [{"role": "user", "content": PROMPT_TEMPLATE.format(results=json.dumps(results_json, ensure_ascii=False, indent=2))}],
-        }
-
-        async with session.post(settings.ai_api_url, json=payload, headers=headers, ssl=False) as r:
-            data = await r.json()
-            print(
-                f"DEBUG: Тип ответа ИИ: {type(data)}, ключи: {list(data.keys()) if isinstance(data, dict) else 'не dict'}")
-            print(data)
-
-            try:
-                text = data["choices"][0]["message"]["content"].strip()
-                # Парсим JSON из ответа ИИ
-                print(text)
-                level = int(text)
-                return level
-            except Exception as e:
-                raise f"Ошибка при разборе ответа ИИ: {e}"
+        queued_at = time.perf_counter()
+        async with limiter.slot():
+            metrics.observe("llm_queue", time.perf_counter() - queued_at)
+            sent_at = time.perf_counter()
+            async with session.post(settings.ai_api_url, json=payload, headers=headers, ssl=False) as r:
+                if r.status == 401 and not token_refreshed:
+                    # Токен отозван или истёк раньше срока — сбрасываем кэш
+                    get_token_cache().invalidate()
+                    token_refreshed = True
+                    continue
+                if r.status == 429 or r.status >= 500:
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                    limiter.on_throttle(retry_after)
+                    if retries >= settings.ai_max_retries:
+                        error_text = await r.text()
+                        raise Exception(f"GigaChat ответил {r.status} после {retries} повторов: {error_text[:200]}")
+                    if retry_after is None:
+                        retry_after = settings.ai_retry_base_delay * 2 ** retries * random.uniform(0.5, 1.0)
+                    delay = min(retry_after, settings.ai_retry_max_delay)
+                    retries += 1
+                    logger.warning(f"GigaChat ответил {r.status}, повтор {retries} через {delay:.1f} с")
+                else:
+                    limiter.on_success()
+                    if payload.get("stream"):
+                        data = {"choices": [{"message": {"content": await read_level_stream(r)}}]}
+                    else:
+                        data = await r.json()
+                    metrics.observe("llm", time.perf_counter() - sent_at)
+                    return data
+        # Пауза вне слота: ожидание повтора не занимает место одновременных запросов
+        await asyncio.sleep(delay)
+
+
+def build_payload(results: str, template: str = PROMPT_TEMPLATE) -> dict:
+    """Тело запроса completion для закодированных данных попытки"""
+    payload = {
+        "model": settings.ai_model,
+        # replace, а не format: фигурные скобки в промптах тестов не считаются подстановками
+        "messages": [{"role": "user", "content": template.replace("{results}", results)}],
+    }
+    if settings.ai_max_tokens:
+        # Ответ — одна цифра: длинный ответ обрывается, а не оплачивается целиком
+        payload["max_tokens"] = settings.ai_max_tokens
+    if settings.ai_stream:
+        payload["stream"] = True
+    return payload
+
+
+def parse_level(data: dict) -> int:
+    """Уровень из ответа completion"""
+    try:
+        text = data["choices"][0]["message"]["content"].strip()
+        print(text)
+        return int(text)
+    except Exception as e:
+        raise Exception(f"Ошибка при разборе ответа ИИ: {e}")
 
 
+def ensemble_signature() -> str:
+    """Часть версии промпта в ключе кэша ответов: уровень голосования не смешивается с уровнем одного ответа"""
+    if settings.ai_ensemble_size <= 1:
+        return ""
+    models = ",".join(settings.ai_ensemble_models or [settings.ai_model])
+    return f":ensemble{settings.ai_ensemble_size}:{settings.ai_ensemble_quorum}:{models}:{settings.ai_ensemble_temperature}"
+
+
+async def ensemble_level(payload: dict, placement: QuizPlacement) -> int:
+    """
+    AI_ENSEMBLE_SIZE запросов одновременно (модели AI_ENSEMBLE_MODELS по кругу) и голосование за уровень;
+    запросы идут через общий лимитер, оставшиеся отменяются после кворума
+    """
+    size = settings.ai_ensemble_size
+    quorum = min(settings.ai_ensemble_quorum or ensemble.majority(size), size)
+    models = settings.ai_ensemble_models or [settings.ai_model]
+    calls = []
+    for i in range(size):
+        member = dict(payload, model=models[i % len(models)])
+        if settings.ai_ensemble_temperature:
+            member["temperature"] = settings.ai_ensemble_temperature
+        calls.append((member["model"], functools.partial(request_completion, member)))
+
+    def parse(data: dict) -> Optional[int]:
+        level = parse_level(data)
+        return level if level in placement.courses else None
+
+    with tracing.span("gigachat_ensemble", size=size, quorum=quorum) as span:
+        level, summary = await ensemble.vote(calls, quorum, parse)
+        if span:
+            for key, value in summary.items():
+                span.set(key, value)
+    logger.info(f"Уровень {level} по голосованию: {summary}")
+    return level
+
+
+async def analyze_results(results_json: dict, placement: Optional[QuizPlacement] = None) -> int:
+    print(results_json)
+    """Отправляет результаты теста в нейросеть и получает уровень по шкале теста"""
+    placement = placement or get_placement(results_json.get("quiz_id"))
+    if placement is None:
+        raise Exception(f"Тест {results_json.get('quiz_id')} не настроен для распределения")
+    
+    if placement.fast_path_enabled:
+        level = fast_path.classify(results_json.get("answers", []), placement.fast_path_thresholds, placement.fast_path_weights)
+        if level is not None:
+            logger.info(f"Уровень {level} определён по правилам без запроса к ИИ")
+            return level
+    
+    cache = get_llm_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = make_key(
+            results_json.get("quiz_id"),
+            results_json.get("answers", []),
+            settings.ai_model,
+            f"{placement.prompt_version or PROMPT_VERSION}:{settings.prompt_format}:{settings.prompt_token_budget}"
+            f"{ensemble_signature()}"
+        )
+        cached_level = await cache.get(cache_key)
+        if cached_level is not None:
+            logger.info(f"Уровень {cached_level} взят из кэша ответов ИИ")
+            return cached_level
+    
+    payload = build_payload(
+        encode_results(results_json, settings.prompt_format, settings.prompt_token_budget),
+        placement.prompt or PROMPT_TEMPLATE
+    )
+    if settings.ai_ensemble_size > 1:
+        level = await ensemble_level(payload, placement)
+    else:
+        data = await request_completion(payload)
+        print(
+            f"DEBUG: Тип ответа ИИ: {type(data)}, ключи: {list(data.keys()) if isinstance(data, dict) else 'не dict'}")
+        print(data)
+        level = parse_level(data)
+    
+    if cache is not None and level in placement.courses:
+        await cache.put(cache_key, level)
+    return level
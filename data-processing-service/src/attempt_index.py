@@ -0,0 +1,143 @@
+"""
+Локальный индекс завершённых попыток тестов в SQLite
+
+Хранит последнюю завершённую попытку по (пользователь, тест). Попытки загружаются
+постранично для всего теста и догружаются с курсора (timefinish, id) последней
+полученной попытки, поэтому обновление передаёт только новые попытки, а поиск
+попытки пользователя не требует запроса к Moodle.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Страница попыток после курсора: (quiz_id, since_time, since_id) -> (попытки, есть ли ещё)
+FetchPage = Callable[[int, int, int], Awaitable[Tuple[List[Dict[str, Any]], bool]]]
+
+
+class AttemptIndex:
+    def __init__(self, path: str, max_age: float, fetch_page: FetchPage):
+        self._max_age = max_age
+        self._fetch_page = fetch_page
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._refresh_locks: Dict[int, asyncio.Lock] = {}
+        # Время последнего обновления в этом процессе: после перезапуска индекс сначала догружается
+        self._refreshed_at: Dict[int, float] = {}
+        self.lookups = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.pages = 0
+        self.attempts_loaded = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS attempts (
+                    quiz_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    attempt_id INTEGER NOT NULL,
+                    timefinish INTEGER NOT NULL,
+                    PRIMARY KEY (quiz_id, user_id)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cursors (
+                    quiz_id INTEGER PRIMARY KEY,
+                    since_time INTEGER NOT NULL,
+                    since_id INTEGER NOT NULL
+                )
+                """
+            )
+
+    def _cursor(self, quiz_id: int) -> Tuple[int, int]:
+        with self._lock:
+            row = self._conn.execute("SELECT since_time, since_id FROM cursors WHERE quiz_id = ?", (quiz_id,)).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def _store(self, quiz_id: int, attempts: List[Dict[str, Any]], cursor: Tuple[int, int]):
+        with self._lock, self._conn:
+            # Более ранняя попытка не заменяет уже известную более позднюю
+            self._conn.executemany(
+                """
+                INSERT INTO attempts (quiz_id, user_id, attempt_id, timefinish) VALUES (?, ?, ?, ?)
+                ON CONFLICT (quiz_id, user_id) DO UPDATE SET
+                    attempt_id = excluded.attempt_id, timefinish = excluded.timefinish
+                WHERE excluded.timefinish > attempts.timefinish
+                   OR (excluded.timefinish = attempts.timefinish AND excluded.attempt_id > attempts.attempt_id)
+                """,
+                [(quiz_id, a["userid"], a["id"], a["timefinish"]) for a in attempts],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cursors (quiz_id, since_time, since_id) VALUES (?, ?, ?)",
+                (quiz_id, cursor[0], cursor[1]),
+            )
+
+    def _latest(self, user_id: int, quiz_id: int) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempt_id FROM attempts WHERE quiz_id = ? AND user_id = ?", (quiz_id, user_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _user_ids(self, quiz_id: int) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM attempts WHERE quiz_id = ? ORDER BY timefinish, attempt_id", (quiz_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    async def refresh(self, quiz_id: int, force: bool = False) -> int:
+        """Догружает новые попытки теста, если индекс старше max_age; возвращает число загруженных"""
+        lock = self._refresh_locks.setdefault(quiz_id, asyncio.Lock())
+        async with lock:
+            # Параллельные обращения ждут одно обновление, а не запускают свои
+            if not force and time.monotonic() - self._refreshed_at.get(quiz_id, float("-inf")) < self._max_age:
+                return 0
+            self.refreshes += 1
+            loaded = 0
+            cursor = await asyncio.to_thread(self._cursor, quiz_id)
+            while True:
+                attempts, has_more = await self._fetch_page(quiz_id, *cursor)
+                self.pages += 1
+                if attempts:
+                    last = attempts[-1]
+                    cursor = (last["timefinish"], last["id"])
+                    await asyncio.to_thread(self._store, quiz_id, attempts, cursor)
+                    loaded += len(attempts)
+                if not has_more or not attempts:
+                    break
+            self._refreshed_at[quiz_id] = time.monotonic()
+            self.attempts_loaded += loaded
+            return loaded
+
+    async def latest_attempt(self, user_id: int, quiz_id: int) -> Optional[int]:
+        """Id последней завершённой попытки пользователя или None"""
+        await self.refresh(quiz_id)
+        self.lookups += 1
+        attempt_id = await asyncio.to_thread(self._latest, user_id, quiz_id)
+        if attempt_id is None:
+            self.misses += 1
+        return attempt_id
+
+    async def user_ids(self, quiz_id: int) -> List[int]:
+        """Пользователи с завершёнными попытками теста (в порядке завершения)"""
+        await self.refresh(quiz_id)
+        return await asyncio.to_thread(self._user_ids, quiz_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "pages": self.pages,
+            "attempts_loaded": self.attempts_loaded,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,85 @@
+"""
+Предохранитель (circuit breaker) для внешних сервисов
+
+closed    — запросы проходят, подряд идущие сбои считаются
+open      — после failure_threshold сбоев подряд запросы сразу отклоняются на reset_timeout секунд
+half_open — по истечении reset_timeout пропускается один пробный запрос:
+            успех закрывает предохранитель, сбой снова открывает
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонён: предохранитель открыт"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._trial_started = 0.0
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self._reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_progress = False
+        elif self._state == HALF_OPEN and self._trial_in_progress and now - self._trial_started >= self._reset_timeout:
+            # Пробный запрос отменён, не сообщив результат — разрешаем следующий
+            self._trial_in_progress = False
+        return self._state
+
+    def before_call(self):
+        """Проверяет, можно ли выполнить запрос; иначе CircuitOpenError"""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._trial_in_progress:
+            self._trial_in_progress = True
+            self._trial_started = time.monotonic()
+            return
+        self.rejected += 1
+        retry_in = max(0.0, self._reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(f"{self.name} недоступен (предохранитель открыт, повтор через {retry_in:.0f} с): {self.last_error}")
+
+    def record_success(self):
+        self._state = CLOSED
+        self._trial_in_progress = False
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: str):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self._state == HALF_OPEN or self.consecutive_failures >= self._failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "last_error": self.last_error,
+        }
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List, Literal, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator
 
@@ -13,11 +13,51 @@ class Settings(BaseSettings):
     # AI настройки
     ai_api_url: str = Field(..., description="URL API для анализа результатов", alias="AI_API_URL")
     ai_model: str = Field(default="GigaChat-2", description="Модель AI для анализа", alias="AI_MODEL")
+    ai_stream: bool = Field(default=False, description="Получать ответ ИИ потоком (SSE) и прекращать чтение, когда ответ начинается с уровня", alias="AI_STREAM")
+    ai_max_tokens: int = Field(default=0, ge=0, description="Максимальная длина ответа ИИ в токенах (0 - без ограничения)", alias="AI_MAX_TOKENS")
+    
+    # Голосование нескольких ответов ИИ (self-consistency): AI_ENSEMBLE_SIZE запросов параллельно до кворума
+    ai_ensemble_size: int = Field(default=1, ge=1, le=15, description="Сколько ответов ИИ запрашивать для голосования (1 - один запрос)", alias="AI_ENSEMBLE_SIZE")
+    ai_ensemble_quorum: int = Field(default=0, ge=0, description="Голосов за один уровень, после которых остальные запросы отменяются (0 - большинство)", alias="AI_ENSEMBLE_QUORUM")
+    ai_ensemble_models: List[str] = Field(default=[], description="Модели участников голосования по кругу (пусто - AI_MODEL)", alias="AI_ENSEMBLE_MODELS")
+    ai_ensemble_temperature: float = Field(default=0.0, ge=0, description="Температура запросов голосования (0 - по умолчанию модели)", alias="AI_ENSEMBLE_TEMPERATURE")
+    
+    prompt_format: Literal["json", "compact"] = Field(default="json", description="Формат данных попытки в промпте: json или compact", alias="PROMPT_FORMAT")
+    prompt_token_budget: int = Field(default=0, ge=0, description="Бюджет токенов на данные попытки в компактном формате (0 - без ограничения)", alias="PROMPT_TOKEN_BUDGET")
     
     # GigaChat OAuth настройки
     gigachat_oauth_url: str = Field(..., description="URL OAuth для получения токена GigaChat", alias="GIGACHAT_OAUTH_URL")
     gigachat_authorization_token: str = Field(..., description="Authorization токен для OAuth запроса", alias="GIGACHAT_AUTHORIZATION_TOKEN")
     
+    # Кэш структуры тестов (текст вопроса и правильный ответ разбираются один раз на тест)
+    quiz_structure_cache_enabled: bool = Field(default=True, description="Кэшировать статические части вопросов теста", alias="QUIZ_STRUCTURE_CACHE_ENABLED")
+    quiz_structure_cache_max_entries: int = Field(default=5000, ge=1, description="Максимальное число вопросов в кэше структуры", alias="QUIZ_STRUCTURE_CACHE_MAX_ENTRIES")
+    quiz_structure_cache_ttl: float = Field(default=24 * 3600, gt=0, description="Срок хранения структуры вопроса (секунды)", alias="QUIZ_STRUCTURE_CACHE_TTL")
+    
+    # Движок разбора HTML вопросов review: bs4 (BeautifulSoup) или lxml (быстрее, тот же результат)
+    html_parser_backend: Literal["bs4", "lxml"] = Field(default="bs4", description="Движок разбора HTML вопросов: bs4 или lxml", alias="HTML_PARSER_BACKEND")
+    
+    # Пул разбора HTML review (разбор не блокирует цикл событий)
+    parse_workers: int = Field(default=2, ge=0, description="Размер пула разбора review (0 - разбор в цикле событий)", alias="PARSE_WORKERS")
+    parse_executor: Literal["process", "thread"] = Field(default="process", description="Тип пула разбора: process или thread", alias="PARSE_EXECUTOR")
+    
+    # Ограничение запросов к GigaChat (token bucket + число одновременных запросов, AIMD при 429/5xx)
+    ai_max_rps: float = Field(default=2.0, gt=0, description="Максимальная скорость запросов к ИИ (запросов в секунду)", alias="AI_MAX_RPS")
+    ai_burst: int = Field(default=4, ge=1, description="Допустимый всплеск запросов сверх скорости", alias="AI_BURST")
+    ai_max_concurrency: int = Field(default=4, ge=1, description="Максимум одновременных запросов к ИИ", alias="AI_MAX_CONCURRENCY")
+    ai_min_rps: float = Field(default=0.2, gt=0, description="Нижняя граница скорости при снижении после 429/5xx", alias="AI_MIN_RPS")
+    ai_rps_increase_step: float = Field(default=0.1, ge=0, description="Прирост скорости после каждого успешного ответа", alias="AI_RPS_INCREASE_STEP")
+    ai_rps_decrease_factor: float = Field(default=0.5, gt=0, lt=1, description="Множитель скорости после ответа 429/5xx", alias="AI_RPS_DECREASE_FACTOR")
+    ai_max_retries: int = Field(default=3, ge=0, description="Число повторов запроса к ИИ при 429/5xx", alias="AI_MAX_RETRIES")
+    ai_retry_base_delay: float = Field(default=1.0, ge=0, description="Базовая задержка повтора без Retry-After (секунды)", alias="AI_RETRY_BASE_DELAY")
+    ai_retry_max_delay: float = Field(default=60.0, ge=0, description="Максимальная задержка повтора (секунды)", alias="AI_RETRY_MAX_DELAY")
+    ai_queue_max: int = Field(default=1000, ge=0, description="Максимум запросов в очереди лимитера (0 - без ограничения)", alias="AI_QUEUE_MAX")
+    ai_queue_timeout: float = Field(default=300.0, ge=0, description="Максимальное ожидание слота лимитера (секунды, 0 - без ограничения)", alias="AI_QUEUE_TIMEOUT")
+    
+    # Кэш OAuth-токена GigaChat
+    gigachat_token_refresh_margin: float = Field(default=60.0, ge=0, description="За сколько секунд до истечения обновлять токен", alias="GIGACHAT_TOKEN_REFRESH_MARGIN")
+    gigachat_token_default_ttl: float = Field(default=1800.0, gt=0, description="Срок жизни токена, если OAuth не вернул expires_at (секунды)", alias="GIGACHAT_TOKEN_DEFAULT_TTL")
+    
     # Настройки тестирования
     entry_test_id: int = Field(default=2, description="ID входного теста", alias="ENTRY_TEST_ID")
     
@@ -31,6 +71,101 @@ class Settings(BaseSettings):
         description="Соответствие уровней и курсов"
     )
     
+    # Несколько тестов со своими шкалами уровней, курсами, промптами и правилами (JSON, см. placement.py)
+    placement_config_path: str = Field(default="", description="Файл настроек распределения по тестам (пусто - один тест ENTRY_TEST_ID)", alias="PLACEMENT_CONFIG_PATH")
+    placement_reload_interval: float = Field(default=5.0, ge=0, description="Как часто проверять файл настроек на изменения (секунды, 0 - не перечитывать)", alias="PLACEMENT_RELOAD_INTERVAL")
+    
+    # Настройки пула HTTP-соединений
+    http_pool_size: int = Field(default=100, ge=1, description="Максимальное число соединений в пуле", alias="HTTP_POOL_SIZE")
+    http_pool_per_host: int = Field(default=20, ge=0, description="Максимальное число соединений к одному хосту (0 - без ограничения)", alias="HTTP_POOL_PER_HOST")
+    http_keepalive_timeout: float = Field(default=30.0, gt=0, description="Время жизни простаивающего keep-alive соединения (секунды)", alias="HTTP_KEEPALIVE_TIMEOUT")
+    
+    # Фоновая очередь задач
+    enqueue_mode: bool = Field(default=False, description="Ставить запросы /analyze-and-enroll в очередь и сразу отвечать 202", alias="ENQUEUE_MODE")
+    job_workers: int = Field(default=4, ge=1, description="Число воркеров, обрабатывающих очередь", alias="JOB_WORKERS")
+    job_store_path: str = Field(default="jobs.sqlite3", description="Путь к SQLite-файлу очереди задач", alias="JOB_STORE_PATH")
+    
+    # Пакетная обработка
+    batch_concurrency: int = Field(default=8, ge=1, description="Сколько попыток из пакета обрабатывать одновременно", alias="BATCH_CONCURRENCY")
+    batch_max_items: int = Field(default=500, ge=1, description="Максимальное число попыток в одном пакетном запросе", alias="BATCH_MAX_ITEMS")
+    
+    # Кэш результатов по попыткам
+    result_cache_enabled: bool = Field(default=True, description="Сохранять результаты обработки попыток для идемпотентных ретраев", alias="RESULT_CACHE_ENABLED")
+    result_cache_path: str = Field(default="results.sqlite3", description="Путь к SQLite-файлу кэша результатов", alias="RESULT_CACHE_PATH")
+    result_cache_ttl: float = Field(default=30 * 24 * 3600, gt=0, description="Срок хранения результата (секунды)", alias="RESULT_CACHE_TTL")
+    result_cache_max_entries: int = Field(default=100000, ge=1, description="Максимальное число записей в кэше результатов", alias="RESULT_CACHE_MAX_ENTRIES")
+    
+    # Кэш ответов LLM по содержимому листа ответов
+    llm_cache_enabled: bool = Field(default=True, description="Использовать уровень из кэша для одинаковых наборов ответов", alias="LLM_CACHE_ENABLED")
+    llm_cache_max_entries: int = Field(default=10000, ge=1, description="Максимальное число записей в кэше ответов LLM", alias="LLM_CACHE_MAX_ENTRIES")
+    llm_cache_path: str = Field(default="", description="Путь к SQLite-файлу кэша ответов LLM (пусто - только в памяти)", alias="LLM_CACHE_PATH")
+    
+    # Быстрое определение уровня по правилам (без запроса к ИИ)
+    fast_path_enabled: bool = Field(default=False, description="Определять уровень однозначных попыток по правилам без ИИ", alias="FAST_PATH_ENABLED")
+    fast_path_thresholds: Dict[int, Dict[str, float]] = Field(
+        default={
+            3: {"min_correct": 1.0},   # все ответы верны
+            1: {"max_correct": 0.1},   # почти нет верных ответов (включая пустую попытку)
+        },
+        description="Границы долей правильных/неотвеченных вопросов для каждого уровня",
+        alias="FAST_PATH_THRESHOLDS"
+    )
+    fast_path_weights: Dict[int, float] = Field(
+        default={},
+        description="Веса вопросов по номеру слота (по умолчанию 1.0)",
+        alias="FAST_PATH_WEIGHTS"
+    )
+    
+    # Трассировка этапов обработки (span в формате JSON по строке)
+    tracing_enabled: bool = Field(default=False, description="Записывать span этапов обработки попытки", alias="TRACING_ENABLED")
+    tracing_exporter: Literal["file", "console"] = Field(default="file", description="Куда писать span: file или console (stderr)", alias="TRACING_EXPORTER")
+    tracing_file: str = Field(default="traces.jsonl", description="Файл для span (TRACING_EXPORTER=file)", alias="TRACING_FILE")
+    
+    # Таймауты, повторы и предохранитель для запросов к Moodle
+    moodle_timeout: float = Field(default=15.0, gt=0, description="Таймаут запроса к Moodle по умолчанию (секунды)", alias="MOODLE_TIMEOUT")
+    moodle_timeouts: Dict[str, float] = Field(
+        default={"mod_quiz_get_attempt_review": 30.0, "enrol_manual_enrol_users": 20.0},
+        description="Таймауты по wsfunction (секунды)",
+        alias="MOODLE_TIMEOUTS"
+    )
+    moodle_retry_functions: List[str] = Field(
+        default=["mod_quiz_get_attempt_review", "mod_quiz_get_user_quiz_attempts", "core_webservice_get_site_info"],
+        description="Идемпотентные wsfunction, которые повторяются при сетевых ошибках, таймаутах и 5xx",
+        alias="MOODLE_RETRY_FUNCTIONS"
+    )
+    moodle_max_retries: int = Field(default=3, ge=0, description="Число повторов идемпотентных запросов к Moodle", alias="MOODLE_MAX_RETRIES")
+    moodle_retry_base_delay: float = Field(default=0.5, ge=0, description="Базовая задержка повтора (секунды, растёт экспоненциально)", alias="MOODLE_RETRY_BASE_DELAY")
+    moodle_retry_max_delay: float = Field(default=8.0, ge=0, description="Максимальная задержка повтора (секунды)", alias="MOODLE_RETRY_MAX_DELAY")
+    moodle_breaker_threshold: int = Field(default=5, ge=1, description="Сбоев подряд до открытия предохранителя Moodle", alias="MOODLE_BREAKER_THRESHOLD")
+    moodle_breaker_reset_timeout: float = Field(default=30.0, gt=0, description="Время до пробного запроса после открытия предохранителя (секунды)", alias="MOODLE_BREAKER_RESET_TIMEOUT")
+    
+    # Объединение зачислений в один вызов enrol_manual_enrol_users
+    enroll_batch_size: int = Field(default=1, ge=1, description="Максимум зачислений в одном вызове enrol_manual_enrol_users (1 - по одному, без объединения)", alias="ENROLL_BATCH_SIZE")
+    enroll_batch_window: float = Field(default=0.2, ge=0, description="Сколько копить зачисления, пока предыдущий пакет в пути (секунды)", alias="ENROLL_BATCH_WINDOW")
+    
+    # Индекс завершённых попыток (загружается для всего теста, догружается по timefinish)
+    attempt_index_enabled: bool = Field(default=False, description="Искать попытки пользователей в локальном индексе (нужна функция local_entrance_testing_get_quiz_attempts)", alias="ATTEMPT_INDEX_ENABLED")
+    attempt_index_path: str = Field(default="attempts.sqlite3", description="Путь к SQLite-файлу индекса попыток", alias="ATTEMPT_INDEX_PATH")
+    attempt_index_max_age: float = Field(default=60.0, ge=0, description="Через сколько секунд индекс догружается новыми попытками", alias="ATTEMPT_INDEX_MAX_AGE")
+    attempt_index_page_size: int = Field(default=1000, ge=1, le=5000, description="Попыток в одном запросе к Moodle", alias="ATTEMPT_INDEX_PAGE_SIZE")
+    
+    # Запуск сервера (run_server.py): число процессов, цикл событий, HTTP-парсер, плавная остановка
+    server_host: str = Field(default="0.0.0.0", description="Адрес, на котором слушает сервер", alias="SERVER_HOST")
+    server_port: int = Field(default=8000, ge=1, le=65535, description="Порт сервера", alias="SERVER_PORT")
+    server_workers: int = Field(default=1, ge=1, description="Число процессов сервера", alias="SERVER_WORKERS")
+    server_reload: bool = Field(default=False, description="Перезапуск при изменении кода (для разработки, всегда один процесс)", alias="SERVER_RELOAD")
+    server_loop: Literal["auto", "asyncio", "uvloop"] = Field(default="auto", description="Цикл событий (auto - uvloop, если установлен)", alias="SERVER_LOOP")
+    server_http: Literal["auto", "h11", "httptools"] = Field(default="auto", description="HTTP-парсер (auto - httptools, если установлен)", alias="SERVER_HTTP")
+    server_graceful_timeout: float = Field(default=30.0, ge=0, description="Сколько ждать завершения начатых обработок при остановке (секунды)", alias="SERVER_GRACEFUL_TIMEOUT")
+    
+    # Прогрев процесса сервера в фоне после запуска: /ready отвечает 200, когда все проверки прошли
+    warmup_checks: List[Literal["parse_pool", "gigachat_token", "moodle"]] = Field(
+        default=["parse_pool"],
+        description="Что прогреть до готовности: parse_pool - процессы пула разбора, gigachat_token - токен GigaChat, moodle - соединение с Moodle (пусто - готов сразу)",
+        alias="WARMUP_CHECKS"
+    )
+    warmup_retry_interval: float = Field(default=2.0, gt=0, description="Пауза перед повтором неудавшейся проверки прогрева (секунды)", alias="WARMUP_RETRY_INTERVAL")
+    
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -62,6 +197,22 @@ class Settings(BaseSettings):
             raise ValueError("GIGACHAT_OAUTH_URL должен начинаться с http:// или https://")
         return v.rstrip("/")
     
+    @field_validator("fast_path_thresholds")
+    @classmethod
+    def validate_fast_path_thresholds(cls, v):
+        """Валидация правил быстрого определения уровня"""
+        allowed = {"min_correct", "max_correct", "min_unanswered", "max_unanswered"}
+        for level, rule in v.items():
+            if level < 1 or level > 3:
+                raise ValueError(f"Уровень {level} должен быть от 1 до 3")
+            unknown = set(rule) - allowed
+            if unknown:
+                raise ValueError(f"Неизвестные параметры правила для уровня {level}: {', '.join(sorted(unknown))}")
+            for name, value in rule.items():
+                if value < 0 or value > 1:
+                    raise ValueError(f"Параметр {name} для уровня {level} должен быть от 0 до 1")
+        return v
+    
     @field_validator("courses")
     @classmethod
     def validate_courses(cls, v):
@@ -76,13 +227,44 @@ class Settings(BaseSettings):
         return v
 
 
-# Создаем глобальный экземпляр настроек
-settings = Settings()
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Настройки процесса: .env читается и проверяется при первом обращении, а не при импорте"""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+class LazySettings:
+    """Прокси глобальных настроек: `from config import settings` не создаёт Settings() при импорте модуля"""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
+
+    def __repr__(self):
+        return repr(get_settings())
+
+
+settings = LazySettings()
+
+# Для обратной совместимости переменные модуля вычисляются при обращении
+_LEGACY_NAMES = {
+    "MOODLE_URL": "moodle_url",
+    "MOODLE_TOKEN": "moodle_token",
+    "AI_API_URL": "ai_api_url",
+    "AI_MODEL": "ai_model",
+    "ENTRY_TEST_ID": "entry_test_id",
+    "COURSES": "courses",
+}
+
 
-# Для обратной совместимости экспортируем переменные как раньше
-MOODLE_URL = settings.moodle_url
-MOODLE_TOKEN = settings.moodle_token
-AI_API_URL = settings.ai_api_url
-AI_MODEL = settings.ai_model
-ENTRY_TEST_ID = settings.entry_test_id
-COURSES = settings.courses
\ No newline at end of file
+def __getattr__(name):
+    if name in _LEGACY_NAMES:
+        return getattr(get_settings(), _LEGACY_NAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
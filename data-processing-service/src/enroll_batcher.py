@@ -0,0 +1,125 @@
+"""
+Объединение зачислений в один вызов enrol_manual_enrol_users
+
+Если ни один пакет не отправляется, зачисление уходит сразу; пока пакет в пути,
+новые зачисления копятся не дольше window секунд (и не больше max_size) и отправляются
+одним запросом с массивом enrolments[N]. Ответ пакета передаётся всем его зачислениям:
+исключение "Message was not sent." Moodle возвращает и при успешном зачислении, а null
+означает то же, что и для одиночного вызова. Moodle прерывает весь вызов на первой ошибке,
+поэтому только при настоящем исключении зачисления из пакета повторяются по одному
+(повторное зачисление в Moodle безопасно) и каждый получает свой результат.
+Сетевые ошибки передаются всем ожидающим пакета.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# Отправка списка (user_id, course_id) одним вызовом web-service
+SendFunc = Callable[[List[Tuple[int, int]]], Awaitable[Any]]
+
+# Код ошибки, с которым Moodle отвечает на успешное зачисление (не удалось отправить уведомление)
+MESSAGE_NOT_SENT = "Message was not sent."
+
+logger = logging.getLogger(__name__)
+
+
+def is_error_response(result: Any) -> bool:
+    """Ответ Moodle с исключением, кроме "Message was not sent." (это успешное зачисление)"""
+    return (
+        isinstance(result, dict)
+        and ("exception" in result or "errorcode" in result)
+        and result.get("errorcode") != MESSAGE_NOT_SENT
+    )
+
+
+class EnrollmentBatcher:
+    def __init__(self, send: SendFunc, max_size: int, window: float):
+        self._send = send
+        self._max_size = max(1, max_size)
+        self._window = window
+        self._pending: List[Tuple[int, int, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self.fallback_items = 0
+        self.errors = 0
+
+    async def enroll(self, user_id: int, course_id: int) -> Any:
+        """Ставит зачисление в ближайший пакет и возвращает ответ Moodle для этого пользователя"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_id, course_id, future))
+        self.requests += 1
+        # Без пакетов в пути ждать некого: одиночное зачисление не задерживается на window
+        if len(self._pending) >= self._max_size or not self._tasks:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Отменённые ожидающие в пакет не попадают
+        batch = [item for item in self._pending if not item[2].done()]
+        self._pending = []
+        if batch:
+            task = asyncio.ensure_future(self._send_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send_batch(self, batch: List[Tuple[int, int, asyncio.Future]]):
+        self.batches += 1
+        self.batched_items += len(batch)
+        try:
+            result = await self._send([(user_id, course_id) for user_id, course_id, _ in batch])
+        except Exception as e:
+            self.errors += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if len(batch) == 1 or not is_error_response(result):
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(result)
+            return
+
+        logger.warning(f"Moodle отклонил пакет зачислений из {len(batch)} ({result.get('errorcode')}), повтор по одному")
+        self.fallbacks += 1
+        self.fallback_items += len(batch)
+        results = await asyncio.gather(
+            *(self._send([(user_id, course_id)]) for user_id, course_id, _ in batch),
+            return_exceptions=True
+        )
+        for (_, _, future), single in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(single, Exception):
+                future.set_exception(single)
+            else:
+                future.set_result(single)
+
+    async def close(self):
+        """Отправляет накопленные зачисления и дожидается всех пакетов"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "fallback_items": self.fallback_items,
+            "errors": self.errors,
+        }
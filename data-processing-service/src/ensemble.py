@@ -0,0 +1,125 @@
+"""
+Голосование нескольких ответов ИИ за уровень (self-consistency)
+
+Все запросы отправляются одновременно (каждый проходит через общий лимитер GigaChat);
+как только за один уровень набирается кворум, оставшиеся запросы отменяются. Если кворум
+не набран, выбирается уровень с большинством голосов (при равенстве — меньший уровень).
+Ошибки и ответы без корректного уровня голосами не считаются.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+stats = {
+    "runs": 0,
+    "decided": 0,
+    "requested": 0,
+    "completed": 0,
+    "cancelled": 0,
+    "failed": 0,
+    "invalid": 0,
+    "early_stops": 0,
+    "unanimous": 0,
+    "no_quorum": 0,
+    "agreement_sum": 0.0,
+    # Голоса по моделям и сколько из них совпало с итоговым уровнем
+    "models": {},
+}
+
+
+def majority(size: int) -> int:
+    return size // 2 + 1
+
+
+def choose(votes: Counter) -> int:
+    """Уровень с наибольшим числом голосов; при равенстве — меньший"""
+    return min(votes, key=lambda level: (-votes[level], level))
+
+
+async def vote(
+    calls: List[Tuple[str, Callable[[], Awaitable[Any]]]],
+    quorum: int,
+    parse: Callable[[Any], Optional[int]],
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Запускает calls (метка модели, запрос) параллельно и возвращает (уровень, сводка голосования)
+    parse превращает ответ в уровень или None для некорректного ответа
+    """
+    tasks = {asyncio.ensure_future(call()): label for label, call in calls}
+    pending = set(tasks)
+    votes: Counter = Counter()
+    ballots: List[Tuple[str, int]] = []
+    errors: List[BaseException] = []
+    invalid = 0
+    winner = None
+    stats["runs"] += 1
+    stats["requested"] += len(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    level = parse(task.result())
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if level is None:
+                    invalid += 1
+                    continue
+                votes[level] += 1
+                ballots.append((tasks[task], level))
+            if votes:
+                leader = choose(votes)
+                if votes[leader] >= quorum:
+                    winner = leader
+    finally:
+        # Отмена освобождает слоты лимитера и соединения; дожидаемся, чтобы они вернулись до выхода
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    stats["completed"] += len(tasks) - len(pending)
+    stats["cancelled"] += len(pending)
+    stats["failed"] += len(errors)
+    stats["invalid"] += invalid
+    if winner is None:
+        if not votes:
+            if errors:
+                raise errors[0]
+            raise Exception(f"Ни один из {len(tasks)} ответов ИИ не содержит корректного уровня")
+        winner = choose(votes)
+        stats["no_quorum"] += 1
+    elif pending:
+        stats["early_stops"] += 1
+
+    stats["decided"] += 1
+    total = sum(votes.values())
+    agreement = votes[winner] / total
+    if votes[winner] == total:
+        stats["unanimous"] += 1
+    stats["agreement_sum"] += agreement
+    for label, level in ballots:
+        model = stats["models"].setdefault(label, {"votes": 0, "agreed": 0})
+        model["votes"] += 1
+        model["agreed"] += int(level == winner)
+
+    return winner, {
+        "votes": dict(votes),
+        "agreement": round(agreement, 3),
+        "completed": len(tasks) - len(pending),
+        "cancelled": len(pending),
+        "failed": len(errors),
+        "invalid": invalid,
+    }
+
+
+def summary() -> Dict[str, Any]:
+    """Счётчики голосований для /stats и /metrics"""
+    decided = stats["decided"]
+    return {
+        **{k: v for k, v in stats.items() if k not in ("agreement_sum", "models")},
+        "agreement_avg": round(stats["agreement_sum"] / decided, 3) if decided else 0.0,
+        "models": stats["models"],
+    }
@@ -0,0 +1,74 @@
+"""
+Быстрое определение уровня по правилам для однозначных попыток
+Попытки, не подпадающие ни под одно правило, передаются на анализ в ИИ
+"""
+
+from typing import Any, Dict, List, Optional
+
+# Состояния вопроса Moodle, означающие отсутствие ответа
+UNANSWERED_STATES = ("gaveup", "noanswer", "todo", "notanswered")
+
+# Доля правильности по состоянию вопроса
+STATE_CORRECTNESS = {
+    "gradedright": 1.0,
+    "correct": 1.0,
+    "gradedpartial": 0.5,
+    "partiallycorrect": 0.5,
+    "gradedwrong": 0.0,
+    "wrong": 0.0,
+}
+
+stats = {
+    "llm_calls_avoided": 0,
+    "escalated": 0,
+    "by_level": {},
+}
+
+
+def summarize(answers: List[Dict[str, Any]], weights: Dict[int, float]) -> Optional[Dict[str, float]]:
+    """Считает взвешенные доли правильных и неотвеченных вопросов"""
+    total = correct = unanswered = 0.0
+    for a in answers:
+        weight = weights.get(a.get("slot"), 1.0)
+        if weight <= 0:
+            continue
+        state = (a.get("state") or "").lower()
+        total += weight
+        if state in UNANSWERED_STATES or a.get("student_answer") == "не ответил":
+            unanswered += weight
+        elif state in STATE_CORRECTNESS:
+            correct += weight * STATE_CORRECTNESS[state]
+        elif a.get("score", 0.0) > 0:
+            # Неизвестное состояние — ориентируемся на балл
+            correct += weight
+    if total == 0:
+        return None
+    return {"correct": correct / total, "unanswered": unanswered / total}
+
+
+def matches(summary: Dict[str, float], rule: Dict[str, float]) -> bool:
+    """Проверяет, попадает ли попытка в границы правила"""
+    return (
+        summary["correct"] >= rule.get("min_correct", 0.0)
+        and summary["correct"] <= rule.get("max_correct", 1.0)
+        and summary["unanswered"] >= rule.get("min_unanswered", 0.0)
+        and summary["unanswered"] <= rule.get("max_unanswered", 1.0)
+    )
+
+
+def classify(answers: List[Dict[str, Any]], thresholds: Dict[int, Dict[str, float]], weights: Dict[int, float]) -> Optional[int]:
+    """Возвращает уровень, если ровно одно правило однозначно подходит, иначе None"""
+    summary = summarize(answers, weights)
+    if summary is None:
+        stats["escalated"] += 1
+        return None
+
+    levels = [level for level, rule in thresholds.items() if matches(summary, rule)]
+    if len(levels) != 1:
+        stats["escalated"] += 1
+        return None
+
+    level = levels[0]
+    stats["llm_calls_avoided"] += 1
+    stats["by_level"][level] = stats["by_level"].get(level, 0) + 1
+    return level
@@ -7,23 +7,166 @@ FastAPI сервер для обработки запросов от Moodle мо
 import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Union
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
-import uvicorn
 
-from moodle_api import get_latest_attempt, get_attempt_review, enroll_user_to_course
-from ai_analyzer import analyze_results
+from moodle_api import (
+    get_latest_attempt, get_attempt_review, enroll_user_to_course, get_structure_cache, get_breaker,
+    get_enroll_batcher, close_enroll_batcher, enrollment_succeeded, post_ws
+)
+from ai_analyzer import analyze_results, get_token_cache, get_llm_cache, get_rate_limiter, start_ai_clients, close_ai_clients
+import ensemble
+import fast_path
 from config import settings
+from placement import QuizPlacement, get_placement, get_placement_registry, start_placement_watcher, close_placement_watcher
+from http_client import start_http_client, close_http_client, pool_stats as http_pool_stats
+import metrics
+import tracing
+from parse_pool import start_parse_pool, close_parse_pool, invalidate_worker_caches, pool_stats, wait_parse_pool
+from warmup import get_warmup, start_warmup, close_warmup
+from job_queue import JobStore, JobQueue
+from result_cache import ResultCache
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Очередь фоновых задач и кэш результатов (создаются в lifespan)
+job_queue: Optional[JobQueue] = None
+result_cache: Optional[ResultCache] = None
+
+# Запущенные обработки по (user_id, attempt_id): параллельные запросы по одной попытке ждут одну обработку
+_inflight: Dict[tuple, asyncio.Future] = {}
+inflight_joins = 0
+
+
+def _breaker_metrics() -> Dict[str, Any]:
+    stats = get_breaker().stats()
+    return {"open": stats["state"] != "closed", "failures": stats["failures"], "rejected": stats["rejected"]}
+
+
+# Состояние компонентов для /metrics (читается только при сборе метрик)
+metrics.sources.register("http_pool", http_pool_stats)
+metrics.sources.register("llm_limiter", lambda: get_rate_limiter().stats())
+metrics.sources.register("moodle_circuit", _breaker_metrics)
+metrics.sources.register("ai_ensemble", ensemble.summary)
+metrics.sources.register("parse_pool", pool_stats)
+metrics.sources.register("enroll_batcher", lambda: get_enroll_batcher().stats() if get_enroll_batcher() else {})
+metrics.sources.register("jobs", lambda: {"pending": job_queue.stats()["pending"]} if job_queue else {})
+metrics.sources.register("placement", lambda: {
+    "quizzes": len(get_placement_registry().quiz_ids()),
+    "reloads": get_placement_registry().reloads,
+    "reload_errors": get_placement_registry().reload_errors,
+})
+metrics.sources.register("inflight", lambda: {"running": len(_inflight), "joined": inflight_joins})
+metrics.sources.register("warmup", lambda: {
+    "ready": get_warmup().ready,
+    "ready_after_seconds": get_warmup().ready_after,
+} if get_warmup() else {})
+
+
+async def run_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Обработчик задачи из очереди: запускает полный цикл анализа и зачисления"""
+    response = await process_test_completion(TestCompletionRequest(**payload))
+    return response.model_dump()
+
+
+async def warm_up_moodle():
+    """Открывает соединение с Moodle и проверяет токен web-service"""
+    result = await post_ws({
+        "wstoken": settings.moodle_token,
+        "wsfunction": "core_webservice_get_site_info",
+        "moodlewsrestformat": "json",
+    })
+    if isinstance(result, dict) and "exception" in result:
+        raise Exception(result.get("message") or result.get("errorcode"))
+
+
+WARMUP_CHECKS = {
+    "parse_pool": wait_parse_pool,
+    "gigachat_token": lambda: get_token_cache().get(),
+    "moodle": warm_up_moodle,
+}
+
+
+async def drain_pipelines(timeout: float):
+    """
+    Ждёт завершения обработок, начатых до остановки (в том числе тех, чей клиент уже отключился)
+    Незавершённые за timeout секунд обработки отменяются; timeout=0 — отменить сразу, не дожидаясь
+    """
+    pending = list(_inflight.values())
+    if not pending:
+        return
+    not_done = set(pending)
+    if timeout > 0:
+        logger.info(f"Ожидание завершения обработок: {len(pending)} (не дольше {timeout} с)")
+        _, not_done = await asyncio.wait(pending, timeout=timeout)
+    if not_done:
+        logger.warning(f"Не дождались завершения обработок, отменяем: {len(not_done)}")
+        for task in not_done:
+            task.cancel()
+        await asyncio.gather(*not_done, return_exceptions=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Создаёт ресурсы процесса при старте и корректно освобождает их при остановке
+    При нескольких процессах сервера у каждого свои пул HTTP, кэш токена, лимитер и очередь задач
+    """
+    global job_queue, result_cache
+    registry = start_placement_watcher()
+    logger.info(f"Распределяемые тесты: {registry.quiz_ids()}")
+    await start_http_client()
+    start_ai_clients()
+    logger.info(
+        f"HTTP пул инициализирован: limit={settings.http_pool_size}, "
+        f"per_host={settings.http_pool_per_host}, keepalive={settings.http_keepalive_timeout}s"
+    )
+    if settings.result_cache_enabled:
+        result_cache = ResultCache(
+            settings.result_cache_path,
+            settings.result_cache_ttl,
+            settings.result_cache_max_entries
+        )
+    if start_parse_pool():
+        logger.info(f"Пул разбора review запущен: {settings.parse_executor}, воркеров={settings.parse_workers}")
+    job_store = JobStore(settings.job_store_path)
+    job_queue = JobQueue(job_store, run_job, settings.job_workers)
+    # При нескольких процессах прерванные задачи возвращает в очередь run_server.py до их запуска
+    await job_queue.start(requeue_running=settings.server_workers == 1)
+    logger.info(f"Очередь задач запущена: воркеров={settings.job_workers}, хранилище={settings.job_store_path}")
+    # Прогрев идёт в фоне: процесс принимает запросы сразу, /ready отвечает 200 после прогрева
+    start_warmup({name: WARMUP_CHECKS[name] for name in settings.warmup_checks}, settings.warmup_retry_interval)
+    try:
+        yield
+    finally:
+        await close_warmup()
+        await drain_pipelines(settings.server_graceful_timeout)
+        await close_placement_watcher()
+        await job_queue.stop()
+        await close_enroll_batcher()
+        job_store.close()
+        job_queue = None
+        if result_cache:
+            result_cache.close()
+            result_cache = None
+        close_ai_clients()
+        close_parse_pool()
+        tracing.close_tracing()
+        await close_http_client()
+        metrics.mark_process_dead()
+        logger.info("HTTP пул закрыт")
+
+
 app = FastAPI(
     title="Moodle Entrance Testing API",
     description="API для автоматического анализа результатов входного теста и зачисления студентов",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -33,6 +176,7 @@ class TestCompletionRequest(BaseModel):
     quiz_id: int = Field(..., description="ID теста")
     attempt_id: int = Field(..., description="ID попытки")
     course_id: Optional[int] = Field(None, description="ID курса (опционально)")
+    traceparent: Optional[str] = Field(None, description="Контекст трассировки W3C (задаётся плагином по id записи очереди)")
 
 
 class TestCompletionResponse(BaseModel):
@@ -45,6 +189,44 @@ class TestCompletionResponse(BaseModel):
     error: Optional[str] = Field(None, description="Описание ошибки, если есть")
 
 
+class JobAcceptedResponse(BaseModel):
+    """Модель ответа при постановке запроса в очередь"""
+    success: bool = Field(..., description="Запрос принят в обработку")
+    message: str = Field(..., description="Сообщение о результате")
+    user_id: int = Field(..., description="ID пользователя")
+    job_id: str = Field(..., description="ID задачи в очереди")
+    status: str = Field(..., description="Статус задачи")
+
+
+class BatchCompletionRequest(BaseModel):
+    """Модель пакетного запроса от Moodle модуля"""
+    items: List[TestCompletionRequest] = Field(..., min_length=1, description="Попытки для обработки")
+
+
+class BatchItemResponse(TestCompletionResponse):
+    """Результат обработки одной попытки из пакета"""
+    attempt_id: int = Field(..., description="ID попытки")
+    job_id: Optional[str] = Field(None, description="ID задачи в очереди (в режиме ENQUEUE_MODE)")
+
+
+class BatchCompletionResponse(BaseModel):
+    """Модель ответа на пакетный запрос"""
+    total: int = Field(..., description="Количество попыток в запросе")
+    succeeded: int = Field(..., description="Количество успешно обработанных попыток")
+    results: List[BatchItemResponse] = Field(..., description="Результаты в порядке запроса")
+
+
+class JobStatusResponse(BaseModel):
+    """Модель ответа со статусом задачи"""
+    job_id: str = Field(..., description="ID задачи")
+    status: str = Field(..., description="Статус задачи: queued / running / done / failed")
+    attempt_id: Optional[int] = Field(None, description="ID попытки")
+    result: Optional[TestCompletionResponse] = Field(None, description="Результат обработки")
+    error: Optional[str] = Field(None, description="Описание ошибки, если есть")
+    created_at: float = Field(..., description="Время постановки в очередь (unix time)")
+    updated_at: float = Field(..., description="Время последнего изменения статуса (unix time)")
+
+
 def format_attempt_for_ai(user_id: int, quiz_id: int, attempt_id: int, review_data: Dict[str, Any]) -> Dict[str, Any]:
     """Форматирует данные для отправки в ИИ"""
     questions = review_data.get("questions", [])
@@ -69,111 +251,283 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Проверка здоровья API"""
-    return {"status": "healthy", "service": "moodle-entrance-testing"}
+    """Проверка здоровья API; при открытом предохранителе Moodle статус degraded"""
+    moodle = get_breaker().stats()
+    return {
+        "status": "healthy" if moodle["state"] == "closed" else "degraded",
+        "service": "moodle-entrance-testing",
+        "moodle": moodle,
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Готовность к приёму трафика: 503, пока процесс не прогрет или останавливается"""
+    warmup = get_warmup()
+    if warmup is None or not warmup.ready:
+        return JSONResponse(status_code=503, content={
+            "status": "stopping" if warmup and warmup.stopping else "warming_up",
+            "pending": warmup.pending() if warmup else [],
+        })
+    return {"status": "ready", "ready_after": warmup.ready_after}
+
+
+@app.get("/stats")
+async def stats():
+    """Счётчики внутренних кэшей сервиса"""
+    return {
+        "gigachat_token": get_token_cache().stats(),
+        "gigachat_limiter": get_rate_limiter().stats(),
+        "jobs": job_queue.stats() if job_queue else None,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "llm_cache": get_llm_cache().stats() if settings.llm_cache_enabled else None,
+        "fast_path": fast_path.stats,
+        "ai_ensemble": ensemble.summary() if settings.ai_ensemble_size > 1 else None,
+        "placement": get_placement_registry().stats(),
+        "inflight": {"running": len(_inflight), "joined": inflight_joins},
+        "quiz_structure_cache": get_structure_cache().stats() if settings.quiz_structure_cache_enabled else None,
+        "parse_pool": pool_stats(),
+        "enroll_batcher": get_enroll_batcher().stats() if get_enroll_batcher() else None,
+        "warmup": get_warmup().stats() if get_warmup() else None,
+    }
 
 
-@app.post("/analyze-and-enroll", response_model=TestCompletionResponse)
-async def analyze_and_enroll(request: TestCompletionRequest):
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Метрики в формате Prometheus"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@app.post("/cache/quiz-structure/invalidate")
+async def invalidate_quiz_structure(quiz_id: Optional[int] = None):
+    """Сбрасывает кэш структуры теста (после редактирования теста); без quiz_id — для всех тестов"""
+    cache = get_structure_cache()
+    removed = cache.invalidate(quiz_id) if cache else 0
+    # Процессы пула разбора держат свои копии кэша — они очищаются целиком
+    invalidate_worker_caches()
+    logger.info(f"Кэш структуры сброшен для теста {quiz_id if quiz_id is not None else '(все)'}: удалено {removed}")
+    return {"quiz_id": quiz_id, "removed": removed}
+
+
+@app.post("/placement/reload")
+async def reload_placement():
+    """
+    Перечитывает файл настроек распределения в этом процессе (остальные процессы сервера
+    перечитают его сами в течение PLACEMENT_RELOAD_INTERVAL)
+    """
+    if not settings.placement_config_path:
+        raise HTTPException(status_code=400, detail="PLACEMENT_CONFIG_PATH не задан")
+    registry = get_placement_registry()
+    try:
+        await asyncio.to_thread(registry.reload)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Настройки не применены: {e}")
+    logger.info(f"Настройки распределения перечитаны: тесты {registry.quiz_ids()}")
+    return registry.stats()
+
+
+def wrong_quiz_response(request: TestCompletionRequest) -> TestCompletionResponse:
+    """Ответ на попытку теста, которого нет в настройках распределения"""
+    quiz_ids = get_placement_registry().quiz_ids()
+    logger.warning(f"Получен запрос для теста {request.quiz_id}, но распределяются только тесты {quiz_ids}")
+    return TestCompletionResponse(
+        success=False,
+        message=f"Тест {request.quiz_id} не настроен для распределения (тесты: {', '.join(map(str, quiz_ids))})",
+        user_id=request.user_id,
+        error=f"Неверный ID теста: {request.quiz_id}"
+    )
+
+
+@app.post(
+    "/analyze-and-enroll",
+    response_model=TestCompletionResponse,
+    responses={202: {"model": JobAcceptedResponse, "description": "Запрос поставлен в очередь (ENQUEUE_MODE)"}}
+)
+async def analyze_and_enroll(request: TestCompletionRequest, traceparent: Optional[str] = Header(None)):
     """
     Основной endpoint для анализа результатов теста и зачисления студента
     
     Moodle модуль отправляет сюда данные о завершенном тесте,
-    API анализирует результаты через ИИ и зачисляет студента на соответствующий курс
+    API анализирует результаты через ИИ и зачисляет студента на соответствующий курс.
+    В режиме ENQUEUE_MODE запрос сохраняется в очередь и сразу возвращается 202 с ID задачи.
     """
+    if traceparent and not request.traceparent:
+        request.traceparent = traceparent
+    if settings.enqueue_mode:
+        return await enqueue_test_completion(request)
+    return await process_test_completion(request)
+
+
+async def enqueue_test_completion(request: TestCompletionRequest) -> JSONResponse:
+    """Проверяет запрос, сохраняет задачу в очередь и возвращает 202"""
+    if get_placement(request.quiz_id) is None:
+        return JSONResponse(status_code=200, content=wrong_quiz_response(request).model_dump())
+
+    job = await job_queue.enqueue(request.model_dump())
+    logger.info(f"Попытка {request.attempt_id} пользователя {request.user_id} поставлена в очередь, задача {job['id']}")
+    return JSONResponse(status_code=202, content=JobAcceptedResponse(
+        success=True,
+        message="Запрос принят в обработку",
+        user_id=request.user_id,
+        job_id=job["id"],
+        status=job["status"]
+    ).model_dump())
+
+
+@app.post("/analyze-and-enroll/batch", response_model=BatchCompletionResponse)
+async def analyze_and_enroll_batch(batch: BatchCompletionRequest):
+    """
+    Пакетный endpoint: обрабатывает несколько попыток за один запрос
+    
+    Попытки обрабатываются параллельно, но не более BATCH_CONCURRENCY одновременно.
+    Ошибка в одной попытке не влияет на остальные.
+    """
+    if len(batch.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много попыток в пакете: {len(batch.items)} (максимум {settings.batch_max_items})"
+        )
+
+    logger.info(f"Получен пакет из {len(batch.items)} попыток")
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def process_item(item: TestCompletionRequest) -> BatchItemResponse:
+        if settings.enqueue_mode and get_placement(item.quiz_id) is not None:
+            job = await job_queue.enqueue(item.model_dump())
+            return BatchItemResponse(
+                success=True,
+                message="Запрос принят в обработку",
+                user_id=item.user_id,
+                attempt_id=item.attempt_id,
+                job_id=job["id"]
+            )
+        async with semaphore:
+            response = await process_test_completion(item)
+        return BatchItemResponse(attempt_id=item.attempt_id, **response.model_dump())
+
+    results = await asyncio.gather(*(process_item(item) for item in batch.items))
+    return BatchCompletionResponse(
+        total=len(results),
+        succeeded=sum(1 for r in results if r.success),
+        results=results
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Статус задачи из очереди"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Задача {job_id} не найдена")
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        attempt_id=job["attempt_id"],
+        result=json.loads(job["result"]) if job["result"] else None,
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
+
+
+async def process_test_completion(request: TestCompletionRequest) -> TestCompletionResponse:
+    """Полный цикл обработки попытки; параллельные запросы по одной попытке разделяют одну обработку"""
+    global inflight_joins
+    key = (request.user_id, request.attempt_id)
+    task = _inflight.get(key)
+    if task is None:
+        # Задача наследует контекст трассировки запроса
+        tracing.start_trace(request.traceparent)
+        task = asyncio.ensure_future(run_pipeline(request))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        inflight_joins += 1
+        logger.info(f"Попытка {request.attempt_id} уже обрабатывается, ожидаем результат")
+    # shield: отмена одного из ожидающих запросов не прерывает общую обработку
+    return await asyncio.shield(task)
+
+
+async def run_pipeline(request: TestCompletionRequest) -> TestCompletionResponse:
+    """Обработка попытки с замером общей длительности"""
+    with metrics.PIPELINE_IN_FLIGHT.track_inprogress(), metrics.stage("total"), \
+            tracing.span("analyze_and_enroll", user_id=request.user_id, attempt_id=request.attempt_id) as span:
+        response = await _run_pipeline(request)
+        if span:
+            span.set("success", response.success)
+            span.set("level", response.level)
+        return response
+
+
+async def _run_pipeline(request: TestCompletionRequest) -> TestCompletionResponse:
+    """Получение review, анализ через ИИ и зачисление на курс с использованием кэша результатов"""
     try:
         logger.info(f"Получен запрос на анализ для пользователя {request.user_id}, попытка {request.attempt_id}")
         
-        # Проверяем, что это наш входной тест
-        if request.quiz_id != settings.entry_test_id:
-            logger.warning(f"Получен запрос для теста {request.quiz_id}, но ожидается {settings.entry_test_id}")
-            return TestCompletionResponse(
-                success=False,
-                message=f"Этот API предназначен только для входного теста (ID: {settings.entry_test_id})",
-                user_id=request.user_id,
-                error=f"Неверный ID теста: {request.quiz_id}"
-            )
+        # Настройки теста (шкала уровней, курсы, промпт) — из реестра распределения
+        placement = get_placement(request.quiz_id)
+        if placement is None:
+            metrics.outcome("wrong_quiz")
+            return wrong_quiz_response(request)
         
-        # Получаем детальную информацию о попытке
-        logger.info(f"Получение детальной информации о попытке {request.attempt_id}")
-        review = await get_attempt_review(request.attempt_id)
+        cached = await result_cache.get(request.attempt_id, request.user_id) if result_cache else None
+        if cached and cached["enrolled"]:
+            logger.info(f"Попытка {request.attempt_id} уже обработана, возвращаем сохранённый результат")
+            metrics.outcome("cached")
+            return TestCompletionResponse(**cached["response"])
         
-        if not review or not review.get("questions"):
-            logger.error(f"Не удалось получить данные о попытке {request.attempt_id}")
-            return TestCompletionResponse(
-                success=False,
-                message="Не удалось получить данные о попытке теста",
-                user_id=request.user_id,
-                error="Отсутствуют данные о попытке"
-            )
-        
-        # Форматируем данные для ИИ
-        results_json = format_attempt_for_ai(
-            request.user_id, 
-            request.quiz_id, 
-            request.attempt_id, 
-            review
-        )
-        logger.info(f"Отправка данных в ИИ для анализа пользователя {request.user_id}")
-        
-        # Анализируем результаты через ИИ
-        level = await analyze_results(results_json)
-
-        if not level or level not in settings.courses:
-            logger.error(f"ИИ вернул неверный уровень {level} для пользователя {request.user_id}")
-            return TestCompletionResponse(
-                success=False,
-                message=f"Не удалось определить корректный уровень студента (получен: {level})",
-                user_id=request.user_id,
-                level=level,
-                error="Некорректный уровень от ИИ"
-            )
+        if cached and cached["level"] in placement.courses:
+            # Уровень уже определён, но зачисление не удалось — повторяем только зачисление
+            level = cached["level"]
+            logger.info(f"Для попытки {request.attempt_id} уровень {level} взят из кэша")
+        else:
+            level = await determine_level(request, placement)
+            if isinstance(level, TestCompletionResponse):
+                return level
         
         # Определяем курс для зачисления
-        course_id = settings.courses[level]
+        course_id = placement.courses[level]
+        if result_cache and not cached:
+            await result_cache.put_level(request.attempt_id, request.user_id, level, course_id)
         
         logger.info(f"Зачисление пользователя {request.user_id} на уровень {level}, курс {course_id}")
         
         # Зачисляем студента на курс
         enrollment_result = await enroll_user_to_course(request.user_id, course_id)
 
-        if enrollment_result:
-            # Moodle возвращает "Message was not sent." даже при успешном зачислении
-            if enrollment_result.get("errorcode") == "Message was not sent.":
-                logger.info(f"Пользователь {request.user_id} успешно зачислен на курс {course_id} (Moodle: сообщение не отправлено)")
-                return TestCompletionResponse(
-                    success=True,
-                    message=f"Студент успешно зачислен на уровень {level}, курс {course_id}",
-                    user_id=request.user_id,
-                    level=level,
-                    course_id=course_id
-                )
-
-            # Если ответ не содержит этого кода — значит, произошла ошибка
-            logger.error(f"Ошибка зачисления пользователя {request.user_id}: {enrollment_result}")
-            error_msg = enrollment_result.get("message", "Неизвестная ошибка")
-            return TestCompletionResponse(
-                success=False,
-                message=f"Не удалось зачислить студента на курс {course_id}",
+        if enrollment_succeeded(enrollment_result):
+            logger.info(f"Пользователь {request.user_id} успешно зачислен на курс {course_id}")
+            response = TestCompletionResponse(
+                success=True,
+                message=f"Студент успешно зачислен на уровень {level}, курс {course_id}",
                 user_id=request.user_id,
                 level=level,
-                course_id=course_id,
-                error=error_msg
+                course_id=course_id
             )
+            if result_cache:
+                await result_cache.put_result(request.attempt_id, request.user_id, level, course_id, response.model_dump())
+            metrics.outcome("success")
+            return response
 
+        if isinstance(enrollment_result, dict) and enrollment_result:
+            logger.error(f"Ошибка зачисления пользователя {request.user_id}: {enrollment_result}")
+            error_msg = enrollment_result.get("message", "Неизвестная ошибка")
         else:
-            logger.error(f"Пустой ответ от Moodle при зачислении пользователя {request.user_id}")
-            return TestCompletionResponse(
-                success=False,
-                message=f"Не удалось зачислить студента на курс {course_id}",
-                user_id=request.user_id,
-                level=level,
-                course_id=course_id,
-                error="Пустой ответ от Moodle API"
-            )
+            logger.error(f"Пустой ответ от Moodle при зачислении пользователя {request.user_id}: {enrollment_result!r}")
+            error_msg = "Пустой ответ от Moodle API"
+        metrics.outcome("enroll_error")
+        return TestCompletionResponse(
+            success=False,
+            message=f"Не удалось зачислить студента на курс {course_id}",
+            user_id=request.user_id,
+            level=level,
+            course_id=course_id,
+            error=error_msg
+        )
             
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса для пользователя {request.user_id}: {str(e)}")
+        metrics.outcome("error")
         return TestCompletionResponse(
             success=False,
             message="Внутренняя ошибка сервера",
@@ -182,6 +536,48 @@ async def analyze_and_enroll(request: TestCompletionRequest):
         )
 
 
+async def determine_level(request: TestCompletionRequest, placement: QuizPlacement) -> Union[int, TestCompletionResponse]:
+    """Получает review попытки и определяет уровень через ИИ; при ошибке возвращает готовый ответ"""
+    # Получаем детальную информацию о попытке
+    logger.info(f"Получение детальной информации о попытке {request.attempt_id}")
+    review = await get_attempt_review(request.attempt_id)
+    
+    if not review or not review.get("questions"):
+        logger.error(f"Не удалось получить данные о попытке {request.attempt_id}")
+        metrics.outcome("review_error")
+        return TestCompletionResponse(
+            success=False,
+            message="Не удалось получить данные о попытке теста",
+            user_id=request.user_id,
+            error="Отсутствуют данные о попытке"
+        )
+    
+    # Форматируем данные для ИИ
+    results_json = format_attempt_for_ai(
+        request.user_id, 
+        request.quiz_id, 
+        request.attempt_id, 
+        review
+    )
+    logger.info(f"Отправка данных в ИИ для анализа пользователя {request.user_id}")
+    
+    # Анализируем результаты через ИИ
+    level = await analyze_results(results_json, placement)
+
+    if not level or level not in placement.courses:
+        logger.error(f"ИИ вернул неверный уровень {level} для пользователя {request.user_id}")
+        metrics.outcome("bad_level")
+        return TestCompletionResponse(
+            success=False,
+            message=f"Не удалось определить корректный уровень студента (получен: {level})",
+            user_id=request.user_id,
+            level=level,
+            error="Некорректный уровень от ИИ"
+        )
+    
+    return level
+
+
 @app.post("/test-connection")
 async def test_connection():
     """Тестовый endpoint для проверки соединения с Moodle"""
@@ -213,15 +609,5 @@ async def test_connection():
 
 
 if __name__ == "__main__":
-    logger.info("Запуск FastAPI сервера для Moodle Entrance Testing")
-    logger.info(f"Moodle URL: {settings.moodle_url}")
-    logger.info(f"Entry Test ID: {settings.entry_test_id}")
-    logger.info(f"Courses mapping: {settings.courses}")
-    
-    uvicorn.run(
-        "fastapi_server:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    from run_server import main
+    main()
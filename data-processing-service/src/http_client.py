@@ -0,0 +1,63 @@
+"""
+Общий HTTP-клиент с пулом соединений для запросов к Moodle и GigaChat
+"""
+
+from typing import Dict, Optional
+from config import settings
+
+# Модуль aiohttp: импортируется один раз при создании первой сессии (в lifespan или при первом
+# запросе CLI), а не при импорте; остальные модули обращаются к нему как http_client.aiohttp
+aiohttp = None
+_session: Optional["aiohttp.ClientSession"] = None
+
+
+def _create_session() -> "aiohttp.ClientSession":
+    """Создаёт сессию с пулом keep-alive соединений"""
+    global aiohttp
+    if aiohttp is None:
+        import aiohttp
+    connector = aiohttp.TCPConnector(
+        limit=settings.http_pool_size,
+        limit_per_host=settings.http_pool_per_host,
+        keepalive_timeout=settings.http_keepalive_timeout,
+        ttl_dns_cache=300,
+        ssl=False,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def start_http_client() -> "aiohttp.ClientSession":
+    """Инициализирует общую сессию (вызывается из lifespan приложения)"""
+    return get_session()
+
+
+def get_session() -> "aiohttp.ClientSession":
+    """Возвращает общую сессию, создавая её при первом обращении (например, из CLI)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def close_http_client():
+    """Закрывает общую сессию и все соединения пула"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def pool_stats() -> Dict[str, int]:
+    """Состояние пула соединений: лимиты, занятые и свободные keep-alive соединения"""
+    if _session is None or _session.closed:
+        return {}
+    connector = _session.connector
+    # aiohttp не публикует счётчики пула — читаем внутренние структуры коннектора
+    acquired = getattr(connector, "_acquired", ())
+    idle = getattr(connector, "_conns", {})
+    return {
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        "in_use": len(acquired),
+        "idle": sum(len(conns) for conns in idle.values()),
+    }
@@ -0,0 +1,187 @@
+"""
+Фоновая очередь задач анализа с хранением в SQLite
+Задачи переживают перезапуск сервиса: незавершённые задачи возвращаются в очередь при старте
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Пауза воркера после ошибки хранилища (например, "database is locked"), секунды
+STORE_ERROR_DELAY = 1.0
+STORE_ERROR_MAX_DELAY = 30.0
+
+
+class JobStore:
+    """Синхронное хранилище задач в SQLite (вызывается из потоков через asyncio.to_thread)"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    attempt_id INTEGER,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_attempt_idx ON jobs (attempt_id)")
+
+    def insert(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Создаёт задачу; если по этой попытке уже есть незавершённая задача — возвращает её (created=False)"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE attempt_id = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (payload.get("attempt_id"), STATUS_QUEUED, STATUS_RUNNING),
+            ).fetchone()
+            if row:
+                return dict(row), False
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, attempt_id, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, payload.get("attempt_id"), json.dumps(payload, ensure_ascii=False), STATUS_QUEUED, now, now),
+            )
+            return dict(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()), True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def set_status(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def claim(self, job_id: str) -> bool:
+        """Переводит задачу в running, если она ещё в очереди (атомарно для нескольких процессов)"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_RUNNING, time.time(), job_id, STATUS_QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def recover(self, requeue_running: bool = True) -> List[str]:
+        """
+        Возвращает в очередь задачи, прерванные остановкой сервиса, и отдаёт id всех ожидающих
+        При нескольких процессах running-задачи возвращает только run_server.py до их запуска
+        """
+        with self._lock, self._conn:
+            if requeue_running:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                    (STATUS_QUEUED, time.time(), STATUS_RUNNING),
+                )
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """Очередь задач с пулом воркеров внутри процесса"""
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], workers: int):
+        self._store = store
+        self._handler = handler
+        self._workers_count = workers
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self, requeue_running: bool = True):
+        pending = await asyncio.to_thread(self._store.recover, requeue_running)
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            logger.info(f"Восстановлено задач из хранилища: {len(pending)}")
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self._workers_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        job, created = await asyncio.to_thread(self._store.insert, payload)
+        if created:
+            self._queue.put_nowait(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._store.get, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "pending": self._queue.qsize(),
+            "by_status": self._store.counts(),
+        }
+
+    async def _worker(self, index: int):
+        errors = 0
+        while True:
+            job_id = await self._queue.get()
+            claimed = False
+            try:
+                # Задачу могла забрать другая копия сервиса с тем же хранилищем
+                claimed = await asyncio.to_thread(self._store.claim, job_id)
+                if not claimed:
+                    continue
+                job = await asyncio.to_thread(self._store.get, job_id)
+                try:
+                    result = await self._handler(json.loads(job["payload"]))
+                except Exception as e:
+                    logger.error(f"Задача {job_id} завершилась с ошибкой: {e}")
+                    await asyncio.to_thread(self._store.set_status, job_id, STATUS_FAILED, None, str(e))
+                    continue
+                status = STATUS_DONE if result.get("success") else STATUS_FAILED
+                await asyncio.to_thread(self._store.set_status, job_id, status, result, result.get("error"))
+                errors = 0
+            except Exception as e:
+                # Ошибка хранилища не должна останавливать воркер: иначе задачи остаются без обработчика
+                errors += 1
+                delay = min(STORE_ERROR_MAX_DELAY, STORE_ERROR_DELAY * 2 ** (errors - 1))
+                logger.exception(f"Воркер {index}: ошибка хранилища задач на задаче {job_id}, пауза {delay:.1f} с: {e}")
+                await asyncio.sleep(delay)
+                # Не забранная задача осталась в статусе queued — возвращаем её в очередь
+                if not claimed:
+                    self._queue.put_nowait(job_id)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,127 @@
+"""
+Кэш ответов LLM по содержимому листа ответов
+Одинаковые наборы ответов (все верно, всё пусто, типичные ошибки) получают уровень без запроса к ИИ
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+def normalize_answers(answers: List[Dict[str, Any]]) -> List[list]:
+    """Оставляет только значимые для оценки поля вопроса в стабильном виде"""
+    rows = []
+    for a in answers:
+        student_answer = a.get("student_answer")
+        if student_answer is not None:
+            student_answer = re.sub(r"\s+", " ", str(student_answer)).strip()
+        rows.append([
+            a.get("slot"),
+            (a.get("state") or "").lower(),
+            round(float(a.get("score") or 0.0), 4),
+            student_answer,
+        ])
+    rows.sort(key=lambda r: (r[0] is None, r[0]))
+    return rows
+
+
+def make_key(quiz_id: Any, answers: List[Dict[str, Any]], model: str, prompt_version: str) -> str:
+    """Ключ кэша: хэш нормализованного листа ответов, модели и версии промпта"""
+    material = json.dumps(
+        [quiz_id, model, prompt_version, normalize_answers(answers)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """LRU-кэш уровней в памяти с необязательным хранением на диске (SQLite)"""
+
+    def __init__(self, max_entries: int, path: Optional[str] = None):
+        self._max_entries = max_entries
+        self._memory: "OrderedDict[str, int]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, level INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_idx ON llm_cache (accessed_at)")
+
+    def _disk_get(self, key: str) -> Optional[int]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT level FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _disk_put(self, key: str, level: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, level, accessed_at) VALUES (?, ?, ?)",
+                (key, level, time.time()),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self._max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self._max_entries,),
+                )
+
+    def _remember(self, key: str, level: int):
+        self._memory[key] = level
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[int]:
+        level = self._memory.get(key)
+        if level is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return level
+        if self._conn is not None:
+            level = await asyncio.to_thread(self._disk_get, key)
+            if level is not None:
+                self._remember(key, level)
+                self.hits += 1
+                return level
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, level: int):
+        self._remember(key, level)
+        if self._conn is not None:
+            await asyncio.to_thread(self._disk_put, key, level)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._memory),
+            "disk": self._conn is not None,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
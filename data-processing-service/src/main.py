@@ -1,14 +1,51 @@
+"""
+Повторное распределение студентов по курсам (CLI)
+
+    python main.py 3 17 42                  # указанные пользователи
+    python main.py --users-file users.txt   # id по одному в строке
+    python main.py --all --dry-run          # все участники курса входного теста, без зачисления
+    python main.py --all --quiz-id 17       # другой тест из PLACEMENT_CONFIG_PATH
+
+Попытки обрабатываются параллельно (--concurrency). Каждый обработанный пользователь
+сразу дописывается в файл результатов (CSV или JSONL) и в файл состояния: при повторном
+запуске с тем же файлом состояния уже распределённые пользователи пропускаются
+(--restart начинает заново). Прогресс и итог выводятся в stderr.
+Чтобы после изменения промпта уровни определялись заново, отключите кэш ответов ИИ:
+LLM_CACHE_ENABLED=false.
+"""
+
+import argparse
 import asyncio
+import contextlib
+import csv
 import json
-from moodle_api import get_latest_attempt, get_attempt_review, enroll_user_to_course
-from ai_analyzer import analyze_results
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from moodle_api import (
+    get_latest_attempt, get_attempt_review, enroll_user_to_course, get_quiz_user_ids,
+    enrollment_succeeded, close_enroll_batcher, close_attempt_index
+)
+from ai_analyzer import analyze_results, close_llm_cache
 from config import settings
+from placement import QuizPlacement, get_placement
+from http_client import close_http_client
+from parse_pool import start_parse_pool, close_parse_pool
+import tracing
+
+RESULT_FIELDS = ["user_id", "attempt_id", "level", "course_id", "status", "error", "seconds"]
+# Статусы, после которых пользователь не обрабатывается повторно при возобновлении
+DONE_STATUSES = {"enrolled", "placed", "no_attempt"}
+
 
 def format_attempt_for_ai(user_id, quiz_id, attempt_id, review_data):
     """Форматирует данные для отправки в ИИ"""
     # Теперь review_data уже содержит обработанные данные из moodle_api
     questions = review_data.get("questions", [])
-    
+
     return {
         "student_id": user_id,
         "quiz_id": quiz_id,
@@ -16,25 +53,226 @@ def format_attempt_for_ai(user_id, quiz_id, attempt_id, review_data):
         "answers": questions  # данные уже обработаны в moodle_api
     }
 
-async def process_student(user_id: int):
-    attempt_id = await get_latest_attempt(user_id, settings.entry_test_id)
-    print(attempt_id)
-    if not attempt_id:
-        print(f"ОШИБКА: У пользователя {user_id} нет завершённых попыток")
-        return
-
-    review = await get_attempt_review(attempt_id)
-    results_json = format_attempt_for_ai(user_id, settings.entry_test_id, attempt_id, review)
-    print("Данные для нейросети:")
-    print(json.dumps(results_json, ensure_ascii=False, indent=2))
-
-    level = await analyze_results(results_json)
-    next_course_id = settings.courses.get(level)
-    if next_course_id:
-        await enroll_user_to_course(user_id, next_course_id)
-        print(f"УСПЕХ: Пользователь {user_id} определён на уровень {level}, зачислен в курс {next_course_id}")
-    else:
-        print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось определить курс для уровня {level}")
+
+async def place_student(user_id: int, dry_run: bool, placement: QuizPlacement) -> Dict[str, Any]:
+    """Определяет уровень пользователя в тесте placement и (кроме dry-run) зачисляет его; возвращает строку результата"""
+    row: Dict[str, Any] = dict.fromkeys(RESULT_FIELDS)
+    row["user_id"] = user_id
+    start = time.perf_counter()
+    try:
+        attempt_id = await get_latest_attempt(user_id, placement.quiz_id)
+        row["attempt_id"] = attempt_id
+        if not attempt_id:
+            row["status"] = "no_attempt"
+            return row
+
+        review = await get_attempt_review(attempt_id)
+        if not review.get("questions"):
+            row["status"] = "review_error"
+            row["error"] = "Отсутствуют данные о попытке"
+            return row
+
+        level = await analyze_results(format_attempt_for_ai(user_id, placement.quiz_id, attempt_id, review), placement)
+        row["level"] = level
+        course_id = placement.courses.get(level)
+        if course_id is None:
+            row["status"] = "bad_level"
+            row["error"] = f"Некорректный уровень от ИИ: {level}"
+            return row
+        row["course_id"] = course_id
+
+        if dry_run:
+            row["status"] = "placed"
+            return row
+        result = await enroll_user_to_course(user_id, course_id)
+        if enrollment_succeeded(result):
+            row["status"] = "enrolled"
+        else:
+            row["status"] = "enroll_error"
+            row["error"] = result.get("message", "Неизвестная ошибка") if isinstance(result, dict) else "Пустой ответ от Moodle API"
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+class ResultWriter:
+    """Дописывает строки результатов в CSV или JSONL сразу после обработки"""
+
+    def __init__(self, path: str, fmt: str, append: bool):
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self._file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, row: Dict[str, Any]):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class StateFile:
+    """Файл состояния (JSONL): какие пользователи уже обработаны в данном режиме"""
+
+    def __init__(self, path: str, restart: bool):
+        self.done: Set[int] = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Последняя строка могла оборваться при аварийной остановке
+                        continue
+                    if record.get("status") in DONE_STATUSES:
+                        self.done.add(record["user_id"])
+                    else:
+                        self.done.discard(record["user_id"])
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, row: Dict[str, Any]):
+        self._file.write(json.dumps({k: row[k] for k in ("user_id", "attempt_id", "level", "status")}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.statuses: Counter = Counter()
+        self.started = time.monotonic()
+
+    def add(self, status: str):
+        self.done += 1
+        self.statuses[status] += 1
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        statuses = ", ".join(f"{k}={v}" for k, v in sorted(self.statuses.items()))
+        return (f"{self.done}/{self.total} ({statuses or '-'}), {rate:.2f} польз./с, "
+                f"прошло {elapsed:.0f} с, осталось ~{eta:.0f} с")
+
+
+def _log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _unique(ids: Iterable[int]) -> List[int]:
+    return list(dict.fromkeys(ids))
+
+
+async def _report_progress(progress: Progress, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        _log(progress.line())
+
+
+async def place_cohort(args: argparse.Namespace) -> Progress:
+    """Распределяет всех выбранных пользователей с ограниченной параллельностью"""
+    placement = get_placement(args.quiz_id)
+    if placement is None:
+        raise SystemExit(f"Тест {args.quiz_id} не настроен для распределения (ENTRY_TEST_ID или PLACEMENT_CONFIG_PATH)")
+    user_ids = list(args.user_ids)
+    if args.users_file:
+        with open(args.users_file, encoding="utf-8") as f:
+            user_ids += [int(line) for line in f if line.strip()]
+    if args.all:
+        _log(f"Получение участников курса теста {placement.quiz_id}...")
+        user_ids += await get_quiz_user_ids(placement.quiz_id)
+    user_ids = _unique(user_ids)
+
+    state = StateFile(args.state, args.restart)
+    pending = [user_id for user_id in user_ids if user_id not in state.done]
+    progress = Progress(len(pending), len(user_ids) - len(pending))
+    _log(f"Пользователей: {len(user_ids)}, уже обработано: {progress.skipped}, к обработке: {len(pending)}"
+         f"{' (dry-run, без зачисления)' if args.dry_run else ''}")
+
+    writer = ResultWriter(args.output, args.format, append=not args.restart)
+    reporter = asyncio.ensure_future(_report_progress(progress, args.progress_interval))
+    queue = iter(pending)
+
+    async def worker():
+        # Общий итератор: каждый воркер берёт следующего пользователя, когда освободится
+        for user_id in queue:
+            row = await place_student(user_id, args.dry_run, placement)
+            writer.write(row)
+            state.record(row)
+            progress.add(row["status"])
+            if row["error"]:
+                _log(f"Пользователь {user_id}: {row['status']} — {row['error']}")
+
+    try:
+        # Подробный вывод конвейера (print) не смешивается с отчётом о прогрессе
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        reporter.cancel()
+        writer.close()
+        state.close()
+    return progress
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Повторное распределение студентов по уровням и курсам")
+    parser.add_argument("user_ids", nargs="*", type=int, help="id пользователей Moodle")
+    parser.add_argument("--users-file", help="файл с id пользователей, по одному в строке")
+    parser.add_argument("--all", action="store_true", help="пользователи с попытками теста (без индекса попыток — все участники курса)")
+    parser.add_argument("--quiz-id", type=int, help="тест, по которому распределять (по умолчанию ENTRY_TEST_ID)")
+    parser.add_argument("--concurrency", type=int, default=8, help="сколько пользователей обрабатывать одновременно")
+    parser.add_argument("--dry-run", action="store_true", help="только определить уровни, без зачисления")
+    parser.add_argument("--output", default="placement.csv", help="файл результатов (.csv или .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="формат результатов (по умолчанию по расширению)")
+    parser.add_argument("--state", help="файл состояния для возобновления (по умолчанию <output>.state.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="игнорировать файл состояния и перезаписать результаты")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="период отчёта о прогрессе (секунды)")
+    parser.add_argument("--verbose", action="store_true", help="выводить подробный лог обработки каждой попытки")
+    args = parser.parse_args(argv)
+
+    if not (args.user_ids or args.users_file or args.all):
+        parser.error("укажите id пользователей, --users-file или --all")
+    if args.concurrency < 1:
+        parser.error("--concurrency должен быть не меньше 1")
+    # Настройки читаются после разбора аргументов: --help работает без .env
+    args.quiz_id = args.quiz_id or settings.entry_test_id
+    args.format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "csv")
+    # Отдельное состояние для dry-run: пробный прогон не отмечает пользователей зачисленными
+    args.state = args.state or f"{args.output}{'.dry_run' if args.dry_run else ''}.state.jsonl"
+    return args
+
+
+async def main(args: argparse.Namespace):
+    start_parse_pool()
+    try:
+        progress = await place_cohort(args)
+    finally:
+        await close_enroll_batcher()
+        close_attempt_index()
+        close_llm_cache()
+        close_parse_pool()
+        tracing.close_tracing()
+        await close_http_client()
+
+    _log(f"Готово: {progress.line()}")
+    _log(f"Результаты: {args.output}, состояние: {args.state}")
+
 
 if __name__ == "__main__":
-    asyncio.run(process_student(3))
+    asyncio.run(main(parse_args()))
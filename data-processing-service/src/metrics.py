@@ -0,0 +1,98 @@
+"""
+Метрики Prometheus (endpoint /metrics)
+
+- entrance_stage_seconds{stage}       — длительность этапов обработки попытки
+- entrance_outcomes_total{outcome}    — итоги обработки попыток
+- entrance_pipeline_in_flight         — попытки в обработке
+- entrance_<источник>_<показатель>    — состояние компонентов (пул HTTP, лимитер ИИ, предохранитель Moodle,
+                                        очередь задач, пул разбора), снимается только в момент запроса /metrics
+
+При нескольких процессах сервера (PROMETHEUS_MULTIPROC_DIR задаёт run_server.py) гистограммы, счётчики
+и число попыток в обработке суммируются по всем процессам, а состояние компонентов — процесса, ответившего на /metrics.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Этапы обработки: получение review, разбор HTML, OAuth, ожидание лимитера, запрос к ИИ, зачисление, весь цикл
+STAGES = ("review_fetch", "parse", "oauth", "llm_queue", "llm", "enroll", "total")
+OUTCOMES = ("success", "cached", "wrong_quiz", "review_error", "bad_level", "enroll_error", "error")
+
+STAGE_SECONDS = Histogram(
+    "entrance_stage_seconds",
+    "Длительность этапа обработки попытки",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+OUTCOMES_TOTAL = Counter("entrance_outcomes_total", "Итоги обработки попыток", ["outcome"])
+PIPELINE_IN_FLIGHT = Gauge("entrance_pipeline_in_flight", "Попытки в обработке", multiprocess_mode="livesum")
+
+# Дочерние метрики создаются заранее: на горячем пути нет поиска по меткам
+_stages = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+_outcomes = {outcome: OUTCOMES_TOTAL.labels(outcome) for outcome in OUTCOMES}
+
+
+def observe(stage: str, seconds: float):
+    _stages[stage].observe(seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замеряет длительность блока как этап name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages[name].observe(time.perf_counter() - start)
+
+
+def outcome(name: str):
+    _outcomes[name].inc()
+
+
+class SourcesCollector:
+    """Показатели компонентов, которые читаются из их stats() только при сборе метрик"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def register(self, name: str, source: Callable[[], Dict[str, float]]):
+        self._sources[name] = source
+
+    def collect(self):
+        for name, source in self._sources.items():
+            try:
+                values = source()
+            except Exception:
+                continue
+            for key, value in (values or {}).items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(f"entrance_{name}_{key}", f"{name}: {key}", value=value)
+
+
+sources = SourcesCollector()
+REGISTRY.register(sources)
+
+
+def render() -> bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(sources)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Убирает значения остановленного процесса из суммарных gauge"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,45 +1,153 @@
-import aiohttp
-import re
-from bs4 import BeautifulSoup
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional, Tuple
 from config import settings
+import http_client
+from http_client import get_session
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from enroll_batcher import MESSAGE_NOT_SENT, EnrollmentBatcher
+from attempt_index import AttemptIndex
+import metrics
+import tracing
+from parse_pool import parse_review
+from review_parser import QuizStructureCache, parse_review_questions, to_float_score, extract_choice_label
+
+logger = logging.getLogger(__name__)
+
+# Коды ошибок Moodle, означающие, что функция плагина не добавлена в сервис или недоступна токену
+ATTEMPT_INDEX_UNAVAILABLE_CODES = {"accessexception", "invalidrecord", "nopermissions", "servicenotavailable"}
+
+_structure_cache: Optional[QuizStructureCache] = None
+_breaker: Optional[CircuitBreaker] = None
+_enroll_batcher: Optional[EnrollmentBatcher] = None
+_attempt_index: Optional[AttemptIndex] = None
+_attempt_index_unavailable = False
+
+
+class MoodleUnavailableError(Exception):
+    """Moodle не ответил: сетевая ошибка, таймаут или 5xx"""
+
+
+class AttemptIndexUnavailableError(Exception):
+    """Функция плагина local_entrance_testing_get_quiz_attempts недоступна"""
+
+
+def get_structure_cache() -> Optional[QuizStructureCache]:
+    """Возвращает кэш структуры тестов (None, если кэш отключён)"""
+    global _structure_cache
+    if _structure_cache is None and settings.quiz_structure_cache_enabled:
+        _structure_cache = QuizStructureCache(
+            settings.quiz_structure_cache_max_entries,
+            settings.quiz_structure_cache_ttl
+        )
+    return _structure_cache
+
+
+def get_breaker() -> CircuitBreaker:
+    """Возвращает предохранитель запросов к Moodle"""
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker("Moodle", settings.moodle_breaker_threshold, settings.moodle_breaker_reset_timeout)
+    return _breaker
+
+
+async def _post_once(params: dict, timeout: float):
+    session = get_session()
+    async with session.post(
+        f"{settings.moodle_url}/webservice/rest/server.php",
+        data=params,
+        ssl=False,
+        timeout=http_client.aiohttp.ClientTimeout(total=timeout)
+    ) as r:
+        if r.status >= 500:
+            raise MoodleUnavailableError(f"HTTP {r.status}")
+        # Ошибки Moodle (exception/errorcode) приходят в JSON и разбираются вызывающим кодом;
+        # страница не в JSON (режим обслуживания, прокси) считается недоступностью
+        return await r.json()
+
 
 async def post_ws(params: dict):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{settings.moodle_url}/webservice/rest/server.php", data=params, ssl=False) as r:
-            return await r.json()
-
-def to_float_score(s):
-    """Конвертирует строку в float для оценки"""
-    if s is None or s == "":
-        return 0.0
-    try:
-        # Moodle может использовать запятую
-        return float(str(s).replace(",", "."))
-    except:
+    """
+    Вызов web-service Moodle с таймаутом по wsfunction и предохранителем
+    Идемпотентные функции (MOODLE_RETRY_FUNCTIONS) повторяются при сетевых ошибках,
+    таймаутах и 5xx с экспоненциальной задержкой со случайным разбросом
+    """
+    function = params.get("wsfunction")
+    timeout = settings.moodle_timeouts.get(function, settings.moodle_timeout)
+    retries = settings.moodle_max_retries if function in settings.moodle_retry_functions else 0
+    breaker = get_breaker()
+
+    for attempt in range(retries + 1):
+        breaker.before_call()
         try:
-            return float(re.findall(r"[\d\.]+", str(s))[0])
-        except:
-            return 0.0
-
-def extract_choice_label(label_el):
-    """Извлекает текст варианта ответа из HTML элемента"""
-    # обычно есть span.answernumber и div.flex-fill (или текст внутри)
-    number = label_el.find("span", class_="answernumber")
-    textpart = label_el.find(class_="flex-fill")
-    if textpart:
-        text = textpart.get_text(" ", strip=True)
+            result = await _post_once(params, timeout)
+        # aiohttp уже импортирован: сессия создаётся в _post_once до запроса
+        except (http_client.aiohttp.ClientError, asyncio.TimeoutError, MoodleUnavailableError) as e:
+            error = f"{function}: {type(e).__name__} {e}".strip()
+            breaker.record_failure(error)
+            if attempt == retries:
+                raise MoodleUnavailableError(f"Moodle не ответил ({error})")
+            delay = min(settings.moodle_retry_max_delay, settings.moodle_retry_base_delay * 2 ** attempt)
+            delay *= random.uniform(0.5, 1.0)
+            logger.warning(f"Ошибка запроса {function} к Moodle ({error}), повтор {attempt + 1} через {delay:.1f} с")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def _fetch_attempts_page(quiz_id: int, since_time: int, since_id: int) -> Tuple[List[Dict[str, Any]], bool]:
+    """Страница завершённых попыток теста после курсора (web-service плагина local_entrance_testing)"""
+    data = await post_ws({
+        "wstoken": settings.moodle_token,
+        "wsfunction": "local_entrance_testing_get_quiz_attempts",
+        "moodlewsrestformat": "json",
+        "quizid": quiz_id,
+        "sincetime": since_time,
+        "sinceid": since_id,
+        "limit": settings.attempt_index_page_size,
+    })
+    if "exception" in data:
+        message = "Ошибка при получении попыток теста: " + data.get("message", "")
+        if data.get("errorcode") in ATTEMPT_INDEX_UNAVAILABLE_CODES:
+            raise AttemptIndexUnavailableError(message)
+        raise Exception(message)
+    return data.get("attempts", []), bool(data.get("hasmore"))
+
+
+def get_attempt_index() -> Optional[AttemptIndex]:
+    """Возвращает индекс попыток (None, если он отключён или web-service плагина недоступен)"""
+    global _attempt_index
+    if _attempt_index is None and settings.attempt_index_enabled and not _attempt_index_unavailable:
+        _attempt_index = AttemptIndex(settings.attempt_index_path, settings.attempt_index_max_age, _fetch_attempts_page)
+    return _attempt_index
+
+
+def close_attempt_index():
+    global _attempt_index
+    if _attempt_index is not None:
+        _attempt_index.close()
+        _attempt_index = None
+
+
+def _disable_attempt_index(error: Exception):
+    """Индекс недоступен (функция плагина не добавлена в сервис): дальше запросы по пользователям"""
+    global _attempt_index_unavailable
+    logger.error(f"Индекс попыток недоступен ({error}), попытки запрашиваются по пользователям")
+    _attempt_index_unavailable = True
+    close_attempt_index()
+
+
+def _attempt_index_failed(error: Exception):
+    """Отключает индекс, если функция плагина недоступна; остальные ошибки разовые — индекс пробуется снова"""
+    if isinstance(error, AttemptIndexUnavailableError):
+        _disable_attempt_index(error)
     else:
-        # fallback — весь текст
-        text = label_el.get_text(" ", strip=True)
-    if number:
-        num = number.get_text(" ", strip=True)
-        # убрать дублирование если number включён в text
-        text = text if num not in text else text
-        return f"{num}{text}".strip()
-    return text
-
-async def get_latest_attempt(user_id: int, quiz_id: int):
-    """Получает последнюю завершённую попытку пользователя"""
+        logger.warning(f"Ошибка индекса попыток ({error}), запрос выполняется без индекса")
+
+
+async def _latest_attempt_of_user(user_id: int, quiz_id: int) -> Optional[int]:
     params = {
         "wstoken": settings.moodle_token,
         "wsfunction": "mod_quiz_get_user_quiz_attempts",
@@ -52,9 +160,71 @@ async def get_latest_attempt(user_id: int, quiz_id: int):
     data = await post_ws(params)
     attempts = data.get("attempts", [])
     if not attempts:
-        print("Попытки не найдены!")
+        return None
     return attempts[-1]["id"]
 
+
+async def get_latest_attempt(user_id: int, quiz_id: int) -> Optional[int]:
+    """Получает последнюю завершённую попытку пользователя (None, если попыток нет)"""
+    index = get_attempt_index()
+    if index is not None:
+        try:
+            return await index.latest_attempt(user_id, quiz_id)
+        except (MoodleUnavailableError, CircuitOpenError):
+            raise
+        except Exception as e:
+            _attempt_index_failed(e)
+    attempt_id = await _latest_attempt_of_user(user_id, quiz_id)
+    if attempt_id is None:
+        print("Попытки не найдены!")
+    return attempt_id
+
+
+async def get_quiz_user_ids(quiz_id: int) -> List[int]:
+    """
+    Id пользователей с завершёнными попытками теста
+    Без индекса попыток возвращаются все участники курса теста: в core web-service нет списка
+    попыток теста по всем пользователям, поэтому вызывающий код делает по запросу
+    mod_quiz_get_user_quiz_attempts на каждого участника, включая не проходивших тест
+    """
+    index = get_attempt_index()
+    if index is not None:
+        try:
+            return await index.user_ids(quiz_id)
+        except (MoodleUnavailableError, CircuitOpenError):
+            raise
+        except Exception as e:
+            _attempt_index_failed(e)
+
+    module = await post_ws({
+        "wstoken": settings.moodle_token,
+        "wsfunction": "core_course_get_course_module_by_instance",
+        "moodlewsrestformat": "json",
+        "module": "quiz",
+        "instance": quiz_id,
+    })
+    if "exception" in module:
+        raise Exception("Ошибка при получении модуля теста: " + module.get("message", ""))
+
+    users = await post_ws({
+        "wstoken": settings.moodle_token,
+        "wsfunction": "core_enrol_get_enrolled_users",
+        "moodlewsrestformat": "json",
+        "courseid": module["cm"]["course"],
+        # Только id: полные профили тысяч пользователей не нужны
+        "options[0][name]": "userfields",
+        "options[0][value]": "id",
+    })
+    if isinstance(users, dict) and "exception" in users:
+        raise Exception("Ошибка при получении участников курса: " + users.get("message", ""))
+    logger.warning(
+        f"Индекс попыток не используется: обрабатываются все участники курса ({len(users)}), "
+        f"по запросу к Moodle на каждого; включите ATTEMPT_INDEX_ENABLED, чтобы брать только прошедших тест"
+    )
+    return [user["id"] for user in users]
+
+
+@tracing.traced()
 async def get_attempt_review(attempt_id: int):
     """Получает подробный review attempt и парсит данные"""
     params = {
@@ -64,107 +234,15 @@ async def get_attempt_review(attempt_id: int):
         "attemptid": attempt_id,
         "page": -1
     }
-    review = await post_ws(params)
+    with metrics.stage("review_fetch"), tracing.span("mod_quiz_get_attempt_review", attempt_id=attempt_id):
+        review = await post_ws(params)
     if "exception" in review:
         raise Exception("Ошибка при получении review attempt: " + review.get("message", ""))
 
     questions = review.get("questions", [])
-    clean_answers = []
-
-    for q in questions:
-        raw_html = q.get("html", "")
-        soup = BeautifulSoup(raw_html, "html.parser")
-
-        # --- текст вопроса ---
-        qtext_tag = soup.find("div", class_="qtext")
-        question_text = qtext_tag.get_text(" ", strip=True) if qtext_tag else soup.get_text(" ", strip=True)
-
-        # --- варианты ответов ---
-        choices = []
-        labels = soup.select('.answer [data-region="answer-label"]')
-        for lab in labels:
-            lab_text = extract_choice_label(lab)
-            if lab_text:
-                choices.append(re.sub(r'\s+', ' ', lab_text).strip())
-
-        # fallback, если нет data-region
-        if not choices:
-            blocks = soup.select('.answer .r0, .answer .r1')
-            for b in blocks:
-                text = b.get_text(" ", strip=True)
-                text = re.sub(r'\s+', ' ', text).strip()
-                if text:
-                    choices.append(text)
-
-        # --- правильный ответ ---
-        correct = ""
-        right_block = soup.find(class_="rightanswer")
-        if right_block:
-            # получаем весь текст без тегов
-            txt = right_block.get_text(" ", strip=True)
-            # убираем префиксы вроде "Правильный ответ:" или "Correct Answer:"
-            txt = re.sub(r'^(Правильный ответ|Correct answer|Ответ):\s*', '', txt, flags=re.IGNORECASE)
-            # заменяем множественные пробелы на один
-            correct = re.sub(r'\s+', ' ', txt).strip()
-        # --- ответ студента ---
-        student_answer = None
-
-        # 1) checked inputs
-        checked = soup.select('input[checked], input[checked="checked"]')
-        if checked:
-            vals = []
-            for inp in checked:
-                lab = inp.find_parent(attrs={"data-region": "answer-label"})
-                if lab:
-                    vals.append(extract_choice_label(lab))
-                else:
-                    vals.append(inp.parent.get_text(" ", strip=True))
-            if vals:
-                student_answer = ", ".join(vals)
-
-        # 2) API responses
-        if not student_answer and q.get("responses"):
-            vals = []
-            for r in q.get("responses", []):
-                a = r.get("answer", "")
-                if a:
-                    vals.append(BeautifulSoup(a, "html.parser").get_text(" ", strip=True))
-            if vals:
-                student_answer = ", ".join(vals)
-
-        # 3) fallback "Сохранено:"
-        if not student_answer:
-            m = re.search(r'Сохранено:\s*([^<\n\r]+)', raw_html)
-            if m:
-                student_answer = m.group(1).strip()
-
-        # 4) state mapping
-        state = q.get("state", "").lower() or q.get("status", "").lower()
-        if not student_answer:
-            if state in ("gaveup", "noanswer", "todo", "notanswered"):
-                student_answer = "не ответил"
-            elif state in ("gradedright", "correct"):
-                student_answer = correct or "правильно"
-            elif state in ("gradedwrong", "wrong"):
-                student_answer = "неверно"
-            else:
-                student_answer = state or "неизвестно"
-
-        # --- балл ---
-        raw_mark = q.get("mark") or q.get("marks") or q.get("score") or q.get("maxmark")
-        score = to_float_score(raw_mark)
-        if student_answer == "не ответил":
-            score = 0.0
-
-        clean_answers.append({
-            "slot": q.get("slot"),
-            "question": question_text,
-            "choices": choices,
-            "student_answer": student_answer,
-            "correct_answer": correct,
-            "score": score,
-            "state": q.get("state", "")
-        })
+    quiz_id = (review.get("attempt") or {}).get("quiz")
+    with metrics.stage("parse"), tracing.span("parse_review", questions=len(questions), backend=settings.html_parser_backend):
+        clean_answers = await parse_review(questions, quiz_id, get_structure_cache(), settings.html_parser_backend)
 
     return {
         "questions": clean_answers,
@@ -172,17 +250,47 @@ async def get_attempt_review(attempt_id: int):
     }
 
 
-async def enroll_user_to_course(user_id: int, course_id: int):
+async def _enrol_users(enrolments: List[Tuple[int, int]]):
+    """Один вызов enrol_manual_enrol_users для списка (user_id, course_id)"""
     params = {
         "wstoken": settings.moodle_token,
         "moodlewsrestformat": "json",
         "wsfunction": "enrol_manual_enrol_users",
     }
-    payload = {
-        "enrolments[0][roleid]": 5,
-        "enrolments[0][userid]": user_id,
-        "enrolments[0][courseid]": course_id,
-    }
+    for i, (user_id, course_id) in enumerate(enrolments):
+        params[f"enrolments[{i}][roleid]"] = 5
+        params[f"enrolments[{i}][userid]"] = user_id
+        params[f"enrolments[{i}][courseid]"] = course_id
+
+    with tracing.span("enrol_manual_enrol_users", enrolments=len(enrolments)):
+        return await post_ws(params)
+
 
-    res = await post_ws({**params, **payload})
-    return res
+def get_enroll_batcher() -> Optional[EnrollmentBatcher]:
+    """Возвращает объединитель зачислений (None при ENROLL_BATCH_SIZE=1)"""
+    global _enroll_batcher
+    if _enroll_batcher is None and settings.enroll_batch_size > 1:
+        _enroll_batcher = EnrollmentBatcher(_enrol_users, settings.enroll_batch_size, settings.enroll_batch_window)
+    return _enroll_batcher
+
+
+async def close_enroll_batcher():
+    """Отправляет накопленные зачисления (вызывается при остановке сервиса)"""
+    global _enroll_batcher
+    if _enroll_batcher is not None:
+        await _enroll_batcher.close()
+        _enroll_batcher = None
+
+
+def enrollment_succeeded(result) -> bool:
+    """Moodle возвращает "Message was not sent." даже при успешном зачислении; пустой ответ успехом не считается"""
+    return isinstance(result, dict) and result.get("errorcode") == MESSAGE_NOT_SENT
+
+
+@tracing.traced()
+async def enroll_user_to_course(user_id: int, course_id: int):
+    batcher = get_enroll_batcher()
+    with metrics.stage("enroll"):
+        if batcher is None:
+            return await _enrol_users([(user_id, course_id)])
+        return await batcher.enroll(user_id, course_id)
@@ -0,0 +1,161 @@
+"""
+Пул для разбора HTML review вне цикла событий
+
+Разбор большой попытки занимает десятки миллисекунд CPU; в пуле он не блокирует
+остальные запросы воркера uvicorn (включая /health).
+
+- process — ProcessPoolExecutor: разбор масштабируется по ядрам, у каждого процесса свой кэш структуры
+- thread  — ThreadPoolExecutor: общий кэш структуры, но разбор ограничен GIL
+- PARSE_WORKERS=0 — разбор прямо в цикле событий, как раньше (так же работает CLI без start_parse_pool)
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from review_parser import QuizStructureCache, init_worker, parse_in_worker, parse_review_questions
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+_mode = "inline"
+# Задачи запуска процессов пула: пул прогрет, когда они выполнены
+_warmup: List[Future] = []
+# Поколение кэша структуры: увеличивается при сбросе, процессы пула сверяют его перед разбором
+_cache_epoch = 0
+# Пул процессов, повреждённый столько раз подряд, заменяется пулом потоков
+MAX_POOL_BREAKS = 3
+_breaks = 0
+
+stats = {
+    "tasks": 0,
+    "running": 0,
+    "errors": 0,
+    "seconds_total": 0.0,
+}
+
+
+def _create_process_pool(workers: int) -> ProcessPoolExecutor:
+    cache_size = settings.quiz_structure_cache_max_entries if settings.quiz_structure_cache_enabled else 0
+    # spawn: fork процесса с работающим циклом событий и потоками SQLite небезопасен
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(cache_size, settings.quiz_structure_cache_ttl),
+    )
+
+
+def start_parse_pool() -> Optional[Executor]:
+    """Создаёт пул разбора по настройкам (вызывается из lifespan приложения)"""
+    global _executor, _mode, _warmup
+    workers = settings.parse_workers
+    if workers <= 0 or _executor is not None:
+        return _executor
+    if settings.parse_executor == "process":
+        try:
+            _executor = _create_process_pool(workers)
+            _mode = "process"
+            # Процессы запускаются заранее, чтобы первая попытка не ждала их старта и импорта парсера
+            _warmup = [_submit_warmup(_executor) for _ in range(workers)]
+        except (OSError, NotImplementedError, ImportError) as e:
+            logger.warning(f"Не удалось создать пул процессов ({e}), разбор будет выполняться в потоках")
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review-parse")
+        _mode = "thread"
+    return _executor
+
+
+def _submit_warmup(executor: Executor) -> Future:
+    """Пустой разбор: запускает процесс пула и импортирует в нём парсер"""
+    return executor.submit(parse_in_worker, [], None, settings.html_parser_backend, _cache_epoch)
+
+
+def _replace_broken_pool(executor: Executor):
+    """Пересоздаёт аварийно завершившийся пул процессов (после MAX_POOL_BREAKS подряд — пул потоков)"""
+    global _executor, _mode, _breaks
+    if _executor is not executor:
+        return
+    executor.shutdown(wait=False, cancel_futures=True)
+    _breaks += 1
+    if _breaks >= MAX_POOL_BREAKS:
+        logger.error("Пул процессов разбора повреждён повторно, переключаемся на пул потоков")
+        _executor = ThreadPoolExecutor(max_workers=settings.parse_workers, thread_name_prefix="review-parse")
+        _mode = "thread"
+    else:
+        logger.error("Пул разбора повреждён, пересоздаём")
+        _executor = _create_process_pool(settings.parse_workers)
+
+
+async def wait_parse_pool():
+    """
+    Ждёт, пока процессы пула запустятся и импортируют парсер (для проверки готовности)
+    Неудавшийся прогрев не ожидается повторно: при следующей проверке отправляется новая задача
+    """
+    for i, future in enumerate(_warmup):
+        if future.done() and (future.cancelled() or future.exception() is not None):
+            if _mode != "process":
+                # Пул заменён пулом потоков: запускать процессы больше не нужно
+                continue
+            try:
+                future = _warmup[i] = _submit_warmup(_executor)
+            except BrokenProcessPool:
+                _replace_broken_pool(_executor)
+                raise
+        await asyncio.wrap_future(future)
+
+
+def close_parse_pool():
+    """Останавливает пул разбора"""
+    global _executor, _mode, _warmup
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+    _mode = "inline"
+    _warmup = []
+
+
+def invalidate_worker_caches():
+    """Сбрасывает кэши структуры в процессах пула (при следующем разборе)"""
+    global _cache_epoch
+    _cache_epoch += 1
+
+
+async def parse_review(questions: List[Dict[str, Any]], quiz_id, cache: Optional[QuizStructureCache], backend: str) -> List[Dict[str, Any]]:
+    """Разбирает вопросы попытки в пуле (или в цикле событий, если пул не запущен)"""
+    global _breaks
+    if _executor is None:
+        return parse_review_questions(questions, quiz_id, cache, backend)
+
+    executor = _executor
+    loop = asyncio.get_running_loop()
+    stats["tasks"] += 1
+    stats["running"] += 1
+    start = time.perf_counter()
+    try:
+        if _mode == "process":
+            result = await loop.run_in_executor(executor, parse_in_worker, questions, quiz_id, backend, _cache_epoch)
+            _breaks = 0
+            return result
+        return await loop.run_in_executor(executor, parse_review_questions, questions, quiz_id, cache, backend)
+    except BrokenProcessPool:
+        # Процесс пула аварийно завершился: пересоздаём пул, текущую попытку разбираем на месте
+        stats["errors"] += 1
+        _replace_broken_pool(executor)
+        return parse_review_questions(questions, quiz_id, cache, backend)
+    finally:
+        stats["running"] -= 1
+        stats["seconds_total"] += time.perf_counter() - start
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        "executor": _mode,
+        "workers": settings.parse_workers if _executor is not None else 0,
+        **stats,
+    }
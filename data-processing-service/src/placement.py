@@ -0,0 +1,261 @@
+"""
+Настройки распределения по тестам: шкала уровней, курсы, промпт и правила быстрого пути
+
+Без PLACEMENT_CONFIG_PATH распределяется один тест из настроек (ENTRY_TEST_ID, courses,
+FAST_PATH_*). С файлом — любое число тестов (например, по одному на факультет):
+
+    {
+      "quizzes": {
+        "2":  {"name": "ИТ", "courses": {"1": 4, "2": 5, "3": 6}},
+        "17": {"name": "Экономика", "courses": {"1": 21, "2": 22, "3": 23, "4": 24},
+               "prompt_file": "prompts/economics.txt",
+               "fast_path": {"enabled": true, "thresholds": {"4": {"min_correct": 1.0}}}}
+      }
+    }
+
+Поиск настроек теста на пути запроса — одно обращение к словарю. Файл (и файлы промптов)
+проверяются раз в PLACEMENT_RELOAD_INTERVAL секунд и при изменении перечитываются
+целиком в каждом процессе сервера; новый словарь подменяет старый одним присваиванием,
+а файл с ошибкой не применяется (остаются прежние настройки).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Уровень — одна цифра: ответ ИИ разбирается (и поток обрывается) по первой цифре
+MIN_LEVEL = 1
+MAX_LEVEL = 9
+DEFAULT_LEVELS = (1, 2, 3)
+FAST_PATH_RULE_KEYS = {"min_correct", "max_correct", "min_unanswered", "max_unanswered"}
+
+
+class QuizPlacement(BaseModel):
+    """Настройки распределения одного теста"""
+
+    model_config = {"frozen": True, "extra": "forbid"}
+
+    quiz_id: int = Field(..., ge=1, description="ID теста")
+    name: str = Field(default="", description="Название (факультет, направление) для логов и /stats")
+    courses: Dict[int, int] = Field(..., description="Соответствие уровней и курсов")
+    prompt: Optional[str] = Field(default=None, description="Шаблон промпта с {results} (None - общий шаблон)")
+    prompt_version: str = Field(default="", description="Отпечаток шаблона промпта для кэша ответов ИИ")
+    fast_path_enabled: bool = Field(default=False, description="Определять уровень однозначных попыток по правилам")
+    fast_path_thresholds: Dict[int, Dict[str, float]] = Field(default={}, description="Правила по уровням")
+    fast_path_weights: Dict[int, float] = Field(default={}, description="Веса вопросов по слоту")
+
+    @model_validator(mode="after")
+    def validate_placement(self):
+        """Валидация шкалы уровней, курсов, промпта и правил быстрого пути"""
+        if not self.courses:
+            raise ValueError("Курсы не могут быть пустыми")
+        for level, course_id in self.courses.items():
+            if level < MIN_LEVEL or level > MAX_LEVEL:
+                raise ValueError(f"Уровень {level} должен быть от {MIN_LEVEL} до {MAX_LEVEL}")
+            if course_id < 1:
+                raise ValueError(f"ID курса {course_id} должен быть положительным числом")
+        if self.prompt is None and tuple(sorted(self.courses)) != DEFAULT_LEVELS:
+            raise ValueError("Общий промпт просит уровень 1, 2 или 3: для другой шкалы задайте prompt или prompt_file")
+        if self.prompt is not None and "{results}" not in self.prompt:
+            raise ValueError("Шаблон промпта должен содержать {results}")
+        for level, rule in self.fast_path_thresholds.items():
+            if level not in self.courses:
+                raise ValueError(f"Правило быстрого пути для уровня {level}, которого нет в courses")
+            unknown = set(rule) - FAST_PATH_RULE_KEYS
+            if unknown:
+                raise ValueError(f"Неизвестные параметры правила для уровня {level}: {', '.join(sorted(unknown))}")
+            for name, value in rule.items():
+                if value < 0 or value > 1:
+                    raise ValueError(f"Параметр {name} для уровня {level} должен быть от 0 до 1")
+        return self
+
+    @property
+    def levels(self) -> Tuple[int, ...]:
+        return tuple(sorted(self.courses))
+
+
+def default_placement() -> QuizPlacement:
+    """Тест из настроек: ENTRY_TEST_ID, courses и FAST_PATH_*"""
+    return QuizPlacement(
+        quiz_id=settings.entry_test_id,
+        courses=settings.courses,
+        fast_path_enabled=settings.fast_path_enabled,
+        fast_path_thresholds=settings.fast_path_thresholds,
+        fast_path_weights=settings.fast_path_weights,
+    )
+
+
+def _read_prompt(base_dir: str, path: str) -> str:
+    with open(os.path.join(base_dir, path), encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_placement_config(path: str) -> Dict[int, QuizPlacement]:
+    """Читает и проверяет файл настроек; ошибка в любом тесте отклоняет весь файл"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    quizzes: Dict[int, QuizPlacement] = {}
+    for key, raw in (data.get("quizzes") or {}).items():
+        try:
+            raw = dict(raw)
+            raw.pop("quiz_id", None)
+            fast_path = raw.pop("fast_path", None) or {}
+            prompt_file = raw.pop("prompt_file", None)
+            if prompt_file:
+                raw["prompt"] = _read_prompt(base_dir, prompt_file)
+            if raw.get("prompt"):
+                raw["prompt_version"] = hashlib.sha256(raw["prompt"].encode("utf-8")).hexdigest()[:12]
+            placement = QuizPlacement(
+                quiz_id=int(key),
+                fast_path_enabled=fast_path.get("enabled", False),
+                fast_path_thresholds=fast_path.get("thresholds", {}),
+                fast_path_weights=fast_path.get("weights", {}),
+                **raw,
+            )
+        except (ValidationError, ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"Тест {key}: {e}") from e
+        quizzes[placement.quiz_id] = placement
+    if not quizzes:
+        raise ValueError("В файле нет ни одного теста (quizzes)")
+    return quizzes
+
+
+class PlacementRegistry:
+    """Настройки распределения по ID теста с перечитыванием файла при изменении"""
+
+    def __init__(self, path: str = ""):
+        self._path = path
+        self._quizzes: Dict[int, QuizPlacement] = {}
+        self._signature: Optional[tuple] = None
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+        if path:
+            # Ошибка в файле при запуске не маскируется: сервис не стартует с неполными настройками
+            self.reload()
+        else:
+            placement = default_placement()
+            self._quizzes = {placement.quiz_id: placement}
+            self.loaded_at = time.time()
+
+    def get(self, quiz_id: int) -> Optional[QuizPlacement]:
+        """Настройки теста или None, если тест не распределяется"""
+        return self._quizzes.get(quiz_id)
+
+    def quiz_ids(self) -> List[int]:
+        return sorted(self._quizzes)
+
+    def _file_signature(self) -> tuple:
+        """Время изменения и размер файла настроек и файлов промптов"""
+        paths = [self._path]
+        base_dir = os.path.dirname(os.path.abspath(self._path))
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                quizzes = (json.load(f).get("quizzes") or {}).values()
+            paths += [os.path.join(base_dir, q["prompt_file"]) for q in quizzes if isinstance(q, dict) and q.get("prompt_file")]
+        except (OSError, ValueError, AttributeError):
+            pass
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def reload(self) -> Dict[int, QuizPlacement]:
+        """Перечитывает файл; при ошибке бросает исключение, прежние настройки сохраняются"""
+        signature = self._file_signature()
+        quizzes = parse_placement_config(self._path)
+        self._quizzes = quizzes
+        self._signature = signature
+        self.loaded_at = time.time()
+        self.reloads += 1
+        self.last_error = None
+        return quizzes
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает файл, если он или файлы промптов изменились; возвращает True, если применены новые настройки"""
+        if not self._path or self._file_signature() == self._signature:
+            return False
+        try:
+            quizzes = self.reload()
+        except (OSError, ValueError) as e:
+            # Запоминаем подпись ошибочного файла, чтобы не разбирать его повторно до следующего изменения
+            self._signature = self._file_signature()
+            self.reload_errors += 1
+            self.last_error = str(e)
+            logger.error(f"Настройки распределения {self._path} не применены: {e}")
+            return False
+        logger.info(f"Настройки распределения перечитаны: тесты {sorted(quizzes)}")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self._path or None,
+            "quizzes": {quiz_id: {"name": p.name, "levels": list(p.levels)} for quiz_id, p in sorted(self._quizzes.items())},
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+        }
+
+
+_registry: Optional[PlacementRegistry] = None
+_watcher: Optional[asyncio.Task] = None
+
+
+def get_placement_registry() -> PlacementRegistry:
+    """Возвращает общий реестр настроек распределения процесса"""
+    global _registry
+    if _registry is None:
+        _registry = PlacementRegistry(settings.placement_config_path)
+    return _registry
+
+
+def get_placement(quiz_id: int) -> Optional[QuizPlacement]:
+    """Настройки распределения теста (None — тест не распределяется)"""
+    return get_placement_registry().get(quiz_id)
+
+
+async def _watch(registry: PlacementRegistry, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(registry.reload_if_changed)
+        except Exception as e:
+            logger.error(f"Ошибка проверки настроек распределения: {e}")
+
+
+def start_placement_watcher() -> PlacementRegistry:
+    """Загружает настройки и запускает проверку файла на изменения (вызывается из lifespan)"""
+    global _watcher
+    registry = get_placement_registry()
+    if settings.placement_config_path and settings.placement_reload_interval > 0 and _watcher is None:
+        _watcher = asyncio.ensure_future(_watch(registry, settings.placement_reload_interval))
+    return registry
+
+
+async def close_placement_watcher():
+    """Останавливает проверку файла настроек"""
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except asyncio.CancelledError:
+            pass
+        _watcher = None
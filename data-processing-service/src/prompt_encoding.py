@@ -0,0 +1,121 @@
+"""
+Сериализация данных попытки для промпта
+json    — исходный формат (json.dumps с отступами)
+compact — словарь вопросов без повторов и таблица ответов slot|state|score|answer
+"""
+
+import json
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+FORMAT_JSON = "json"
+FORMAT_COMPACT = "compact"
+
+# Грубая оценка: для смеси русского текста и кода около 3 символов на токен
+CHARS_PER_TOKEN = 3.0
+
+# Ступени сокращения текста вопроса при превышении бюджета (None — без ограничения)
+QUESTION_LIMITS = (None, 400, 200, 100, 50, 0)
+# Начиная с этой длины текста вопроса варианты ответов не выводятся
+CHOICES_MIN_LIMIT = 100
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов по длине текста"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _clip(text: str, limit: Optional[int]) -> str:
+    if limit is None or len(text) <= limit:
+        return text
+    if limit == 0:
+        return ""
+    return text[:limit].rstrip() + "…"
+
+
+def _letter(index: int) -> str:
+    return chr(ord("a") + index) if index < 26 else str(index + 1)
+
+
+def _strip_number(choice: str) -> str:
+    """Убирает нумерацию Moodle вида 'a. ' в начале варианта"""
+    return re.sub(r"^[a-zA-Zа-яА-Я0-9]{1,2}\.\s*", "", choice)
+
+
+def _choice_ref(value: Optional[str], choices: Tuple[str, ...]) -> Optional[str]:
+    """Заменяет текст ответа ссылкой на вариант (a, b, ...), если он совпадает с вариантом"""
+    if not value or not choices:
+        return value
+    stripped = [_strip_number(c) for c in choices]
+    # Сначала целиком (вариант сам может содержать запятые), затем как список выбранных вариантов
+    parts = [value.strip()] if _strip_number(value.strip()) in stripped else [p.strip() for p in value.split(", ")]
+    refs = []
+    for part in parts:
+        if part in choices:
+            refs.append(_letter(choices.index(part)))
+        elif _strip_number(part) in stripped:
+            refs.append(_letter(stripped.index(_strip_number(part))))
+        else:
+            return value
+    return ",".join(refs)
+
+
+@lru_cache(maxsize=4096)
+def _render_question(slot: Any, question: str, choices: Tuple[str, ...], correct: str, limit: Optional[int]) -> str:
+    """Строка словаря вопросов; одинаковые вопросы разных попыток рендерятся один раз"""
+    line = f"Q{slot}: {_clip(question, limit)}"
+    if choices and (limit is None or limit >= CHOICES_MIN_LIMIT):
+        rendered = "; ".join(f"{_letter(i)}) {_clip(_strip_number(c), limit)}" for i, c in enumerate(choices))
+        line += f" | {rendered}"
+    if correct:
+        ref = _choice_ref(correct, choices)
+        line += f" | верно: {ref if ref != correct else _clip(correct, limit)}"
+    return line
+
+
+def _format_score(score: Any) -> str:
+    try:
+        return f"{float(score):g}"
+    except (TypeError, ValueError):
+        return "0"
+
+
+def encode_compact(results_json: Dict[str, Any], limit: Optional[int] = None) -> str:
+    """Компактное представление попытки"""
+    answers: List[Dict[str, Any]] = results_json.get("answers", [])
+    header = f"student_id={results_json.get('student_id')} quiz_id={results_json.get('quiz_id')} attempt_id={results_json.get('attempt_id')}"
+
+    dictionary = []
+    rows = []
+    for a in answers:
+        choices = tuple(a.get("choices") or ())
+        if limit != 0:
+            dictionary.append(_render_question(
+                a.get("slot"), a.get("question") or "", choices, a.get("correct_answer") or "", limit
+            ))
+        answer = _choice_ref(a.get("student_answer"), choices) or ""
+        answer = answer.replace("|", "/").replace("\n", " ")
+        rows.append(f"{a.get('slot')}|{a.get('state') or ''}|{_format_score(a.get('score'))}|{_clip(answer, limit if limit else None)}")
+
+    parts = [header]
+    if dictionary:
+        parts.append("Вопросы (Q<слот>: текст | варианты | верно):")
+        parts.extend(dictionary)
+    parts.append("Ответы (slot|state|score|answer):")
+    parts.extend(rows)
+    return "\n".join(parts)
+
+
+def encode_results(results_json: Dict[str, Any], mode: str = FORMAT_JSON, token_budget: int = 0) -> str:
+    """Сериализует попытку для промпта; в компактном режиме укладывается в бюджет токенов, сокращая тексты"""
+    if mode != FORMAT_COMPACT:
+        return json.dumps(results_json, ensure_ascii=False, indent=2)
+
+    text = ""
+    for limit in QUESTION_LIMITS:
+        text = encode_compact(results_json, limit)
+        if not token_budget or estimate_tokens(text) <= token_budget:
+            break
+    return text
@@ -0,0 +1,149 @@
+"""
+Ограничение запросов к GigaChat: token bucket по RPS + семафор по числу одновременных запросов
+
+Скорость подстраивается по принципу AIMD: каждый успешный ответ увеличивает её на
+постоянный шаг, ответ 429/5xx уменьшает в несколько раз и приостанавливает выдачу
+слотов на время из Retry-After.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+
+class RateLimitExceeded(Exception):
+    """Запрос отклонён лимитером: очередь переполнена или ожидание слишком долгое"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает Retry-After (секунды или HTTP-дата) в число секунд"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """Token bucket с адаптивной скоростью и ограничением одновременных запросов"""
+
+    def __init__(
+        self,
+        rps: float,
+        burst: int,
+        max_concurrency: int,
+        min_rps: float,
+        increase_step: float,
+        decrease_factor: float,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.max_rps = rps
+        self.min_rps = min(min_rps, rps)
+        self.rate = rps
+        self._burst = max(1, burst)
+        self._increase_step = increase_step
+        self._decrease_factor = decrease_factor
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Выдача токенов по одному ожидающему за раз (asyncio.Lock справедлив — FIFO)
+        self._bucket_lock = asyncio.Lock()
+
+        self.queued = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _take_token(self):
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _acquire(self):
+        await self._semaphore.acquire()
+        try:
+            await self._take_token()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ожидает слот для запроса; RateLimitExceeded при переполнении очереди или таймауте ожидания"""
+        if self._max_queue and self.queued >= self._max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Очередь запросов к ИИ переполнена ({self.queued})")
+
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._acquire(), self._queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Превышено время ожидания слота для запроса к ИИ ({self._queue_timeout} с)")
+        finally:
+            self.queued -= 1
+
+        wait = time.monotonic() - start
+        self.acquired += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def on_success(self):
+        """Аддитивное увеличение скорости"""
+        self.rate = min(self.max_rps, self.rate + self._increase_step)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """Мультипликативное уменьшение скорости и пауза на Retry-After"""
+        self.throttled += 1
+        self.rate = max(self.min_rps, self.rate * self._decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 3),
+            "max_rps": self.max_rps,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "wait_avg": round(self.wait_total / self.acquired, 4) if self.acquired else 0.0,
+            "wait_max": round(self.wait_max, 4),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
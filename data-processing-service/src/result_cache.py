@@ -0,0 +1,110 @@
+"""
+Кэш результатов обработки попыток в SQLite
+Повторный запрос по той же попытке (ретрай из Moodle) не вызывает повторного анализа через ИИ
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ResultCache:
+    """Постоянный кэш результатов по attempt_id с TTL и ограничением размера (вытесняются давно не читанные)"""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.level_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    attempt_id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    level INTEGER,
+                    course_id INTEGER,
+                    enrolled INTEGER NOT NULL DEFAULT 0,
+                    response TEXT,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_idx ON results (accessed_at)")
+
+    def _get(self, attempt_id: int) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM results WHERE attempt_id = ?", (attempt_id,)).fetchone()
+            if row is None:
+                return None
+            if now - row["created_at"] > self._ttl:
+                self._conn.execute("DELETE FROM results WHERE attempt_id = ?", (attempt_id,))
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE attempt_id = ?", (now, attempt_id))
+        entry = dict(row)
+        entry["enrolled"] = bool(entry["enrolled"])
+        entry["response"] = json.loads(entry["response"]) if entry["response"] else None
+        return entry
+
+    def _put(self, attempt_id: int, user_id: int, level: int, course_id: Optional[int], enrolled: bool, response: Optional[Dict[str, Any]]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO results (attempt_id, user_id, level, course_id, enrolled, response, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (attempt_id, user_id, level, course_id, int(enrolled),
+                 json.dumps(response, ensure_ascii=False) if response is not None else None, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self._max_entries:
+                excess = count - self._max_entries
+                self._conn.execute(
+                    "DELETE FROM results WHERE attempt_id IN (SELECT attempt_id FROM results ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    async def get(self, attempt_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Возвращает запись по попытке или None; запись другого пользователя не используется"""
+        entry = await asyncio.to_thread(self._get, attempt_id)
+        if entry is None or entry["user_id"] != user_id:
+            self.misses += 1
+            return None
+        if entry["enrolled"]:
+            self.hits += 1
+        else:
+            self.level_hits += 1
+        return entry
+
+    async def put_level(self, attempt_id: int, user_id: int, level: int, course_id: int):
+        """Сохраняет определённый уровень до зачисления, чтобы ретрай не вызывал ИИ повторно"""
+        await asyncio.to_thread(self._put, attempt_id, user_id, level, course_id, False, None)
+
+    async def put_result(self, attempt_id: int, user_id: int, level: int, course_id: int, response: Dict[str, Any]):
+        """Сохраняет итог успешного зачисления"""
+        await asyncio.to_thread(self._put, attempt_id, user_id, level, course_id, True, response)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "level_hits": self.level_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,472 @@
+"""
+Разбор HTML вопросов из mod_quiz_get_attempt_review
+
+Извлечение текста выполняет движок: bs4 (BeautifulSoup + html.parser) или lxml.
+Оба движка дают одинаковый результат; общая логика (регулярные выражения,
+сопоставление состояний, баллы) не зависит от движка.
+
+Статические части вопроса (текст вопроса, правильный ответ) одинаковы для всех попыток
+одного теста, поэтому кэшируются по (тест, слот, вопрос, отпечаток текста вопроса и
+правильного ответа): исправленный правильный ответ при том же тексте даёт новую запись.
+Варианты ответов кэшируются отдельно по отпечатку блока ответов без атрибутов (порядок
+вариантов Moodle может перемешивать). Для попыток с уже известной структурой разбирается
+только блок ответов с данными студента — без текста вопроса и отзыва с правильным ответом.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Типы вопросов, у которых ответ студента находится только в блоке .ablock (а не внутри текста вопроса)
+CACHEABLE_TYPES = ("multichoice", "truefalse", "shortanswer", "numerical", "essay")
+# Типы с вариантами ответов: у остальных в блоке ответов текст студента, их варианты не кэшируются
+CHOICE_TYPES = ("multichoice", "truefalse")
+
+QTEXT_START_RE = re.compile(r'<div class="qtext"')
+ABLOCK_START_RE = re.compile(r'<div class="ablock[" ]')
+OUTCOME_START_RE = re.compile(r'<div class="outcome[" ]')
+RIGHTANSWER_START_RE = re.compile(r'<div class="rightanswer[" ]')
+# Ссылки на файлы вопроса содержат id попытки и слот: .../pluginfile.php/<контекст>/question/<область>/<попытка>/<слот>/...
+PLUGINFILE_USAGE_RE = re.compile(r'(pluginfile\.php/\d+/question/\w+/)\d+/\d+/')
+TAG_ATTRS_RE = re.compile(r'<(/?[a-zA-Z][\w-]*)[^>]*>')
+
+
+def to_float_score(s):
+    """Конвертирует строку в float для оценки"""
+    if s is None or s == "":
+        return 0.0
+    try:
+        # Moodle может использовать запятую
+        return float(str(s).replace(",", "."))
+    except:
+        try:
+            return float(re.findall(r"[\d\.]+", str(s))[0])
+        except:
+            return 0.0
+
+
+def extract_choice_label(label_el):
+    """Извлекает текст варианта ответа из HTML элемента"""
+    # обычно есть span.answernumber и div.flex-fill (или текст внутри)
+    number = label_el.find("span", class_="answernumber")
+    textpart = label_el.find(class_="flex-fill")
+    if textpart:
+        text = textpart.get_text(" ", strip=True)
+    else:
+        # fallback — весь текст
+        text = label_el.get_text(" ", strip=True)
+    if number:
+        num = number.get_text(" ", strip=True)
+        # убрать дублирование если number включён в text
+        text = text if num not in text else text
+        return f"{num}{text}".strip()
+    return text
+
+
+class Bs4Engine:
+    """Извлечение через BeautifulSoup с html.parser"""
+
+    name = "bs4"
+
+    def __init__(self):
+        # Импорт при создании движка: при разборе в пуле процессов основному процессу bs4 не нужен
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def parse(self, html: str):
+        return self._soup(html, "html.parser")
+
+    def question_text(self, soup) -> str:
+        qtext_tag = soup.find("div", class_="qtext")
+        return qtext_tag.get_text(" ", strip=True) if qtext_tag else soup.get_text(" ", strip=True)
+
+    def label_texts(self, soup) -> List[str]:
+        return [extract_choice_label(lab) for lab in soup.select('.answer [data-region="answer-label"]')]
+
+    def block_texts(self, soup) -> List[str]:
+        return [b.get_text(" ", strip=True) for b in soup.select('.answer .r0, .answer .r1')]
+
+    def rightanswer_text(self, soup) -> Optional[str]:
+        right_block = soup.find(class_="rightanswer")
+        return right_block.get_text(" ", strip=True) if right_block else None
+
+    def checked_texts(self, soup) -> List[str]:
+        vals = []
+        for inp in soup.select('input[checked], input[checked="checked"]'):
+            lab = inp.find_parent(attrs={"data-region": "answer-label"})
+            if lab:
+                vals.append(extract_choice_label(lab))
+            else:
+                vals.append(inp.parent.get_text(" ", strip=True))
+        return vals
+
+    def fragment_text(self, html: str) -> str:
+        return self._soup(html, "html.parser").get_text(" ", strip=True)
+
+
+class LxmlEngine:
+    """
+    Извлечение через lxml с той же семантикой, что у BeautifulSoup.get_text(" ", strip=True):
+    строки обрезаются и склеиваются пробелом, комментарии и содержимое script/style/template/rt/rp пропускаются
+    """
+
+    name = "lxml"
+
+    SKIP_TAGS = frozenset(("script", "style", "template", "rt", "rp"))
+
+    def __init__(self):
+        import lxml.html
+        self._fragment_fromstring = lxml.html.fragment_fromstring
+
+    def parse(self, html: str):
+        # Корневой div играет роль объекта BeautifulSoup: у элементов верхнего уровня есть родитель
+        return self._fragment_fromstring(html, create_parent="div")
+
+    @classmethod
+    def _strings(cls, el, out: List[str]):
+        if el.text:
+            out.append(el.text)
+        for child in el:
+            if isinstance(child.tag, str) and child.tag not in cls.SKIP_TAGS:
+                cls._strings(child, out)
+            if child.tail:
+                out.append(child.tail)
+
+    @classmethod
+    def text(cls, el) -> str:
+        strings: List[str] = []
+        cls._strings(el, strings)
+        return " ".join(s for s in (s.strip() for s in strings) if s)
+
+    @staticmethod
+    def _has_class(el, cls: str) -> bool:
+        value = el.get("class")
+        return value is not None and cls in value.split()
+
+    @classmethod
+    def _find_class(cls, root, name: str, tag: Optional[str] = None):
+        for el in root.iterdescendants(tag) if tag else root.iterdescendants():
+            if isinstance(el.tag, str) and cls._has_class(el, name):
+                return el
+        return None
+
+    @classmethod
+    def _in_answer(cls, el) -> bool:
+        return any(cls._has_class(a, "answer") for a in el.iterancestors())
+
+    @classmethod
+    def choice_label(cls, label_el) -> str:
+        """Аналог extract_choice_label для элемента lxml"""
+        number = cls._find_class(label_el, "answernumber", "span")
+        textpart = cls._find_class(label_el, "flex-fill")
+        text = cls.text(textpart) if textpart is not None else cls.text(label_el)
+        if number is not None:
+            return f"{cls.text(number)}{text}".strip()
+        return text
+
+    def question_text(self, root) -> str:
+        qtext_tag = self._find_class(root, "qtext", "div")
+        return self.text(qtext_tag) if qtext_tag is not None else self.text(root)
+
+    def label_texts(self, root) -> List[str]:
+        return [
+            self.choice_label(el) for el in root.iterdescendants()
+            if isinstance(el.tag, str) and el.get("data-region") == "answer-label" and self._in_answer(el)
+        ]
+
+    def block_texts(self, root) -> List[str]:
+        return [
+            self.text(el) for el in root.iterdescendants()
+            if isinstance(el.tag, str)
+            and (self._has_class(el, "r0") or self._has_class(el, "r1"))
+            and self._in_answer(el)
+        ]
+
+    def rightanswer_text(self, root) -> Optional[str]:
+        right_block = self._find_class(root, "rightanswer")
+        return self.text(right_block) if right_block is not None else None
+
+    def checked_texts(self, root) -> List[str]:
+        vals = []
+        for inp in root.iterdescendants("input"):
+            if inp.get("checked") is None:
+                continue
+            lab = next((a for a in inp.iterancestors() if a.get("data-region") == "answer-label"), None)
+            if lab is not None:
+                vals.append(self.choice_label(lab))
+            else:
+                vals.append(self.text(inp.getparent()))
+        return vals
+
+    def fragment_text(self, html: str) -> str:
+        return self.text(self.parse(html))
+
+
+_engines: Dict[str, Any] = {}
+
+
+def get_engine(name: str = "bs4"):
+    """Возвращает движок разбора по имени; если lxml не установлен — bs4"""
+    engine = _engines.get(name)
+    if engine is None:
+        if name == "lxml":
+            try:
+                engine = LxmlEngine()
+            except ImportError:
+                engine = get_engine("bs4")
+        else:
+            engine = Bs4Engine()
+        _engines[name] = engine
+    return engine
+
+
+def extract_choices(engine, doc):
+    """Варианты ответов"""
+    choices = []
+    for lab_text in engine.label_texts(doc):
+        if lab_text:
+            choices.append(re.sub(r'\s+', ' ', lab_text).strip())
+
+    # fallback, если нет data-region
+    if not choices:
+        for text in engine.block_texts(doc):
+            text = re.sub(r'\s+', ' ', text).strip()
+            if text:
+                choices.append(text)
+    return choices
+
+
+def extract_correct_answer(engine, doc):
+    """Правильный ответ"""
+    correct = ""
+    # получаем весь текст без тегов
+    txt = engine.rightanswer_text(doc)
+    if txt is not None:
+        # убираем префиксы вроде "Правильный ответ:" или "Correct Answer:"
+        txt = re.sub(r'^(Правильный ответ|Correct answer|Ответ):\s*', '', txt, flags=re.IGNORECASE)
+        # заменяем множественные пробелы на один
+        correct = re.sub(r'\s+', ' ', txt).strip()
+    return correct
+
+
+def extract_student_answer(engine, doc, q, raw_html, correct):
+    """Ответ студента"""
+    student_answer = None
+
+    # 1) checked inputs
+    vals = engine.checked_texts(doc)
+    if vals:
+        student_answer = ", ".join(vals)
+
+    # 2) API responses
+    if not student_answer and q.get("responses"):
+        vals = []
+        for r in q.get("responses", []):
+            a = r.get("answer", "")
+            if a:
+                vals.append(engine.fragment_text(a))
+        if vals:
+            student_answer = ", ".join(vals)
+
+    # 3) fallback "Сохранено:"
+    if not student_answer:
+        m = re.search(r'Сохранено:\s*([^<\n\r]+)', raw_html)
+        if m:
+            student_answer = m.group(1).strip()
+
+    # 4) state mapping
+    state = q.get("state", "").lower() or q.get("status", "").lower()
+    if not student_answer:
+        if state in ("gaveup", "noanswer", "todo", "notanswered"):
+            student_answer = "не ответил"
+        elif state in ("gradedright", "correct"):
+            student_answer = correct or "правильно"
+        elif state in ("gradedwrong", "wrong"):
+            student_answer = "неверно"
+        else:
+            student_answer = state or "неизвестно"
+    return student_answer
+
+
+def extract_score(q, student_answer):
+    """Балл за вопрос"""
+    raw_mark = q.get("mark") or q.get("marks") or q.get("score") or q.get("maxmark")
+    score = to_float_score(raw_mark)
+    if student_answer == "не ответил":
+        score = 0.0
+    return score
+
+
+def split_question_html(raw_html: str) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Делит HTML вопроса на части
+    Возвращает (html div.qtext, html div.ablock, разметка без div.qtext и отзыва, html от div.rightanswer до конца)
+    или None, если разметка нестандартная
+    """
+    start = QTEXT_START_RE.search(raw_html)
+    if not start:
+        return None
+    ablock = ABLOCK_START_RE.search(raw_html, start.end())
+    if not ablock:
+        return None
+    outcome = OUTCOME_START_RE.search(raw_html, ablock.end())
+    end = outcome.start() if outcome else len(raw_html)
+    # Отзыв на ответ студента у попыток разный, правильный ответ — общий
+    rightanswer = RIGHTANSWER_START_RE.search(raw_html, end)
+    return (
+        raw_html[start.start():ablock.start()],
+        raw_html[ablock.start():end],
+        raw_html[:start.start()] + raw_html[ablock.start():end],
+        raw_html[rightanswer.start():] if rightanswer else "",
+    )
+
+
+def normalize_pluginfile_urls(html: str) -> str:
+    """Убирает из ссылок на файлы вопроса id попытки и слот"""
+    return PLUGINFILE_USAGE_RE.sub(r"\1", html) if "pluginfile.php" in html else html
+
+
+class QuizStructureCache:
+    """LRU-кэш статических частей вопросов с TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Кэш используется и из потоков пула разбора
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(quiz_id, q, qtext_html: str, rightanswer_html: str = "") -> tuple:
+        # Отпечаток меняется при редактировании текста вопроса или правильного ответа
+        # (review не содержит questionid, новая версия вопроса видна только по разметке);
+        # ссылки на картинки у каждой попытки свои и в отпечаток не входят
+        digest = hashlib.sha1(normalize_pluginfile_urls(qtext_html).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_pluginfile_urls(rightanswer_html).encode("utf-8"))
+        fingerprint = digest.hexdigest()
+        return (quiz_id, q.get("slot"), q.get("questionid"), q.get("type"), fingerprint)
+
+    @staticmethod
+    def choices_key(key: tuple, ablock_html: str) -> tuple:
+        # Без атрибутов (id, name, checked, классы оценки) остаются теги и текст вариантов в порядке попытки
+        fingerprint = hashlib.sha1(TAG_ATTRS_RE.sub(r"<\1>", ablock_html).encode("utf-8")).hexdigest()
+        return key + ("choices", fingerprint)
+
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self._ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, structure: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), structure)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id=None) -> int:
+        """Удаляет структуру указанного теста (или всех тестов); возвращает число удалённых записей"""
+        with self._lock:
+            if quiz_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [k for k in self._entries if k[0] == quiz_id]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def parse_question(q: Dict[str, Any], quiz_id=None, cache: Optional[QuizStructureCache] = None, engine=None) -> Dict[str, Any]:
+    """Преобразует вопрос из review в словарь для ИИ"""
+    engine = engine or get_engine()
+    raw_html = q.get("html", "")
+
+    parts = split_question_html(raw_html) if cache is not None and q.get("type") in CACHEABLE_TYPES else None
+    structure = None
+    key = None
+    choices_key = None
+    choices = None
+    if parts:
+        key = cache.make_key(quiz_id, q, parts[0], parts[3])
+        structure = cache.get(key)
+        if q.get("type") in CHOICE_TYPES:
+            choices_key = cache.choices_key(key, parts[1])
+
+    if structure is not None:
+        # Структура известна — разбираем только блок ответов (без текста вопроса и отзыва)
+        doc = engine.parse(parts[2])
+        question_text = structure["question"]
+        correct = structure["correct_answer"]
+        if choices_key is not None:
+            cached = cache.get(choices_key)
+            choices = list(cached["choices"]) if cached is not None else None
+    else:
+        doc = engine.parse(raw_html)
+        question_text = engine.question_text(doc)
+        correct = extract_correct_answer(engine, doc)
+        if key is not None:
+            cache.put(key, {"question": question_text, "correct_answer": correct})
+
+    if choices is None:
+        choices = extract_choices(engine, doc)
+        if choices_key is not None:
+            cache.put(choices_key, {"choices": choices})
+    student_answer = extract_student_answer(engine, doc, q, raw_html, correct)
+    score = extract_score(q, student_answer)
+
+    return {
+        "slot": q.get("slot"),
+        "question": question_text,
+        "choices": choices,
+        "student_answer": student_answer,
+        "correct_answer": correct,
+        "score": score,
+        "state": q.get("state", "")
+    }
+
+
+def parse_review_questions(questions: List[Dict[str, Any]], quiz_id=None, cache: Optional[QuizStructureCache] = None, backend: str = "bs4") -> List[Dict[str, Any]]:
+    """Разбирает все вопросы попытки выбранным движком"""
+    engine = get_engine(backend)
+    return [parse_question(q, quiz_id, cache, engine) for q in questions]
+
+
+# Состояние процесса-воркера пула разбора (см. parse_pool): у каждого процесса свой кэш структуры
+_worker_cache: Optional[QuizStructureCache] = None
+_worker_epoch = 0
+
+
+def init_worker(cache_max_entries: int, cache_ttl: float):
+    """Инициализатор процесса пула разбора; cache_max_entries=0 — без кэша структуры"""
+    global _worker_cache
+    _worker_cache = QuizStructureCache(cache_max_entries, cache_ttl) if cache_max_entries else None
+
+
+def parse_in_worker(questions: List[Dict[str, Any]], quiz_id, backend: str, epoch: int) -> List[Dict[str, Any]]:
+    """
+    Разбор попытки в процессе пула
+    epoch увеличивается при сбросе кэша структуры в основном процессе: воркер, увидев новое значение,
+    очищает свой кэш целиком
+    """
+    global _worker_epoch
+    if _worker_cache is not None and epoch != _worker_epoch:
+        _worker_cache.invalidate()
+        _worker_epoch = epoch
+    return parse_review_questions(questions, quiz_id, _worker_cache, backend)
@@ -1,31 +1,75 @@
 #!/usr/bin/env python3
 """
 Скрипт запуска FastAPI сервера для Moodle Entrance Testing
+
+Режим задаётся настройками SERVER_*: число процессов (SERVER_WORKERS), цикл событий
+и HTTP-парсер (uvloop/httptools при наличии), время плавной остановки. SERVER_RELOAD=true —
+режим разработки с перезапуском при изменении кода (один процесс).
 """
 
+import os
+import tempfile
 import uvicorn
 import logging
 from config import settings
+from job_queue import JobStore
+from placement import get_placement_registry
 
-if __name__ == "__main__":
+
+def prepare_multiprocess_metrics() -> str:
+    """Каталог для метрик Prometheus, общих для процессов сервера (очищается при запуске)"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.path.join(
+        tempfile.gettempdir(), f"entrance-testing-metrics-{settings.server_port}"
+    )
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    # Процессы сервера наследуют окружение и включают режим нескольких процессов в metrics.py
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def main():
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
-    
+
+    workers = 1 if settings.server_reload else settings.server_workers
+
     logger.info("Запуск FastAPI сервера для Moodle Entrance Testing")
     logger.info(f"Moodle URL: {settings.moodle_url}")
-    logger.info(f"Entry Test ID: {settings.entry_test_id}")
-    logger.info(f"Courses mapping: {settings.courses}")
+    # Ошибка в файле настроек распределения останавливает запуск до старта процессов
+    registry = get_placement_registry()
+    for quiz_id in registry.quiz_ids():
+        placement = registry.get(quiz_id)
+        logger.info(f"Тест {quiz_id} {placement.name}: курсы по уровням {placement.courses}")
     logger.info(f"AI Model: {settings.ai_model}")
-    
+    logger.info(
+        f"Процессов: {workers}, loop={settings.server_loop}, http={settings.server_http}, "
+        f"reload={settings.server_reload}, плавная остановка {settings.server_graceful_timeout} с"
+    )
+
+    if workers > 1:
+        logger.info(f"Метрики процессов: {prepare_multiprocess_metrics()}")
+        # Задачи, прерванные прошлой остановкой, возвращаются в очередь один раз, до запуска процессов
+        job_store = JobStore(settings.job_store_path)
+        pending = job_store.recover()
+        job_store.close()
+        if pending:
+            logger.info(f"Задач в очереди: {len(pending)}")
+
     uvicorn.run(
         "fastapi_server:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        host=settings.server_host,
+        port=settings.server_port,
+        workers=workers,
+        reload=settings.server_reload,
+        loop=settings.server_loop,
+        http=settings.server_http,
+        timeout_graceful_shutdown=settings.server_graceful_timeout,
         log_level="info"
     )
 
 
-
-
-
+if __name__ == "__main__":
+    main()
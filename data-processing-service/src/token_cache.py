@@ -0,0 +1,62 @@
+"""
+Кэш OAuth-токена GigaChat с обновлением до истечения срока действия
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+class TokenCache:
+    """Хранит токен вместе с expires_at и обновляет его одним запросом на всю пачку ожидающих"""
+
+    def __init__(self, fetcher: Callable[[], Awaitable[Tuple[str, float]]], refresh_margin: float):
+        # fetcher возвращает (access_token, expires_at в секундах unix time)
+        self._fetcher = fetcher
+        self._refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at: float = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def _is_fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self._refresh_margin
+
+    async def get(self) -> str:
+        """Возвращает действующий токен, при необходимости обновляя его"""
+        if self._is_fresh():
+            self.hits += 1
+            return self._token
+
+        self.misses += 1
+        async with self._lock:
+            # Пока ждали блокировку, токен мог обновить другой запрос
+            if self._is_fresh():
+                return self._token
+            try:
+                token, expires_at = await self._fetcher()
+            except Exception:
+                self.errors += 1
+                raise
+            self._token = token
+            self._expires_at = expires_at
+            self.refreshes += 1
+            return token
+
+    def invalidate(self):
+        """Сбрасывает токен (например, после ответа 401)"""
+        self._token = None
+        self._expires_at = 0.0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "has_token": self._token is not None,
+            "expires_in": max(0.0, round(self._expires_at - time.time(), 1)) if self._token else None,
+        }
@@ -0,0 +1,150 @@
+"""
+Трассировка этапов обработки попытки (по модели OpenTelemetry, без внешнего коллектора)
+
+Каждый завершённый span записывается одной JSON-строкой в файл (TRACING_EXPORTER=file)
+или в консоль (console): trace_id, span_id, parent_span_id, name, start/end (unix ns),
+duration_ms, status, attributes.
+
+Контекст передаётся заголовком W3C traceparent (00-<trace_id>-<span_id>-<flags>):
+плагин Moodle формирует его из id записи очереди, поэтому все повторы отправки одной
+записи попадают в один trace. Без заголовка создаётся новый trace.
+При TRACING_ENABLED=false span() ничего не делает.
+"""
+
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from config import settings
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# (trace_id, span_id, удалённый ли) текущего span или родителя из заголовка
+_current: ContextVar[Optional[Tuple[str, str, bool]]] = ContextVar("trace_context", default=None)
+
+_lock = threading.Lock()
+_file = None
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Возвращает (trace_id, parent_span_id) из заголовка traceparent или None"""
+    if not value:
+        return None
+    m = TRACEPARENT_RE.match(value.strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return m.group(1), m.group(2)
+
+
+def start_trace(traceparent: Optional[str]):
+    """Устанавливает удалённый родительский контекст для последующих span текущей задачи"""
+    if settings.tracing_enabled:
+        parent = parse_traceparent(traceparent)
+        _current.set((parent[0], parent[1], True) if parent else None)
+
+
+def current_traceparent() -> Optional[str]:
+    ctx = _current.get()
+    return f"00-{ctx[0]}-{ctx[1]}-01" if ctx else None
+
+
+def _export(record: Dict[str, Any], flush: bool):
+    global _file
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        if settings.tracing_exporter == "console":
+            print(line, file=sys.stderr)
+            return
+        if _file is None:
+            _file = open(settings.tracing_file, "a", encoding="utf-8")
+        _file.write(line + "\n")
+        if flush:
+            _file.flush()
+
+
+def close_tracing():
+    """Сбрасывает и закрывает файл трасс"""
+    global _file
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+
+
+class Span:
+    __slots__ = ("attributes", "status")
+
+    def __init__(self, attributes: Dict[str, Any]):
+        self.attributes = attributes
+        self.status = "OK"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Span вокруг блока кода; вложенные span становятся дочерними"""
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    parent = _current.get()
+    trace_id = parent[0] if parent else _new_id(16)
+    span_id = _new_id(8)
+    token = _current.set((trace_id, span_id, False))
+    current = Span(attributes)
+    start = time.time_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "ERROR"
+        current.attributes["exception"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.time_ns()
+        _current.reset(token)
+        # Файл сбрасывается на диск по завершении корневого span процесса
+        _export({
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent[1] if parent else None,
+            "name": name,
+            "start": start,
+            "end": end,
+            "duration_ms": round((end - start) / 1e6, 3),
+            "status": current.status,
+            "attributes": current.attributes,
+        }, flush=parent is None or parent[2])
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор асинхронной функции: span с именем функции и её простыми аргументами в атрибутах"""
+    def decorator(func):
+        span_name = name or func.__name__
+        params = list(inspect.signature(func).parameters)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not settings.tracing_enabled:
+                return await func(*args, **kwargs)
+            attributes = {
+                k: v for k, v in [*zip(params, args), *kwargs.items()]
+                if isinstance(v, (int, float, str, bool))
+            }
+            with span(span_name, **attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
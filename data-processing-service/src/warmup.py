@@ -0,0 +1,100 @@
+"""
+Прогрев процесса сервера и готовность к приёму трафика (/ready)
+
+После запуска процесса проверки выполняются в фоне: /health отвечает сразу, а /ready —
+только когда все проверки из WARMUP_CHECKS прошли (процессы пула разбора запущены,
+токен GigaChat получен, соединение с Moodle открыто). Неудавшаяся проверка повторяется
+через WARMUP_RETRY_INTERVAL секунд. Готовность устанавливается один раз и снимается
+только при остановке процесса, чтобы балансировщик перестал присылать новые запросы.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Фоновые проверки прогрева процесса"""
+
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[Any]]], retry_interval: float):
+        self._checks = checks
+        self._retry_interval = retry_interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started_at = time.monotonic()
+        self.ready_after: Optional[float] = None
+        self.stopping = False
+        self.state = {name: {"done": False, "attempts": 0, "seconds": None, "last_error": None} for name in checks}
+
+    async def _run(self, name: str, check: Callable[[], Awaitable[Any]]):
+        state = self.state[name]
+        while True:
+            state["attempts"] += 1
+            try:
+                await check()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state["last_error"] = f"{type(e).__name__}: {e}"
+                logger.warning(f"Прогрев {name} не удался (попытка {state['attempts']}): {e}")
+            await asyncio.sleep(self._retry_interval)
+        state["done"] = True
+        state["seconds"] = round(time.monotonic() - self._started_at, 3)
+        state["last_error"] = None
+        if self.ready_after is None and all(s["done"] for s in self.state.values()):
+            self.ready_after = state["seconds"]
+            logger.info(f"Процесс готов к приёму запросов через {self.ready_after} с после запуска")
+
+    def start(self):
+        if not self._checks:
+            self.ready_after = 0.0
+        for name, check in self._checks.items():
+            self._tasks[name] = asyncio.ensure_future(self._run(name, check))
+
+    async def close(self):
+        """Снимает готовность и отменяет незавершённые проверки"""
+        self.stopping = True
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None and not self.stopping
+
+    def pending(self):
+        return [name for name, s in self.state.items() if not s["done"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "ready_after": self.ready_after,
+            "stopping": self.stopping,
+            "checks": self.state,
+        }
+
+
+_warmup: Optional[Warmup] = None
+
+
+def get_warmup() -> Optional[Warmup]:
+    """Прогрев текущего процесса (None до запуска lifespan)"""
+    return _warmup
+
+
+def start_warmup(checks: Dict[str, Callable[[], Awaitable[Any]]], retry_interval: float) -> Warmup:
+    """Запускает проверки прогрева в фоне (вызывается из lifespan)"""
+    global _warmup
+    _warmup = Warmup(checks, retry_interval)
+    _warmup.start()
+    return _warmup
+
+
+async def close_warmup():
+    """Снимает готовность процесса в начале остановки"""
+    if _warmup is not None:
+        await _warmup.close()
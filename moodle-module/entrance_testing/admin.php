@@ -33,6 +33,9 @@ if ($data = data_submitted() && confirm_sesskey()) {
     if (isset($data->retry_attempts)) {
         set_config('retry_attempts', $data->retry_attempts, 'local_entrance_testing');
     }
+    if (isset($data->batch_size)) {
+        set_config('batch_size', $data->batch_size, 'local_entrance_testing');
+    }
     
     redirect($PAGE->url, get_string('settings_saved', 'local_entrance_testing'), null, \core\output\notification::NOTIFY_SUCCESS);
 }
@@ -54,6 +57,10 @@ $form->api_url = get_config('local_entrance_testing', 'api_url') ?: 'http://loca
 $form->entry_test_id = get_config('local_entrance_testing', 'entry_test_id') ?: 2;
 $form->timeout = get_config('local_entrance_testing', 'timeout') ?: 30;
 $form->retry_attempts = get_config('local_entrance_testing', 'retry_attempts') ?: 3;
+$form->batch_size = get_config('local_entrance_testing', 'batch_size');
+if ($form->batch_size === false || $form->batch_size === '') {
+    $form->batch_size = 50;
+}
 
 echo html_writer::start_tag('form', array('method' => 'post', 'action' => $PAGE->url));
 echo html_writer::empty_tag('input', array('type' => 'hidden', 'name' => 'sesskey', 'value' => sesskey()));
@@ -72,10 +79,10 @@ echo html_writer::end_tag('tr');
 echo html_writer::start_tag('tr');
 echo html_writer::tag('td', get_string('entry_test_id', 'local_entrance_testing') . ':');
 echo html_writer::tag('td', html_writer::empty_tag('input', array(
-    'type' => 'number',
+    'type' => 'text',
     'name' => 'entry_test_id',
     'value' => $form->entry_test_id,
-    'min' => 1
+    'pattern' => '[0-9]+([ ,;]+[0-9]+)*'
 )));
 echo html_writer::end_tag('tr');
 
@@ -101,6 +108,17 @@ echo html_writer::tag('td', html_writer::empty_tag('input', array(
 )));
 echo html_writer::end_tag('tr');
 
+echo html_writer::start_tag('tr');
+echo html_writer::tag('td', get_string('batch_size', 'local_entrance_testing') . ':');
+echo html_writer::tag('td', html_writer::empty_tag('input', array(
+    'type' => 'number',
+    'name' => 'batch_size',
+    'value' => $form->batch_size,
+    'min' => 1,
+    'max' => 500
+)));
+echo html_writer::end_tag('tr');
+
 echo html_writer::end_tag('table');
 
 echo html_writer::tag('p', html_writer::empty_tag('input', array(
@@ -0,0 +1,98 @@
+<?php
+namespace local_entrance_testing\external;
+
+defined('MOODLE_INTERNAL') || die();
+
+global $CFG;
+require_once($CFG->libdir . '/externallib.php');
+
+use external_api;
+use external_function_parameters;
+use external_multiple_structure;
+use external_single_structure;
+use external_value;
+
+/**
+ * Завершённые попытки теста для всех пользователей одним запросом на страницу.
+ *
+ * Попытки упорядочены по (timefinish, id); клиент передаёт timefinish и id последней
+ * полученной попытки и получает только более поздние, поэтому повторная загрузка
+ * передаёт лишь новые попытки.
+ *
+ * @package    local_entrance_testing
+ */
+class get_quiz_attempts extends external_api {
+
+    /** Максимальный размер страницы */
+    const MAX_LIMIT = 5000;
+
+    public static function execute_parameters(): external_function_parameters {
+        return new external_function_parameters([
+            'quizid'    => new external_value(PARAM_INT, 'ID теста'),
+            'sincetime' => new external_value(PARAM_INT, 'timefinish последней полученной попытки', VALUE_DEFAULT, 0),
+            'sinceid'   => new external_value(PARAM_INT, 'id последней полученной попытки', VALUE_DEFAULT, 0),
+            'limit'     => new external_value(PARAM_INT, 'Размер страницы', VALUE_DEFAULT, 1000),
+        ]);
+    }
+
+    public static function execute(int $quizid, int $sincetime = 0, int $sinceid = 0, int $limit = 1000): array {
+        global $DB;
+
+        $params = self::validate_parameters(self::execute_parameters(), [
+            'quizid'    => $quizid,
+            'sincetime' => $sincetime,
+            'sinceid'   => $sinceid,
+            'limit'     => $limit,
+        ]);
+
+        $cm = get_coursemodule_from_instance('quiz', $params['quizid'], 0, false, MUST_EXIST);
+        $context = \context_module::instance($cm->id);
+        self::validate_context($context);
+        require_capability('mod/quiz:viewreports', $context);
+
+        $limit = max(1, min(self::MAX_LIMIT, $params['limit']));
+        $sql = "SELECT id, userid, attempt, timefinish
+                  FROM {quiz_attempts}
+                 WHERE quiz = :quizid
+                   AND state = :state
+                   AND preview = 0
+                   AND (timefinish > :sincetime1 OR (timefinish = :sincetime2 AND id > :sinceid))
+              ORDER BY timefinish, id";
+        $records = $DB->get_records_sql($sql, [
+            'quizid'     => $params['quizid'],
+            'state'      => 'finished',
+            'sincetime1' => $params['sincetime'],
+            'sincetime2' => $params['sincetime'],
+            'sinceid'    => $params['sinceid'],
+        ], 0, $limit);
+
+        $attempts = [];
+        foreach ($records as $record) {
+            $attempts[] = [
+                'id'         => (int)$record->id,
+                'userid'     => (int)$record->userid,
+                'attempt'    => (int)$record->attempt,
+                'timefinish' => (int)$record->timefinish,
+            ];
+        }
+
+        return [
+            'attempts' => $attempts,
+            'hasmore'  => count($attempts) === $limit,
+        ];
+    }
+
+    public static function execute_returns(): external_single_structure {
+        return new external_single_structure([
+            'attempts' => new external_multiple_structure(
+                new external_single_structure([
+                    'id'         => new external_value(PARAM_INT, 'ID попытки'),
+                    'userid'     => new external_value(PARAM_INT, 'ID пользователя'),
+                    'attempt'    => new external_value(PARAM_INT, 'Номер попытки пользователя'),
+                    'timefinish' => new external_value(PARAM_INT, 'Время завершения'),
+                ])
+            ),
+            'hasmore'  => new external_value(PARAM_BOOL, 'Есть ли ещё попытки после этой страницы'),
+        ]);
+    }
+}
@@ -16,8 +16,6 @@ class send_queue_records extends \core\task\scheduled_task {
         global $DB;
 
         $records = $DB->get_records('local_entrance_testing_queue', ['timesent' => 0]);
-        foreach ($records as $rec) {
-            \local_entrance_testing_send_queue_record($rec);
-        }
+        \local_entrance_testing_send_queue_records($records);
     }
 }
@@ -22,6 +22,7 @@ function xmldb_local_entrance_testing_install() {
     set_config('entry_test_id', 2, 'local_entrance_testing');
     set_config('timeout', 30, 'local_entrance_testing');
     set_config('retry_attempts', 3, 'local_entrance_testing');
+    set_config('batch_size', 50, 'local_entrance_testing');
     
     return true;
 }
@@ -0,0 +1,20 @@
+<?php
+/**
+ * Web-service функции модуля local_entrance_testing
+ *
+ * @package    local_entrance_testing
+ * @copyright  2024
+ * @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+ */
+
+defined('MOODLE_INTERNAL') || die();
+
+$functions = [
+    'local_entrance_testing_get_quiz_attempts' => [
+        'classname'    => 'local_entrance_testing\external\get_quiz_attempts',
+        'methodname'   => 'execute',
+        'description'  => 'Завершённые попытки теста постранично, начиная после курсора (timefinish, id)',
+        'type'         => 'read',
+        'capabilities' => 'mod/quiz:viewreports',
+    ],
+];
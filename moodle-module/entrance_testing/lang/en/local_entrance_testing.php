@@ -15,11 +15,13 @@ $string['settings'] = 'Settings';
 $string['api_url'] = 'API URL';
 $string['api_url_desc'] = 'URL of the FastAPI server for analyzing test results';
 $string['entry_test_id'] = 'Entry Test ID';
-$string['entry_test_id_desc'] = 'ID of the entrance test to monitor';
+$string['entry_test_id_desc'] = 'ID of the entrance test to monitor; several tests (e.g. one per faculty) are separated by commas';
 $string['timeout'] = 'Request Timeout';
 $string['timeout_desc'] = 'Timeout for HTTP requests to API server (seconds)';
 $string['retry_attempts'] = 'Retry Attempts';
 $string['retry_attempts_desc'] = 'Number of retry attempts if API request fails';
+$string['batch_size'] = 'Batch Size';
+$string['batch_size_desc'] = 'Number of queue records sent to the API in one batch request (1 - send one by one). A batch is tried once per task run; unsent records are retried by the next run';
 $string['api_status'] = 'API Status';
 $string['api_status_desc'] = 'Current status of the API server';
 $string['test_connection'] = 'Test Connection';
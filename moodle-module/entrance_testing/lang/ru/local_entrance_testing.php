@@ -15,11 +15,13 @@ $string['settings'] = 'Настройки';
 $string['api_url'] = 'URL API';
 $string['api_url_desc'] = 'URL сервера FastAPI для анализа результатов теста';
 $string['entry_test_id'] = 'ID входного теста';
-$string['entry_test_id_desc'] = 'ID теста, который нужно отслеживать';
+$string['entry_test_id_desc'] = 'ID теста, который нужно отслеживать; несколько тестов (например, по одному на факультет) указываются через запятую';
 $string['timeout'] = 'Таймаут запроса';
 $string['timeout_desc'] = 'Таймаут для HTTP запросов к API серверу (секунды)';
 $string['retry_attempts'] = 'Количество попыток';
 $string['retry_attempts_desc'] = 'Количество попыток повтора при ошибке API запроса';
+$string['batch_size'] = 'Размер пакета';
+$string['batch_size_desc'] = 'Количество записей очереди, отправляемых в API одним пакетным запросом (1 - по одной). Пакет отправляется один раз за запуск задачи; неотправленные записи повторяет следующий запуск';
 $string['api_status'] = 'Статус API';
 $string['api_status_desc'] = 'Текущий статус API сервера';
 $string['test_connection'] = 'Проверить соединение';
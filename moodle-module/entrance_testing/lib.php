@@ -1,6 +1,21 @@
 <?php
 defined('MOODLE_INTERNAL') || die();
 
+/** Upper bound for one batch request, seconds (the per-record timeout still applies to small chunks). */
+define('LOCAL_ENTRANCE_TESTING_BATCH_TIMEOUT_CAP', 120);
+
+/**
+ * Entry test ids from the entry_test_id setting ("2" or "2, 17, 31").
+ *
+ * @return int[]
+ */
+function local_entrance_testing_entry_test_ids() {
+    $ids = array_map('intval', preg_split('/[\s,;]+/', (string)get_config('local_entrance_testing', 'entry_test_id')));
+    return array_values(array_unique(array_filter($ids, function($id) {
+        return $id > 0;
+    })));
+}
+
 /**
  * Observer for mod_quiz attempt_graded event.
  * Only writes minimal data to queue table (no external requests here).
@@ -20,13 +35,13 @@ function local_entrance_testing_observer_attempt_graded(\mod_quiz\event\attempt_
             return;
         }
 
-        // Only for configured entry test
-        $entry_test_id = (int)get_config('local_entrance_testing', 'entry_test_id');
-        if ($entry_test_id <= 0) {
+        // Only for configured entry tests (comma-separated quiz ids, one per faculty)
+        $entry_test_ids = local_entrance_testing_entry_test_ids();
+        if (!$entry_test_ids) {
             error_log("[EntranceTesting] entry_test_id not configured");
             return;
         }
-        if ((int)$quiz->id !== $entry_test_id) {
+        if (!in_array((int)$quiz->id, $entry_test_ids, true)) {
             return;
         }
 
@@ -61,6 +76,21 @@ function local_entrance_testing_observer_attempt_graded(\mod_quiz\event\attempt_
 }
 
 
+/**
+ * W3C traceparent header value for a queue record.
+ * Trace id is derived from the queue row id, so every send attempt of the same
+ * record lands in one trace on the service side; span id changes per attempt.
+ *
+ * @param stdClass $queue_record record from local_entrance_testing_queue
+ * @return string
+ */
+function local_entrance_testing_traceparent(stdClass $queue_record): string {
+    $traceid = md5('local_entrance_testing:queue:' . $queue_record->id);
+    $spanid = substr(md5('local_entrance_testing:send:' . $queue_record->id . ':' . (int)$queue_record->attempts), 0, 16);
+    return "00-{$traceid}-{$spanid}-01";
+}
+
+
 /**
  * Send single queue record to external API.
  * This is safe to call from scheduled task (cron).
@@ -102,7 +132,10 @@ function local_entrance_testing_send_queue_record(stdClass $queue_record): bool
     curl_setopt($ch, CURLOPT_URL, $api_url);
     curl_setopt($ch, CURLOPT_POST, true);
     curl_setopt($ch, CURLOPT_POSTFIELDS, $json);
-    curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+    curl_setopt($ch, CURLOPT_HTTPHEADER, [
+        'Content-Type: application/json',
+        'traceparent: ' . local_entrance_testing_traceparent($queue_record),
+    ]);
     curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
     curl_setopt($ch, CURLOPT_TIMEOUT, $timeout);
     curl_setopt($ch, CURLOPT_CONNECTTIMEOUT, 5);
@@ -174,6 +207,183 @@ function local_entrance_testing_send_queue_record(stdClass $queue_record): bool
 }
 
 
+/**
+ * Send queue records to external API in chunks via the batch endpoint.
+ * Records are grouped into chunks of 'batch_size' and each chunk is sent
+ * as one POST to "<api_url>/batch". With batch_size <= 1, or if the service
+ * has no batch endpoint (HTTP 404/405), records are sent one by one.
+ *
+ * Returns number of successfully sent records.
+ *
+ * @param stdClass[] $records records from local_entrance_testing_queue
+ * @return int
+ */
+function local_entrance_testing_send_queue_records(array $records): int {
+    global $DB;
+
+    if (empty($records)) {
+        return 0;
+    }
+
+    $batchsize = get_config('local_entrance_testing', 'batch_size');
+    $batchsize = ($batchsize === false || $batchsize === '') ? 50 : (int)$batchsize;
+
+    $sent = 0;
+    if ($batchsize <= 1) {
+        foreach ($records as $rec) {
+            if (local_entrance_testing_send_queue_record($rec)) {
+                $sent++;
+            }
+        }
+        return $sent;
+    }
+
+    $api_url = trim(get_config('local_entrance_testing', 'api_url'));
+    if (empty($api_url)) {
+        foreach ($records as $rec) {
+            $DB->update_record('local_entrance_testing_queue', (object)[
+                'id' => $rec->id,
+                'status' => 'no_api_url',
+                'timesent' => 0,
+                'attempts' => $rec->attempts + 1
+            ]);
+        }
+        error_log("[EntranceTesting] API URL not configured");
+        return 0;
+    }
+    $batch_url = rtrim($api_url, '/') . '/batch';
+
+    $timeout = (int)(get_config('local_entrance_testing', 'timeout') ?: 15);
+    $verify = (int)(get_config('local_entrance_testing', 'ssl_verify') ?: 0);
+
+    foreach (array_chunk(array_values($records), $batchsize) as $chunk) {
+        $items = [];
+        foreach ($chunk as $rec) {
+            $items[] = [
+                'user_id' => (int)$rec->userid,
+                'quiz_id' => (int)$rec->quizid,
+                'attempt_id' => (int)$rec->attemptid,
+                'attempt_state' => $rec->state,
+                'time_queued' => (int)$rec->timecreated,
+                'traceparent' => local_entrance_testing_traceparent($rec),
+            ];
+        }
+        $json = json_encode(['items' => $items], JSON_UNESCAPED_UNICODE);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $batch_url);
+        curl_setopt($ch, CURLOPT_POST, true);
+        curl_setopt($ch, CURLOPT_POSTFIELDS, $json);
+        curl_setopt($ch, CURLOPT_HTTPHEADER, ['Content-Type: application/json']);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+        // The service processes a chunk concurrently; the cap keeps one chunk from blocking cron for long
+        curl_setopt($ch, CURLOPT_TIMEOUT, max($timeout, min($timeout * count($chunk), LOCAL_ENTRANCE_TESTING_BATCH_TIMEOUT_CAP)));
+        curl_setopt($ch, CURLOPT_CONNECTTIMEOUT, 5);
+        curl_setopt($ch, CURLOPT_SSL_VERIFYPEER, (bool)$verify);
+        curl_setopt($ch, CURLOPT_SSL_VERIFYHOST, $verify ? 2 : 0);
+
+        // One try per chunk per run: retries are left to the adhoc task queued below,
+        // so a slow service cannot hold the cron task for retry_attempts x timeout per chunk
+        $results = null;
+        $laststatus = '';
+        $fallback = false;
+        $unavailable = false;
+        $response = curl_exec($ch);
+        $errno = curl_errno($ch);
+        $err = $errno ? curl_error($ch) : '';
+        $http = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+
+        if ($errno) {
+            $laststatus = "curl_err:{$errno}";
+            $unavailable = true;
+            error_log("[EntranceTesting] curl error for batch of " . count($chunk) . ": {$err}");
+        } else if ($http >= 500) {
+            $laststatus = "http_{$http}";
+            $unavailable = true;
+            error_log("[EntranceTesting] server error HTTP {$http} for batch of " . count($chunk));
+        } else if ($http == 404 || $http == 405) {
+            // Service without batch endpoint — send records one by one
+            $fallback = true;
+        } else if ($http >= 200 && $http < 300) {
+            $decoded = json_decode($response, true);
+            if (is_array($decoded) && isset($decoded['results']) && is_array($decoded['results'])) {
+                $results = $decoded['results'];
+            } else {
+                $laststatus = 'resp:' . substr($response, 0, 200);
+                error_log("[EntranceTesting] unexpected batch API response: {$response}");
+            }
+        } else {
+            $laststatus = "http_{$http}";
+            error_log("[EntranceTesting] client HTTP {$http} for batch of " . count($chunk) . ": {$response}");
+        }
+
+        curl_close($ch);
+
+        if ($fallback) {
+            error_log("[EntranceTesting] batch endpoint not available, sending records one by one");
+            foreach ($chunk as $rec) {
+                if (local_entrance_testing_send_queue_record($rec)) {
+                    $sent++;
+                }
+            }
+            continue;
+        }
+
+        // Map per-item results back to queue records by attempt id
+        $byattempt = [];
+        if ($results !== null) {
+            foreach ($results as $item) {
+                if (isset($item['attempt_id'])) {
+                    $byattempt[(int)$item['attempt_id']] = $item;
+                }
+            }
+        }
+
+        foreach ($chunk as $rec) {
+            $success = false;
+            $status = $laststatus;
+            if ($results !== null) {
+                $item = $byattempt[(int)$rec->attemptid] ?? null;
+                if ($item === null) {
+                    $status = 'resp:missing';
+                } else if (!empty($item['success'])) {
+                    $success = true;
+                    $status = 'ok';
+                } else {
+                    $status = 'resp:' . substr(json_encode($item, JSON_UNESCAPED_UNICODE), 0, 200);
+                    error_log("[EntranceTesting] API response for attempt {$rec->attemptid}: " . json_encode($item, JSON_UNESCAPED_UNICODE));
+                }
+            }
+
+            $update = new stdClass();
+            $update->id = $rec->id;
+            $update->attempts = $rec->attempts + 1;
+            $update->timesent = $success ? time() : 0;
+            $update->status = $status;
+            $DB->update_record('local_entrance_testing_queue', $update);
+            if ($success) {
+                $sent++;
+            }
+        }
+
+        if ($unavailable) {
+            // The service is down or timing out: leave the remaining chunks to the retry task
+            error_log("[EntranceTesting] batch API unavailable, remaining records are left for the retry task");
+            break;
+        }
+    }
+
+    // One retry task for whatever is still unsent (an already queued task is reused)
+    if ($DB->record_exists('local_entrance_testing_queue', ['timesent' => 0])) {
+        \core\task\manager::queue_adhoc_task(
+            new \local_entrance_testing\task\send_queue_records_adhoc(), true
+        );
+    }
+
+    return $sent;
+}
+
+
 /**
  * Check API health by sending a test request.
  * 
@@ -9,7 +9,7 @@
 
 defined('MOODLE_INTERNAL') || die();
 
-$plugin->version   = 2024102300; // YYYYMMDDHH (год, месяц, день, час)
+$plugin->version   = 2024102500; // YYYYMMDDHH (год, месяц, день, час)
 $plugin->requires  = 2022041900; // Требует Moodle 4.0 или выше
 $plugin->component = 'local_entrance_testing'; // Полное имя плагина
 $plugin->maturity  = MATURITY_STABLE;